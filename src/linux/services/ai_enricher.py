@@ -1,41 +1,370 @@
+import os
+import sys
 import threading
 import logging
+import random
+import sqlite3
+import time
 import requests
 import json
-from library_db import LibraryDatabase
+from collections import deque
+from requests.adapters import HTTPAdapter
+from library_db import LibraryDatabase, BUSY_TIMEOUT
+
+# Response cache is shared with the creator tools in src/software/ai_service
+AI_SERVICE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'software', 'ai_service')
+sys.path.append(AI_SERVICE_DIR)
+from response_cache import ResponseCache, CACHE_PATH, DEFAULT_MAX_MB
+
+# The cache settings (system.cache) come from the AI service's config
+AI_CONFIG_PATH = os.path.join(AI_SERVICE_DIR, 'config.json')
 
 # Placeholder for AI Service URL (e.g., Ollama running locally or external API)
 AI_API_URL = "http://localhost:11434/api/generate"
 AI_MODEL = "llama3" # or mistral, gemma, etc.
+AI_PROVIDER = "ollama"
+
+DEFAULT_WORKERS = 2
+# Concurrent requests allowed per provider. A local Ollama processes one
+# generation at a time, so extra parallel requests only queue inside it.
+PROVIDER_LIMITS = {"ollama": 1, "openai": 4, "google": 4}
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0   # Seconds before the first retry, doubled per attempt
+BACKOFF_MAX = 300.0
+IDLE_POLL = 5.0      # Upper bound on how long an idle worker sleeps
+
+# Batched enrichment: K titles per prompt. K grows while batches come back
+# well inside the latency target and halves when they are slow or fail.
+BATCH_MAX = 16
+BATCH_TARGET_LATENCY = 20.0  # Seconds per batch request
+CONTEXT_TOKENS = 2048        # Ollama's default num_ctx
+TOKENS_PER_ITEM = 200        # Rough prompt + answer cost of one title
+BATCH_HEADER_TOKENS = 150
+
+class BatchSizer:
+    """Additive-increase / multiplicative-decrease batch size, capped by context size"""
+    def __init__(self, max_batch=BATCH_MAX, target_latency=BATCH_TARGET_LATENCY):
+        context_cap = max(1, (CONTEXT_TOKENS - BATCH_HEADER_TOKENS) // TOKENS_PER_ITEM)
+        self.max_batch = max(1, min(max_batch, context_cap))
+        self.target_latency = target_latency
+        self.size = min(2, self.max_batch)
+        self.item_latency = None # EWMA seconds per item
+        self._lock = threading.Lock()
+
+    def record(self, batch_size, latency, failed_items=0):
+        with self._lock:
+            per_item = latency / max(batch_size, 1)
+            self.item_latency = per_item if self.item_latency is None else 0.7 * self.item_latency + 0.3 * per_item
+            if failed_items * 2 > batch_size or latency > self.target_latency:
+                self.size = max(1, self.size // 2)
+            elif latency < self.target_latency * 0.7 and batch_size >= self.size:
+                self.size = min(self.max_batch, self.size + 1)
+
+    def timeout(self, batch_size):
+        """Request timeout scaled with the batch (the single-item budget is 30 s)"""
+        if self.item_latency is None:
+            return 30 + 15 * (batch_size - 1)
+        return max(30, self.item_latency * batch_size * 3)
+
+class JobQueue:
+    """Persistent enrichment queue stored next to the library in SQLite"""
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS enrich_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            provider TEXT NOT NULL,
+            payload TEXT, -- JSON metadata for the prompt
+            status TEXT NOT NULL DEFAULT 'pending', -- pending, running, failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_run REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created REAL
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_enrich_jobs_due ON enrich_jobs(status, next_run)")
+        conn.commit()
+        conn.close()
+
+    def enqueue(self, item_id, metadata, provider):
+        conn = self._connect()
+        conn.execute("INSERT INTO enrich_jobs (item_id, provider, payload, created) VALUES (?, ?, ?, ?)",
+                     (item_id, provider, json.dumps(metadata, default=str), time.time()))
+        conn.commit()
+        conn.close()
+
+    def recover(self):
+        """Jobs left 'running' by a previous process never finished; run them again"""
+        conn = self._connect()
+        n = conn.execute("UPDATE enrich_jobs SET status = 'pending' WHERE status = 'running'").rowcount
+        conn.commit()
+        conn.close()
+        return n
+
+    def claim(self, limit=1):
+        """Atomically move up to limit due jobs to 'running' and return them"""
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front so two workers (or two
+            # processes) can never claim the same row.
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute('''SELECT * FROM enrich_jobs WHERE status = 'pending' AND next_run <= ?
+                ORDER BY next_run, id LIMIT ?''', (time.time(), limit)).fetchall()
+            if rows:
+                conn.executemany("UPDATE enrich_jobs SET status = 'running' WHERE id = ?", [(r['id'],) for r in rows])
+            conn.commit()
+        finally:
+            conn.close()
+        jobs = []
+        for r in rows:
+            job = dict(r)
+            job['metadata'] = json.loads(job.pop('payload') or '{}')
+            jobs.append(job)
+        return jobs
+
+    def next_due(self):
+        """Seconds until the next pending job is due (None if the queue is empty)"""
+        conn = self._connect()
+        row = conn.execute("SELECT MIN(next_run) FROM enrich_jobs WHERE status = 'pending'").fetchone()
+        conn.close()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def complete(self, job_id):
+        conn = self._connect()
+        conn.execute("DELETE FROM enrich_jobs WHERE id = ?", (job_id,))
+        conn.commit()
+        conn.close()
+
+    def retry(self, job_id, attempts, error, delay):
+        conn = self._connect()
+        conn.execute("UPDATE enrich_jobs SET status = 'pending', attempts = ?, last_error = ?, next_run = ? WHERE id = ?",
+                     (attempts, error, time.time() + delay, job_id))
+        conn.commit()
+        conn.close()
+
+    def fail(self, job_id, attempts, error):
+        conn = self._connect()
+        conn.execute("UPDATE enrich_jobs SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                     (attempts, error, job_id))
+        conn.commit()
+        conn.close()
+
+    def counts(self):
+        conn = self._connect()
+        rows = conn.execute("SELECT status, COUNT(*) FROM enrich_jobs GROUP BY status").fetchall()
+        conn.close()
+        counts = {'pending': 0, 'running': 0, 'failed': 0}
+        counts.update({r[0]: r[1] for r in rows})
+        return counts
+
+def load_cache_config(path=AI_CONFIG_PATH):
+    """The system.cache section of the AI service config ({} if unreadable)"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f).get('system', {}).get('cache', {})
+    except (OSError, ValueError):
+        return {}
 
 class AiEnricher:
-    def __init__(self, db: LibraryDatabase):
+    """
+    Background enrichment over the persistent job queue. Workers are not
+    started by the constructor: call start() (enrich_item_async does) to
+    process the queue, including jobs left over from a previous run.
+    """
+    def __init__(self, db: LibraryDatabase, workers=DEFAULT_WORKERS, provider=AI_PROVIDER, use_cache=True,
+                 max_batch=BATCH_MAX, config_path=AI_CONFIG_PATH):
         self.db = db
         self.logger = logging.getLogger("AiEnricher")
-        self.queue = []
-        self.running = False
+        self.provider = provider
+        self.num_workers = workers
+        self.jobs = JobQueue(db.db_path)
+        # use_cache=False skips lookups (forces re-enrichment) but still stores fresh answers
+        self.use_cache = use_cache
+        cache_config = load_cache_config(config_path)
+        self.cache = ResponseCache(
+            path=cache_config.get('path', CACHE_PATH),
+            max_mb=cache_config.get('max_mb', DEFAULT_MAX_MB),
+            enabled=cache_config.get('enabled', True)
+        )
+        # max_batch=1 turns batching off
+        self.batcher = BatchSizer(max_batch)
+
+        # One keep-alive connection pool shared by all workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.limits = {name: threading.BoundedSemaphore(n) for name, n in PROVIDER_LIMITS.items()}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._workers = []
+        self._done = 0
+        self._finished_at = deque(maxlen=50) # Completion times for the rate/ETA estimate
+
+        recovered = self.jobs.recover()
+        if recovered:
+            self.logger.info(f"Requeued {recovered} interrupted enrichment jobs")
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._workers)
+
+    def start(self):
+        with self._lock:
+            self._workers = [t for t in self._workers if t.is_alive()]
+            self._stop.clear()
+            for i in range(len(self._workers), self.num_workers):
+                t = threading.Thread(target=self._worker, name=f"AiEnricher-{i}", daemon=True)
+                t.start()
+                self._workers.append(t)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for t in self._workers:
+            t.join(timeout)
 
     def enrich_item_async(self, item_id, basic_metadata):
-        """Add item to queue for background processing"""
-        self.queue.append((item_id, basic_metadata))
-        if not self.running:
-            threading.Thread(target=self._process_queue).start()
-
-    def _process_queue(self):
-        self.running = True
-        while self.queue:
-            item_id, metadata = self.queue.pop(0)
-            try:
-                self._enrich_item(item_id, metadata)
-            except Exception as e:
-                self.logger.error(f"Error enriching item {item_id}: {e}")
-        self.running = False
-
-    def _enrich_item(self, item_id, metadata):
-        self.logger.info(f"Enriching item {item_id}: {metadata.get('title')}")
-        
-        # Construct Prompt
-        prompt = f"""
+        """Add item to the persistent queue for background processing"""
+        self.jobs.enqueue(item_id, basic_metadata, self.provider)
+        self.start()
+        with self._wake:
+            self._wake.notify()
+
+    def progress(self):
+        """Queue counts plus a throughput and ETA estimate from recent completions"""
+        counts = self.jobs.counts()
+        with self._lock:
+            done = self._done
+            times = list(self._finished_at)
+        rate = 0.0
+        if len(times) >= 2 and times[-1] > times[0]:
+            rate = (len(times) - 1) / (times[-1] - times[0])
+        remaining = counts['pending'] + counts['running']
+        return {
+            'done': done,
+            'pending': counts['pending'],
+            'running': counts['running'],
+            'failed': counts['failed'],
+            'rate': rate, # Jobs per second
+            'eta': remaining / rate if rate else None,
+        }
+
+    def _worker(self):
+        while not self._stop.is_set():
+            jobs = self.jobs.claim(self.batcher.size)
+            if not jobs:
+                delay = self.jobs.next_due()
+                with self._wake:
+                    self._wake.wait(IDLE_POLL if delay is None else min(delay, IDLE_POLL))
+                continue
+            if len(jobs) == 1:
+                self._run_job(jobs[0])
+            else:
+                self._run_batch(jobs)
+
+    def _run_job(self, job):
+        try:
+            with self.limits.setdefault(job['provider'], threading.BoundedSemaphore(1)):
+                self._enrich_item(job['item_id'], job['metadata'], job['provider'])
+        except Exception as e:
+            attempts = job['attempts'] + 1
+            if attempts >= MAX_ATTEMPTS:
+                self.logger.error(f"Giving up on item {job['item_id']} after {attempts} attempts: {e}")
+                self.jobs.fail(job['id'], attempts, str(e))
+            else:
+                # Exponential backoff with jitter so a restarted model isn't hit by every worker at once
+                delay = min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX) * random.uniform(0.8, 1.2)
+                self.logger.warning(f"Error enriching item {job['item_id']} (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+                self.jobs.retry(job['id'], attempts, str(e), delay)
+            return
+        self._job_done(job)
+
+    def _job_done(self, job):
+        self.jobs.complete(job['id'])
+        with self._lock:
+            self._done += 1
+            self._finished_at.append(time.monotonic())
+            done = self._done
+        if done % 25 == 0:
+            p = self.progress()
+            eta = f"{p['eta'] / 60:.1f} min" if p['eta'] is not None else "unknown"
+            self.logger.info(f"Enrichment progress: {done} done, {p['pending']} pending, "
+                             f"{p['rate']:.2f} items/s, ETA {eta}")
+
+    def _run_batch(self, jobs):
+        """
+        Enrich several items with one prompt per provider, each under that
+        provider's concurrency limit. Items whose part of the answer is
+        missing or malformed fall back to the single-item path.
+        """
+        groups = {}
+        for job in jobs:
+            groups.setdefault(job['provider'], []).append(job)
+        for provider, group in groups.items():
+            self._run_provider_batch(provider, group)
+
+    def _run_provider_batch(self, provider, jobs):
+        pending = []
+        for job in jobs:
+            prompt = self._build_prompt(job['metadata'])
+            cached = self.cache.get(provider, AI_MODEL, prompt) if self.use_cache else None
+            if cached is not None:
+                self.db.update_ai_metadata(job['item_id'], json.loads(cached))
+                self._job_done(job)
+            else:
+                pending.append((job, prompt))
+        if len(pending) < 2:
+            for job, _ in pending:
+                self._run_job(job)
+            return
+
+        batch_prompt = self._build_batch_prompt([job['metadata'] for job, _ in pending])
+        start = time.monotonic()
+        try:
+            with self.limits.setdefault(provider, threading.BoundedSemaphore(1)):
+                text = self._request(batch_prompt, self.batcher.timeout(len(pending)))
+            results = self._split_batch(text, len(pending))
+        except Exception as e:
+            self.logger.warning(f"Batch of {len(pending)} failed, falling back to single prompts: {e}")
+            self.batcher.record(len(pending), time.monotonic() - start, failed_items=len(pending))
+            for job, _ in pending:
+                self._run_job(job)
+            return
+
+        failed = []
+        for (job, prompt), ai_content in zip(pending, results):
+            if ai_content is None:
+                failed.append(job)
+                continue
+            # Stored under the single-item prompt so a later re-ingest hits the cache
+            self.cache.put(provider, AI_MODEL, prompt, None, json.dumps(ai_content))
+            self.db.update_ai_metadata(job['item_id'], ai_content)
+            self._job_done(job)
+
+        latency = time.monotonic() - start
+        self.batcher.record(len(pending), latency, failed_items=len(failed))
+        self.logger.info(f"Batch of {len(pending)} enriched in {latency:.1f}s "
+                         f"({len(failed)} retried singly, next batch size {self.batcher.size})")
+        for job in failed:
+            self._run_job(job)
+
+    def _build_prompt(self, metadata):
+        return f"""
 You are an expert retro gaming historian.
 Generate a concise description and metadata for this Commodore 64/128 software.
 
@@ -49,27 +378,86 @@ Output ONLY a JSON object with these keys:
 - tags: An array of 3-5 keywords.
 - description: A longer historical overview (optional).
 """
-        
-        # Call AI API
-        try:
-            payload = {
-                "model": AI_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "format": "json" 
-            }
-            response = requests.post(AI_API_URL, json=payload, timeout=30)
-            if response.status_code == 200:
-                result = response.json()
-                # Parse the 'response' field which contains the actual text/json from LLM
-                ai_content = json.loads(result.get('response', '{}'))
-                
-                # Update DB
-                self.db.update_ai_metadata(item_id, ai_content)
-                self.logger.info(f"Enrichment complete for {item_id}")
+
+    def _build_batch_prompt(self, metadata_list):
+        titles = [{
+            "id": n,
+            "title": m.get('title'),
+            "year": m.get('year', 'Unknown'),
+            "publisher": m.get('publisher', 'Unknown'),
+        } for n, m in enumerate(metadata_list)]
+        return f"""
+You are an expert retro gaming historian.
+Generate a concise description and metadata for each of these Commodore 64/128 titles:
+
+{json.dumps(titles, default=str)}
+
+Output ONLY a JSON object {{"items": [...]}} with one entry per title, in the same order.
+Each entry has these keys:
+- id: The id from the input.
+- summary: A 2-3 sentence description.
+- genre: The specific genre (e.g. Platformer, Shoot 'em up).
+- tags: An array of 3-5 keywords.
+- description: A longer historical overview (optional).
+"""
+
+    def _split_batch(self, text, count):
+        """Map a batch answer back to its inputs. Entries that fail validation come back as None."""
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get('items', [])
+        if not isinstance(data, list):
+            raise ValueError("Batch answer is not a list")
+
+        results = [None] * count
+        unmatched = []
+        for entry in data:
+            if not isinstance(entry, dict) or not isinstance(entry.get('summary'), str) or not entry['summary'].strip():
+                continue
+            n = entry.pop('id', None)
+            if isinstance(n, int) and 0 <= n < count and results[n] is None:
+                results[n] = entry
             else:
-                self.logger.error(f"AI API Error: {response.status_code}")
-                
-        except Exception as e:
-            self.logger.error(f"AI Request Failed: {e}")
+                unmatched.append(entry)
+        # Models sometimes drop or renumber ids; only trust position when the counts line up
+        if unmatched and len(data) == count:
+            for n in range(count):
+                if results[n] is None and unmatched:
+                    results[n] = unmatched.pop(0)
+        return results
+
+    def _request(self, prompt, timeout=30):
+        """Send one prompt to the model and return the raw response text"""
+        payload = {
+            "model": AI_MODEL,
+            "prompt": prompt,
+            "stream": False,
+            "format": "json"
+        }
+        response = self.session.post(AI_API_URL, json=payload, timeout=timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"AI API Error: {response.status_code}")
+        result = response.json()
+        # Parse the 'response' field which contains the actual text/json from LLM
+        return result.get('response', '{}')
+
+    def _enrich_item(self, item_id, metadata, provider):
+        """Enrich one item. Raises on any failure so the job is retried."""
+        self.logger.info(f"Enriching item {item_id}: {metadata.get('title')}")
+
+        # Construct Prompt
+        prompt = self._build_prompt(metadata)
+
+        # Re-ingesting a known title is answered from the response cache
+        cached = self.cache.get(provider, AI_MODEL, prompt) if self.use_cache else None
+        if cached is not None:
+            ai_content = json.loads(cached)
+        else:
+            # Call AI API
+            text = self._request(prompt)
+            ai_content = json.loads(text)
+            self.cache.put(provider, AI_MODEL, prompt, None, text)
 
+        # Update DB
+        self.db.update_ai_metadata(item_id, ai_content)
+        self.logger.info(f"Enrichment complete for {item_id}")
@@ -0,0 +1,935 @@
+import argparse
+import functools
+import http.server
+import os
+import random
+import re
+import socket
+import tempfile
+import sys
+import threading
+import time
+from collections import deque
+
+import zimodem_bridge as zimodem
+from zimodem_bridge import ZiModemBridge, NET_HIGH_WATER
+from telnet import TelnetProtocol, IAC, DONT, WILL
+from session_capture import read_capture, TO_C64, FROM_C64, FLAG_TELNET
+
+# Loopback harness for ZiModemBridge: the FPGA is replaced by a simulated
+# FIFO pair and the remote end by a local TCP server, so bridge throughput,
+# keystroke echo latency and idle CPU can be measured on any Linux machine.
+#
+#   python bridge_harness.py            # polling FIFOs
+#   python bridge_harness.py --irq      # simulated FIFO interrupt fd
+#   python bridge_harness.py --no-coalesce   # one socket write per FIFO burst
+#   python bridge_harness.py --callers 40    # inbound caller queue load test
+#   python bridge_harness.py --get           # AT&GET of a 50 KB program over HTTP
+#   python bridge_harness.py --telnet        # 1 MB binary transfers, raw vs telnet
+#   python bridge_harness.py --record DIR    # record a sample session (zimodem.capture_dir does this live)
+#   python bridge_harness.py --replay FILE --speed 10   # replay a capture, report throughput and latency
+#   python bridge_harness.py --pacing        # baud pacing accuracy and backpressure from a slow C64
+#
+# Scenarios run the bridge unpaced (zimodem.baud = 0) unless they say otherwise.
+
+FIFO_DEPTH = 512
+MODEM_RATE = 5760   # Bytes/s at 57600 baud (8N1)
+ECHO_WINDOW = 0.5   # Replay: remote data this soon after C64 input is its echo/reply
+REPLAY_WAIT = 10.0  # Replay: longest wait for the other side's data before going on anyway
+HANGUP_OK_WITHIN = 1.0 # +++ ATH: seconds the OK may take with a dropped session's data queued
+
+class LoopbackFpga:
+    """
+    Stands in for FpgaInterface's UART FIFOs. The bridge uses the same
+    read_tx_burst/write_rx_burst calls as on hardware; the harness plays
+    the C64 with type() and receive().
+    """
+    def __init__(self, depth=FIFO_DEPTH, irq=False):
+        self.depth = depth
+        self.tx = deque()   # C64 -> host
+        self.rx = deque()   # host -> C64
+        self.cond = threading.Condition()
+        self.irq = irq
+        self._irq_r = self._irq_w = None
+        self.rx_full_stalls = 0
+        self.ram = bytearray(0x10000)     # C64 RAM
+        self.reu = bytearray(512 * 1024)  # REU memory (heavy bridge window)
+        self.reu_regs = bytearray(16)
+
+    # FpgaInterface API, as used by the bridge
+    def read_tx_burst(self, max_bytes=256):
+        with self.cond:
+            count = min(max_bytes, len(self.tx))
+            data = bytes(self.tx.popleft() for _ in range(count))
+            if count:
+                self.cond.notify_all()
+            return data
+
+    def write_rx_burst(self, data):
+        with self.cond:
+            count = min(len(data), self.depth - len(self.rx))
+            if count < len(data):
+                self.rx_full_stalls += 1
+            self.rx.extend(data[:count])
+            if count:
+                self.cond.notify_all()
+            return count
+
+    def open_fifo_irq(self, device):
+        if not self.irq:
+            return None
+        self._irq_r, self._irq_w = os.pipe()
+        os.set_blocking(self._irq_r, False)
+        return self._irq_r
+
+    def ack_fifo_irq(self, fd):
+        try:
+            os.read(fd, 64)
+        except BlockingIOError:
+            pass
+
+    def write_block(self, address, data):
+        self.reu[address:address + len(data)] = data
+
+    def read_block(self, address, length):
+        return bytes(self.reu[address:address + length])
+
+    def poke(self, address, value):
+        """Debug bridge write; only the REU registers at $DF00 are modelled"""
+        if 0xDF00 <= address <= 0xDF0A:
+            reg = address - 0xDF00
+            self.reu_regs[reg] = value
+            if reg == 1 and value & 0x80 and value & 0x03 in (0, 1): # Execute C64 -> REU / REU -> C64
+                r = self.reu_regs
+                c64, reu = r[2] | (r[3] << 8), r[4] | (r[5] << 8) | (r[6] << 16)
+                length = (r[7] | (r[8] << 8)) or 0x10000
+                if value & 0x03:
+                    self.ram[c64:c64 + length] = self.reu[reu:reu + length]
+                else:
+                    self.reu[reu:reu + length] = self.ram[c64:c64 + length]
+                r[0] |= 0x40 # End of block
+
+    def peek(self, address):
+        if address == 0xDF00:
+            status, self.reu_regs[0] = self.reu_regs[0], 0 # Reading clears the status
+            return status
+        if 0xDF01 <= address <= 0xDF0A:
+            return self.reu_regs[address - 0xDF00]
+        return 0
+
+    def close(self):
+        for fd in (self._irq_r, self._irq_w):
+            if fd is not None:
+                os.close(fd)
+
+    # C64 side
+    def type(self, data):
+        """Push bytes into the TX FIFO, waiting while it is full"""
+        for i in range(0, len(data), self.depth):
+            part = data[i:i + self.depth]
+            with self.cond:
+                self.cond.wait_for(lambda: self.depth - len(self.tx) >= len(part))
+                self.tx.extend(part)
+            if self._irq_w is not None:
+                os.write(self._irq_w, b'\1')
+
+    def type_paced(self, data, rate, chunk=8):
+        """Type at `rate` bytes/s, as a terminal program sending a file at the modem's speed"""
+        start = time.perf_counter()
+        for i in range(0, len(data), chunk):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.type(data[i:i + chunk])
+
+    def receive(self, max_bytes=None, timeout=5.0):
+        """Pop what the bridge sent, waiting up to timeout for the first byte"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.rx, timeout):
+                return b""
+            count = len(self.rx) if max_bytes is None else min(max_bytes, len(self.rx))
+            data = bytes(self.rx.popleft() for _ in range(count))
+            self.cond.notify_all()
+            return data
+
+    def expect(self, text, timeout=5.0):
+        """Receive until text shows up; returns everything received"""
+        data = b""
+        deadline = time.monotonic() + timeout
+        while text not in data:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Expected {text!r}, got {data[-80:]!r}")
+            data += self.receive(timeout=remaining)
+        return data
+
+class RemoteHost:
+    """
+    Local TCP server playing the remote BBS: echoes, discards or streams data.
+    payload is the byte count to expect (sink) or to send (stream; or the
+    bytes themselves). With telnet=True it negotiates like a telnet server
+    and keeps the decoded bytes it receives in `data`.
+    """
+    def __init__(self, mode='echo', payload=0, telnet=False):
+        self.mode = mode
+        self.payload = payload
+        self.telnet = telnet
+        self.received = 0
+        self.segments = 0
+        self.data = bytearray()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.done = threading.Event()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.server.accept()
+        telnet = TelnetProtocol(server=True) if self.telnet else None
+        with conn:
+            if telnet:
+                telnet.offer()
+                conn.sendall(telnet.take_replies())
+            if self.mode == 'stream':
+                payload = self.payload if isinstance(self.payload, bytes) else b"x" * self.payload
+                if telnet:
+                    # Stream once BINARY is agreed both ways, so no CR NUL translation applies
+                    while not (telnet.binary_in and telnet.binary_out):
+                        telnet.decode(conn.recv(4096))
+                        conn.sendall(telnet.take_replies())
+                    payload = telnet.encode(payload)
+                conn.sendall(payload)
+                self.done.wait()
+                return
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                if telnet:
+                    data = telnet.decode(data)
+                    conn.sendall(telnet.take_replies())
+                    self.data += data
+                self.received += len(data)
+                self.segments += 1
+                if self.mode == 'echo':
+                    conn.sendall(data)
+                if self.payload and self.received >= self.payload:
+                    self.done.set()
+
+    def close(self):
+        self.done.set()
+        self.server.close()
+
+class FakeBbs(threading.Thread):
+    """Plays BBS software on the C64: greets every caller after CONNECT"""
+    def __init__(self, fpga):
+        super().__init__(daemon=True)
+        self.fpga = fpga
+        self.stopped = threading.Event()
+        self.answered = 0
+
+    def run(self):
+        seen = b""
+        while not self.stopped.is_set():
+            seen = (seen + self.fpga.receive(timeout=0.1))[-256:]
+            while b"CONNECT 57600" in seen:
+                seen = seen.split(b"CONNECT 57600", 1)[1]
+                self.answered += 1
+                self.fpga.type(b"WELCOME\r")
+
+def place_call(port, session, results):
+    """One inbound caller: wait for the BBS greeting, stay `session` seconds, hang up"""
+    start = time.monotonic()
+    sock = socket.create_connection(('127.0.0.1', port))
+    data = b""
+    while b"WELCOME" not in data:
+        chunk = sock.recv(1024)
+        if not chunk:
+            break
+        data += chunk
+    welcome = time.monotonic()
+    time.sleep(session)
+    sock.close()
+    results.append({'start': start, 'welcome': welcome, 'closed': time.monotonic(),
+                    'served': b"WELCOME" in data, 'updates': len(re.findall(rb"IN LINE", data))})
+
+def callers(count=40, session=0.05):
+    """`count` callers dial in at once; the C64 answers them one after another"""
+    fpga = LoopbackFpga()
+    bridge, thread = start_bridge(fpga, {'enabled': True, 'port': 0, 'auto_answer': 1,
+                                         'max_callers': count + 1})
+    bbs = FakeBbs(fpga)
+    bbs.start()
+    results = []
+    threads = [threading.Thread(target=place_call, args=(bridge.listen_port, session, results))
+               for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(60)
+    bbs.stopped.set()
+    bridge.stop()
+    thread.join()
+    bridge.server_sock.close()
+    results.sort(key=lambda r: r['welcome'])
+    handoffs = [b['welcome'] - a['closed'] for a, b in zip(results, results[1:])]
+    return results, handoffs
+
+def get_program(size=50 * 1024, load_address=0x0801):
+    """AT&GET a PRG from a local HTTP server; returns (seconds, modem reply, data arrived intact)"""
+    program = bytes((i * 7) & 0xFF for i in range(size))
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'game.prg'), 'wb') as f:
+            f.write(bytes([load_address & 0xFF, load_address >> 8]) + program)
+        handler = functools.partial(QuietHandler, directory=directory)
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        fpga = LoopbackFpga()
+        bridge, thread = start_bridge(fpga)
+        start = time.perf_counter()
+        fpga.type(f"AT&GET http://127.0.0.1:{server.server_port}/game.prg\r".encode())
+        reply = fpga.expect(b"OK\r\n", timeout=10)
+        elapsed = time.perf_counter() - start
+        bridge.stop()
+        thread.join()
+        server.shutdown()
+    intact = fpga.ram[load_address:load_address + size] == program
+    return elapsed, reply.decode('ascii', errors='replace').split('\n')[-3].strip(), intact
+
+def get_guards():
+    """AT&GET refusals and a slow source; returns [(check, ok)]"""
+    checks = []
+    with tempfile.TemporaryDirectory() as directory:
+        downloads = os.path.join(directory, 'downloads')
+        os.makedirs(downloads)
+        with open(os.path.join(downloads, 'data.bin'), 'wb') as f:
+            f.write(bytes(range(256)))
+        with open(os.path.join(directory, 'secret.bin'), 'wb') as f:
+            f.write(b"SECRET")
+        fpga = LoopbackFpga()
+        bridge, thread = start_bridge(fpga, {'download_dir': downloads})
+
+        def get(args, timeout=5.0):
+            fpga.type(f"AT&GET {args}\r".encode())
+            return _reply(fpga, timeout)
+
+        checks.append(("AT&GET inside download_dir", b"LOADED 256 BYTES" in get("data.bin,R:1000")
+                       and fpga.reu[0x1000:0x1100] == bytes(range(256))))
+        for source in ("../secret.bin", os.path.join(directory, 'secret.bin'), "~/secret.bin"):
+            checks.append((f"AT&GET {source[:20]} refused", get(f"{source},R:2000").endswith(b"ERROR\r\n")
+                           and b"SECRET" not in fpga.reu))
+        checks.append(("AT&GET past the end of the REU refused",
+                       get(f"data.bin,R:{len(fpga.reu) - 128:X}").endswith(b"ERROR\r\n")))
+
+        # A tcp:// source that trickles: the loop keeps answering, the byte limit ends it
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        stop = threading.Event()
+        def trickle():
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    while not stop.is_set():
+                        conn.sendall(bytes(4096))
+                        time.sleep(0.01)
+                except OSError:
+                    pass
+        threading.Thread(target=trickle, daemon=True).start()
+        zimodem.GET_MAX_BYTES, limit = 64 * 1024, zimodem.GET_MAX_BYTES
+        try:
+            fpga.type(f"AT&GET tcp://127.0.0.1:{server.getsockname()[1]},R:0\r".encode())
+            fpga.expect(b"\r\n")
+            time.sleep(0.05)
+            start = time.perf_counter()
+            fpga.type(b"AT\r")
+            fpga.expect(b"AT\r\nOK\r\n")
+            answered = time.perf_counter() - start
+            checks.append((f"AT answered during a slow AT&GET ({answered * 1000:.1f} ms)", answered < 0.5))
+            checks.append(("tcp:// stream over the byte limit refused", _reply(fpga, 10).endswith(b"ERROR\r\n")))
+        finally:
+            zimodem.GET_MAX_BYTES = limit
+            stop.set()
+            server.close()
+        bridge.stop()
+        thread.join()
+    return checks
+
+def _reply(fpga, timeout):
+    """Receive until a final result code (OK or ERROR)"""
+    data = b""
+    deadline = time.monotonic() + timeout
+    while not data.endswith((b"OK\r\n", b"ERROR\r\n")):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"No result code, got {data[-80:]!r}")
+        data += fpga.receive(timeout=remaining)
+    return data
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def start_bridge(fpga, options=None):
+    config = {'zimodem': dict({'enabled': False, 'baud': 0}, **(options or {}))}
+    bridge = ZiModemBridge(fpga=fpga, config=config)
+    thread = threading.Thread(target=bridge.run, daemon=True)
+    thread.start()
+    return bridge, thread
+
+def dial(fpga, port):
+    """Dial the remote host; returns any data that arrived right after CONNECT"""
+    fpga.type(f"ATDT 127.0.0.1:{port}\r".encode())
+    data = fpga.expect(b"CONNECT ")
+    while not re.search(rb"CONNECT \d+\r\n", data):
+        data += fpga.expect(b"\r\n")
+    return data.split(b"CONNECT ", 1)[1].split(b"\r\n", 1)[1]
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def echo_latency(irq=False, keystrokes=100, options=None):
+    fpga = LoopbackFpga(irq=irq)
+    remote = RemoteHost('echo')
+    bridge, thread = start_bridge(fpga, options)
+    dial(fpga, remote.port)
+    samples = []
+    for i in range(keystrokes):
+        key = bytes([0x41 + i % 26])
+        start = time.perf_counter()
+        fpga.type(key)
+        fpga.expect(key)
+        samples.append(time.perf_counter() - start)
+        time.sleep(0.025) # Typing speed: keys further apart than the coalescing delay
+    bridge.stop()
+    thread.join()
+    remote.close()
+    return samples
+
+def download(irq=False, size=1 << 20):
+    """Remote streams `size` bytes, the C64 side drains the RX FIFO as fast as it can"""
+    fpga = LoopbackFpga(irq=irq)
+    remote = RemoteHost('stream', size)
+    bridge, thread = start_bridge(fpga)
+    start = time.perf_counter()
+    received = len(dial(fpga, remote.port))
+    while received < size:
+        data = fpga.receive()
+        if not data:
+            break
+        received += len(data)
+    elapsed = time.perf_counter() - start
+    bridge.stop()
+    thread.join()
+    remote.close()
+    return received, elapsed
+
+def upload(irq=False, size=256 * 1024, rate=None, options=None):
+    """
+    The C64 side types `size` bytes, at `rate` bytes/s or as fast as the TX
+    FIFO accepts them. Returns (bytes received, socket writes, seconds).
+    """
+    fpga = LoopbackFpga(irq=irq)
+    remote = RemoteHost('sink', size)
+    bridge, thread = start_bridge(fpga, options)
+    dial(fpga, remote.port)
+    outbound = bridge.outbound
+    payload = bytes(i % 255 + 1 for i in range(size)).replace(b'+', b'-')
+    start = time.perf_counter()
+    if rate:
+        fpga.type_paced(payload, rate)
+    else:
+        fpga.type(payload)
+    remote.done.wait(30)
+    elapsed = time.perf_counter() - start
+    bridge.stop()
+    thread.join()
+    remote.close()
+    return remote.received, outbound.writes, elapsed
+
+def binary_transfer(telnet, size=1 << 20):
+    """
+    Random binary data (every byte value, $FF included) both ways with the
+    bridge in raw or telnet mode. Returns ((download intact, bytes/s), (upload intact, bytes/s)).
+    """
+    payload = random.Random(64).randbytes(size)
+    options = {'telnet': 'on' if telnet else 'off'}
+
+    fpga = LoopbackFpga()
+    remote = RemoteHost('stream', payload, telnet)
+    bridge, thread = start_bridge(fpga, options)
+    start = time.perf_counter()
+    received = bytearray(dial(fpga, remote.port))
+    while len(received) < size:
+        data = fpga.receive()
+        if not data:
+            break
+        received += data
+    down = (received == payload, len(received) / (time.perf_counter() - start))
+    bridge.stop()
+    thread.join()
+    remote.close()
+
+    fpga = LoopbackFpga()
+    remote = RemoteHost('sink', size, telnet)
+    bridge, thread = start_bridge(fpga, options)
+    dial(fpga, remote.port)
+    deadline = time.monotonic() + 5
+    while telnet and not (bridge.telnet.binary_in and bridge.telnet.binary_out) and time.monotonic() < deadline:
+        time.sleep(0.001)
+    upload_data = payload.replace(b'+', b'-') # "+++" would escape to command mode
+    start = time.perf_counter()
+    fpga.type(upload_data)
+    remote.done.wait(30)
+    elapsed = time.perf_counter() - start
+    intact = remote.data == upload_data if telnet else remote.received == size
+    up = (intact, remote.received / elapsed)
+    bridge.stop()
+    thread.join()
+    remote.close()
+    return down, up
+
+class Replay:
+    """
+    Drives the bridge with a recorded session (session_capture): a local
+    server plays the remote end, the LoopbackFpga plays the C64. Each side
+    sends a record no earlier than its recorded time divided by speed, and
+    only once the data that preceded it in the recording has arrived, so the
+    session stays causal at any speed. Remote data that followed C64 input
+    within ECHO_WINDOW is a reply: it goes out as soon as the input arrives,
+    and the time until it reaches the C64 is the echo latency.
+
+    drain_rate limits how fast the C64 empties the RX FIFO (bytes/s, 0 = at once).
+    """
+    def __init__(self, path, speed=1.0, drain_rate=0):
+        self.flags, records = read_capture(path)
+        self.speed = speed
+        self.drain_rate = drain_rate
+        self.remote_steps = []   # (due, data, C64 bytes to wait for, C64 step answered or None, display offset)
+        self.c64_steps = []      # (due, data, display bytes to wait for)
+        self.recorded = records[-1][0] if records else 0.0
+        # Bytes the C64 will see, as the bridge decodes them (telnet commands removed)
+        decoder = TelnetProtocol() if self.flags & FLAG_TELNET else None
+        detect = decoder is None
+        typed = shown = 0
+        previous = None
+        for t, direction, data in records:
+            due = t / speed
+            if direction == TO_C64:
+                if detect and len(data) > 1 and data[0] == IAC and DONT <= data[1] <= WILL:
+                    decoder = TelnetProtocol()
+                detect = False
+                answers = None
+                if previous is not None and previous[1] == FROM_C64 and t - previous[0] <= ECHO_WINDOW:
+                    answers = len(self.c64_steps) - 1
+                length = len(decoder.decode(data)) if decoder else len(data)
+                self.remote_steps.append((due, data, typed, answers if length else None, shown))
+                shown += length
+            else:
+                self.c64_steps.append((due, data, shown))
+                typed += len(data)
+            previous = (t, direction)
+        self.total_shown = shown
+        self.total_typed = typed
+
+        self.cond = threading.Condition()
+        self.connected = threading.Event()
+        self.finished = False
+        self.start = 0.0
+        self.shown = 0
+        self.remote_received = 0
+        self.typed_at = [None] * len(self.c64_steps)
+        self.arrived = {}        # Remote step -> time its first byte reached the C64
+        self.last_byte = 0.0
+        self.waits = 0           # Times a side gave up waiting for the other (REPLAY_WAIT)
+
+    def _wait(self, predicate):
+        with self.cond:
+            if not self.cond.wait_for(lambda: predicate() or self.finished, REPLAY_WAIT):
+                self.waits += 1
+
+    def _pace(self, due):
+        delay = self.start + due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _remote(self, server):
+        conn, _ = server.accept()
+        threading.Thread(target=self._remote_reader, args=(conn,), daemon=True).start()
+        self.connected.wait()
+        for due, data, typed, answers, _ in self.remote_steps:
+            self._wait(lambda: self.remote_received >= typed)
+            if answers is None:
+                self._pace(due)
+            conn.sendall(data)
+        self._wait(lambda: self.shown >= self.total_shown)
+        conn.close()
+
+    def _remote_reader(self, conn):
+        while True:
+            try:
+                data = conn.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            with self.cond:
+                self.remote_received += len(data)
+                self.cond.notify_all()
+
+    def _typist(self):
+        self.connected.wait()
+        for i, (due, data, shown) in enumerate(self.c64_steps):
+            self._wait(lambda: self.shown >= shown)
+            self._pace(due)
+            self.typed_at[i] = time.perf_counter()
+            self.fpga.type(data)
+
+    def _drain(self):
+        targets = deque((step[4], n) for n, step in enumerate(self.remote_steps) if step[3] is not None)
+        while not self.finished:
+            data = self.fpga.receive(64 if self.drain_rate else None, timeout=0.1)
+            if not data:
+                continue
+            now = time.perf_counter()
+            with self.cond:
+                self.shown += len(data)
+                self.last_byte = now
+                self.cond.notify_all()
+            while targets and targets[0][0] < self.shown:
+                self.arrived[targets.popleft()[1]] = now
+            if self.drain_rate:
+                self._pace(self.shown / self.drain_rate)
+
+    def run(self):
+        self.fpga = LoopbackFpga()
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        remote = threading.Thread(target=self._remote, args=(server,), daemon=True)
+        remote.start()
+        telnet = 'on' if self.flags & FLAG_TELNET else 'auto'
+        bridge, thread = start_bridge(self.fpga, {'telnet': telnet})
+        first = dial(self.fpga, server.getsockname()[1])
+        self.start = time.perf_counter()
+        self.shown = len(first)
+        self.connected.set()
+        workers = [threading.Thread(target=self._typist, daemon=True),
+                   threading.Thread(target=self._drain, daemon=True)]
+        for worker in workers:
+            worker.start()
+        workers[0].join()
+        remote.join()
+        self.finished = True
+        workers[1].join()
+        bridge.stop()
+        thread.join()
+        server.close()
+
+        elapsed = max(self.last_byte, max(filter(None, self.typed_at), default=0.0)) - self.start
+        latencies = [self.arrived[n] - self.typed_at[step[3]] for n, step in enumerate(self.remote_steps)
+                     if n in self.arrived and self.typed_at[step[3]] is not None]
+        return {
+            'recorded': self.recorded, 'elapsed': elapsed,
+            'to_c64': self.shown, 'from_c64': self.remote_received,
+            'to_c64_rate': self.shown / elapsed if elapsed > 0 else 0.0,
+            'from_c64_rate': self.remote_received / elapsed if elapsed > 0 else 0.0,
+            'echo': latencies, 'fifo_full_stalls': self.fpga.rx_full_stalls, 'waits': self.waits,
+        }
+
+def pacing(baud=57600, size=32 * 1024, drain_rate=0):
+    """
+    Remote streams `size` bytes to a bridge paced at `baud`; the C64 empties
+    the RX FIFO at drain_rate bytes/s (0 = as fast as it can). Returns
+    (bytes received intact, bytes/s, largest FIFO fill seen, FIFO-full stalls).
+    """
+    fpga = LoopbackFpga()
+    payload = bytes(i % 251 for i in range(size))
+    remote = RemoteHost('stream', payload)
+    bridge, thread = start_bridge(fpga, {'baud': baud})
+    received = bytearray(dial(fpga, remote.port))
+    start = time.perf_counter()
+    peak = 0
+    while len(received) < size:
+        with fpga.cond:
+            peak = max(peak, len(fpga.rx))
+        data = fpga.receive(64 if drain_rate else None)
+        if not data:
+            break
+        received += data
+        if drain_rate:
+            delay = start + len(received) / drain_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    elapsed = time.perf_counter() - start
+    bridge.stop()
+    thread.join()
+    remote.close()
+    return received == payload, len(received) / elapsed, peak, fpga.rx_full_stalls
+
+def hangup_while_paced(baud=2400, size=16 * 1024):
+    """
+    The remote sends `size` bytes to a bridge paced at `baud` (minutes of
+    line time); the C64 escapes with +++ and types ATH straight away.
+    Returns (seconds until the remote sees the hang-up, seconds until the
+    C64 gets ATH's OK or None, bytes still queued for the C64 after it).
+    """
+    fpga = LoopbackFpga()
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    bridge, thread = start_bridge(fpga, {'baud': baud})
+    fpga.type(f"ATDT 127.0.0.1:{server.getsockname()[1]}\r".encode())
+    conn, _ = server.accept()
+    conn.sendall(bytes(size))
+    fpga.expect(b"CONNECT ")
+    time.sleep(0.2) # Let the bridge queue the data
+    start = time.perf_counter()
+    fpga.type(b"+++")
+    time.sleep(0.05)
+    fpga.type(b"ATH\r")
+    conn.settimeout(120)
+    while conn.recv(4096):
+        pass
+    elapsed = time.perf_counter() - start
+    try:
+        fpga.expect(b"ATH\r\nOK\r\n", timeout=HANGUP_OK_WITHIN)
+        answered = time.perf_counter() - start
+    except TimeoutError:
+        answered = None
+    queued = len(bridge.rx_pending) + sum(len(data) for data in bridge.posted)
+    bridge.stop()
+    thread.join()
+    conn.close()
+    server.close()
+    return elapsed, answered, queued
+
+def stalled_peer(timeout=10.0):
+    """
+    The remote accepts the call and never reads while the C64 keeps sending.
+    An inbound caller dials meanwhile. Returns (seconds until the caller is
+    told the line is busy, bytes the bridge holds for the remote, bytes the
+    C64 got into the TX FIFO).
+    """
+    fpga = LoopbackFpga()
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    bridge, thread = start_bridge(fpga, {'enabled': True, 'port': 0, 'auto_answer': 0})
+    fpga.type(f"ATDT 127.0.0.1:{server.getsockname()[1]}\r".encode())
+    conn, _ = server.accept()
+    fpga.expect(b"CONNECT ")
+    stop = threading.Event()
+    typed = [0]
+    def typist():
+        # Fill the TX FIFO whenever it has room, without blocking on it
+        while not stop.is_set():
+            with fpga.cond:
+                fpga.cond.wait_for(lambda: len(fpga.tx) < fpga.depth or stop.is_set(), 0.05)
+                room = fpga.depth - len(fpga.tx)
+                fpga.tx.extend(bytes(room))
+            typed[0] += room
+    threading.Thread(target=typist, daemon=True).start()
+    # Kernel buffers fill, the bridge queues and then stops taking C64 output
+    deadline = time.monotonic() + timeout
+    while len(bridge.net_out) < NET_HIGH_WATER and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    start = time.perf_counter()
+    caller = socket.create_connection(('127.0.0.1', bridge.listen_port))
+    caller.settimeout(5)
+    data = b""
+    while b"IN LINE" not in data:
+        chunk = caller.recv(1024)
+        if not chunk:
+            break
+        data += chunk
+    elapsed = time.perf_counter() - start
+    queued = len(bridge.net_out)
+    stop.set()
+    bridge.stop()
+    thread.join()
+    caller.close()
+    conn.close()
+    server.close()
+    bridge.server_sock.close()
+    return (elapsed if b"IN LINE" in data else None), queued, typed[0]
+
+class SlowModel:
+    """Stands in for AIService: streams a canned answer a chunk every `delay` seconds"""
+    def __init__(self, chunks=20, delay=0.05):
+        self.chunks = chunks
+        self.delay = delay
+        self.prompts = []
+
+    def stream_completion(self, prompt):
+        self.prompts.append(prompt)
+        for i in range(self.chunks):
+            time.sleep(self.delay)
+            yield f"WORD{i} "
+
+def ai_answer():
+    """
+    AT&AI against a slow model; the C64 types AT while the answer streams.
+    Returns (prompt the model got, seconds until that AT was answered, answer intact).
+    """
+    fpga = LoopbackFpga()
+    bridge, thread = start_bridge(fpga)
+    bridge.ai = model = SlowModel()
+    fpga.type(b"AT&AI What is a Sprite?\r")
+    data = fpga.expect(b"WORD0 ")
+    start = time.perf_counter()
+    fpga.type(b"AT\r")
+    data += fpga.expect(b"AT\r\nOK\r\n")
+    elapsed = time.perf_counter() - start
+    data += fpga.expect(b"\r\nOK\r\n", timeout=10)
+    bridge.stop()
+    thread.join()
+    words = re.findall(rb"WORD(\d+)", data)
+    return model.prompts[0], elapsed, [int(w) for w in words] == list(range(model.chunks))
+
+def record(directory, keystrokes=50, paste=4096):
+    """Record a sample session into directory: typing against an echoing host, then a pasted block"""
+    fpga = LoopbackFpga()
+    remote = RemoteHost('echo')
+    bridge, thread = start_bridge(fpga, {'capture_dir': directory})
+    dial(fpga, remote.port)
+    for i in range(keystrokes):
+        key = bytes([0x41 + i % 26])
+        fpga.type(key)
+        fpga.expect(key)
+        time.sleep(0.1)
+    block = bytes(0x20 + i % 90 for i in range(paste)).replace(b'+', b'-')
+    fpga.type(block)
+    fpga.expect(block[-16:], timeout=10)
+    fpga.type(b"+++")
+    fpga.expect(b"OK")
+    fpga.type(b"ATH\r")
+    fpga.expect(b"OK")
+    bridge.stop()
+    thread.join()
+    remote.close()
+
+def idle_cpu(irq=False, seconds=2.0):
+    """CPU seconds used per wall second by a connected bridge with no traffic"""
+    fpga = LoopbackFpga(irq=irq)
+    remote = RemoteHost('echo')
+    bridge, thread = start_bridge(fpga)
+    dial(fpga, remote.port)
+    time.sleep(0.1)
+    cpu = time.process_time()
+    time.sleep(seconds)
+    used = time.process_time() - cpu
+    bridge.stop()
+    thread.join()
+    remote.close()
+    return used / seconds
+
+def main():
+    parser = argparse.ArgumentParser(description='ZiModem bridge loopback harness')
+    parser.add_argument('--irq', action='store_true', help='Simulate a FIFO interrupt fd instead of polling')
+    parser.add_argument('--keys', type=int, default=100, help='Keystrokes for the echo test')
+    parser.add_argument('--no-coalesce', action='store_true', help='Send every FIFO burst as its own write')
+    parser.add_argument('--get', action='store_true', help='Only run the AT&GET download test')
+    parser.add_argument('--telnet', action='store_true', help='Only run the raw vs telnet binary transfer test')
+    parser.add_argument('--record', metavar='DIR', help='Record a sample session capture into DIR')
+    parser.add_argument('--replay', metavar='FILE', help='Replay a session capture and report')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed factor')
+    parser.add_argument('--drain', type=int, default=0, help='Bytes/s the C64 drains the RX FIFO at on replay (0 = at once)')
+    parser.add_argument('--pacing', action='store_true', help='Only run the baud pacing test')
+    parser.add_argument('--ai', action='store_true', help='Only run the AT&AI test against a slow stand-in model')
+    parser.add_argument('--stalled', action='store_true', help='Only run the stalled remote test (a peer that never reads)')
+    parser.add_argument('--callers', type=int, help='Only run the inbound caller load test with this many callers')
+    args = parser.parse_args()
+
+    if args.get:
+        elapsed, reply, intact = get_program()
+        print(f"AT&GET 50 KB: {elapsed * 1000:.1f} ms ({reply}), {'intact' if intact else 'CORRUPT'}; "
+              f"through the UART at 57600 baud: {50 * 1024 / MODEM_RATE:.1f}s")
+        checks = get_guards()
+        for check, ok in checks:
+            print(f"{check}: {'ok' if ok else 'FAILED'}")
+        if not all(ok for _, ok in checks):
+            sys.exit(1)
+        return
+
+    if args.record:
+        record(args.record)
+        return
+
+    if args.replay:
+        report = Replay(args.replay, args.speed, args.drain).run()
+        print(f"Replayed {report['recorded']:.2f}s session in {report['elapsed']:.2f}s ({args.speed:g}x)")
+        print(f"To C64: {report['to_c64']} bytes, {report['to_c64_rate']:.0f} bytes/s; "
+              f"from C64: {report['from_c64']} bytes, {report['from_c64_rate']:.0f} bytes/s")
+        echo = report['echo']
+        if echo:
+            print(f"Echo latency ({len(echo)} replies): p50 {percentile(echo, 50) * 1000:.2f} ms, "
+                  f"p90 {percentile(echo, 90) * 1000:.2f} ms, p99 {percentile(echo, 99) * 1000:.2f} ms, "
+                  f"max {max(echo) * 1000:.2f} ms")
+        print(f"FIFO-full stalls: {report['fifo_full_stalls']}, replay waits timed out: {report['waits']}")
+        return
+
+    if args.pacing:
+        for baud, drain in ((2400, 0), (19200, 0), (57600, 0), (57600, 3000), (0, 0)):
+            intact, rate, peak, stalls = pacing(baud, 8 * 1024 if baud < 19200 else 32 * 1024, drain)
+            print(f"{baud or 'Unpaced':>7} baud, C64 drains {drain or 'at once'}: {rate:.0f} bytes/s "
+                  f"(line rate {baud / 10:.0f}), peak FIFO fill {peak}, {stalls} FIFO-full stalls, "
+                  f"{'intact' if intact else 'CORRUPT'}")
+        elapsed, answered, queued = hangup_while_paced()
+        ok = answered is not None and queued == 0
+        answer = f"OK after {answered * 1000:.0f} ms" if answered is not None else f"no OK within {HANGUP_OK_WITHIN:.0f}s"
+        print(f"+++ ATH with 16 KB queued at 2400 baud: remote hung up after {elapsed * 1000:.0f} ms, {answer}, "
+              f"{queued} bytes left queued for the C64: {'ok' if ok else 'FAILED'}")
+        if not ok:
+            sys.exit(1)
+        return
+
+    if args.stalled:
+        elapsed, queued, typed = stalled_peer()
+        busy = f"told the line is busy after {elapsed * 1000:.1f} ms" if elapsed is not None else "NOT ANSWERED"
+        print(f"Stalled remote: inbound caller {busy}; {queued} bytes queued for the remote, "
+              f"{typed} bytes accepted from the C64")
+        return
+
+    if args.ai:
+        prompt, elapsed, intact = ai_answer()
+        print(f"AT&AI: model asked {prompt!r}; AT answered after {elapsed * 1000:.1f} ms while streaming, "
+              f"answer {'intact' if intact else 'CORRUPT'}")
+        return
+
+    if args.telnet:
+        for name, telnet in (("Raw", False), ("Telnet", True)):
+            down, up = binary_transfer(telnet)
+            print(f"{name}: download {'intact' if down[0] else 'CORRUPT'} {down[1] / 1024:.0f} KB/s, "
+                  f"upload {'intact' if up[0] else 'CORRUPT'} {up[1] / 1024:.0f} KB/s")
+        return
+
+    if args.callers:
+        results, handoffs = callers(args.callers)
+        waits = [r['welcome'] - r['start'] for r in results]
+        print(f"Callers: {sum(r['served'] for r in results)}/{args.callers} served, "
+              f"{sum(r['updates'] for r in results)} queue position updates")
+        print(f"Wait: max {max(waits):.2f}s; hand-off: p50 {percentile(handoffs, 50) * 1000:.1f} ms, "
+              f"max {max(handoffs) * 1000:.1f} ms")
+        return
+    options = {'coalesce': {'telnet': {'max_bytes': 1}}} if args.no_coalesce else None
+
+    samples = echo_latency(args.irq, args.keys, options)
+    print(f"Echo latency: p50 {percentile(samples, 50) * 1000:.2f} ms, "
+          f"p99 {percentile(samples, 99) * 1000:.2f} ms, max {max(samples) * 1000:.2f} ms")
+    received, elapsed = download(args.irq)
+    print(f"Download: {received} bytes in {elapsed:.2f}s = {received / elapsed / 1024:.0f} KB/s")
+    received, writes, elapsed = upload(args.irq, options=options)
+    print(f"Upload: {received} bytes in {writes} writes in {elapsed:.2f}s = {received / elapsed / 1024:.0f} KB/s")
+    received, writes, elapsed = upload(args.irq, 16 * 1024, MODEM_RATE, options)
+    print(f"Upload at 57600 baud: {received} bytes in {writes} writes "
+          f"({received / writes:.0f} bytes/write) in {elapsed:.2f}s")
+    print(f"Idle CPU: {idle_cpu(args.irq) * 100:.1f}%")
+
+if __name__ == "__main__":
+    main()
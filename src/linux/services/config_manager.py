@@ -11,7 +11,23 @@ DEFAULT_CONFIG = {
     },
     "zimodem": {
         "port": 6400,
-        "enabled": True
+        "enabled": True,
+        "fifo_irq": "",       # UIO device for the UART FIFO interrupt; polled when empty
+        "poll_idle_ms": 10,
+        "max_callers": 32,
+        "auto_answer": 0,     # Rings before the bridge answers itself (ATS0)
+        "download_dir": "/home/root/c64_files", # Base for relative AT&GET paths
+        "telnet": "auto",     # Telnet negotiation: auto (callers, port 23, servers that negotiate), on, off
+        "capture_dir": "",    # Record sessions here for replay benchmarks; empty = off
+        "baud": 57600,        # Rate data is paced to the C64 at and reported in CONNECT (ATB); 0 = unpaced
+        "rates": {},          # Per-session rates by dial target ("SIMH", "host:port") or "ANSWER" for callers
+        "pool": {             # Pre-booted SIMH/SHELL sessions, opt-in (size 0 = spawn on dial)
+            "memory_budget_mb": 256,
+            "targets": {
+                "SIMH": {"size": 0, "idle_timeout": 1800},
+                "SHELL": {"size": 0, "ready": "[$#] $", "idle_timeout": 1800}
+            }
+        }
     },
     "drives": [
         {
@@ -0,0 +1,223 @@
+import os
+import re
+import sys
+import zlib
+import sqlite3
+import hashlib
+import logging
+import xml.etree.ElementTree as ET
+from library_db import DB_PATH, BUSY_TIMEOUT
+
+# TOSEC naming: "Title (1985)(Publisher)(Country)[flags]"
+TOSEC_NAME_RE = re.compile(r'^(?P<title>.*?)\s*\((?P<year>[0-9x]{4}(?:-[0-9x]{2}){0,2})\)\s*\((?P<publisher>[^)]*)\)')
+# No-Intro and anything else: strip trailing "(...)" and "[...]" groups
+TAG_SUFFIX_RE = re.compile(r'\s*[\(\[][^\)\]]*[\)\]]')
+# clrmamepro text DATs: rom ( name "x.prg" size 123 crc ABCD1234 md5 ... sha1 ... )
+CMP_GAME_RE = re.compile(r'^\s*game\s*\(', re.M)
+CMP_FIELD_RE = re.compile(r'(\w+)\s+("(?:[^"\\]|\\.)*"|\S+)')
+
+BATCH_SIZE = 1000
+
+def file_hashes(data):
+    """The three hashes used by TOSEC and No-Intro DATs, as lowercase hex"""
+    return {
+        'crc32': f"{zlib.crc32(data) & 0xFFFFFFFF:08x}",
+        'md5': hashlib.md5(data).hexdigest(),
+        'sha1': hashlib.sha1(data).hexdigest(),
+    }
+
+def parse_dat_name(name):
+    """Split a TOSEC/No-Intro entry name into (title, year, publisher)"""
+    m = TOSEC_NAME_RE.match(name)
+    if m:
+        year = m.group('year')[:4]
+        publisher = m.group('publisher')
+        return (m.group('title').strip(),
+                int(year) if year.isdigit() else None,
+                None if publisher == '-' else publisher)
+    return TAG_SUFFIX_RE.sub('', name).strip() or name, None, None
+
+class DatIndex:
+    """
+    Offline identification of files by hash against imported TOSEC/No-Intro DATs.
+    Lookups hit an index on sha1, md5 or (crc32, size), so identifying a file
+    costs the same regardless of how many DATs are loaded.
+    """
+    def __init__(self, db_path=DB_PATH):
+        self.logger = logging.getLogger("DatIndex")
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
+
+    def _init_db(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS dat_roms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dat_name TEXT NOT NULL,
+            game_name TEXT NOT NULL, -- canonical DAT name, stored as items.tosec_id
+            rom_name TEXT,
+            size INTEGER,
+            crc32 TEXT,
+            md5 TEXT,
+            sha1 TEXT,
+            title TEXT,
+            year INTEGER,
+            publisher TEXT
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_dat_sha1 ON dat_roms(sha1)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_dat_md5 ON dat_roms(md5)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_dat_crc32 ON dat_roms(crc32, size)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_dat_name ON dat_roms(dat_name)")
+        conn.commit()
+        conn.close()
+
+    # --------------------------------------------------------------------------
+    # Import
+    # --------------------------------------------------------------------------
+    def _iter_logiqx(self, path):
+        """Yield (dat_name, game, rom) from a Logiqx XML DAT without loading it whole"""
+        dat_name = os.path.basename(path)
+        for event, elem in ET.iterparse(path, events=('end',)):
+            if elem.tag == 'name' and elem.text and elem.text.strip():
+                # header/name comes before the first game
+                if dat_name == os.path.basename(path):
+                    dat_name = elem.text.strip()
+            elif elem.tag in ('game', 'machine'):
+                game = {
+                    'name': elem.get('name', ''),
+                    'description': elem.findtext('description'),
+                    'year': elem.findtext('year'),
+                    'manufacturer': elem.findtext('manufacturer'),
+                }
+                for rom in elem.iter('rom'):
+                    yield dat_name, game, dict(rom.attrib)
+                elem.clear()
+
+    def _iter_clrmamepro(self, path):
+        """Yield (dat_name, game, rom) from a clrmamepro text DAT"""
+        with open(path, 'r', errors='replace') as f:
+            text = f.read()
+        dat_name = os.path.basename(path)
+        header = re.search(r'clrmamepro\s*\((.*?)\n\)', text, re.S)
+        if header:
+            for key, value in CMP_FIELD_RE.findall(header.group(1)):
+                if key == 'name':
+                    dat_name = value.strip('"')
+
+        for block in CMP_GAME_RE.split(text)[1:]:
+            game = {}
+            # Game-level fields come before the nested rom ( ... ) entries
+            head = block.split('rom (', 1)[0]
+            for key, value in CMP_FIELD_RE.findall(head):
+                if key in ('name', 'description', 'year', 'manufacturer') and key not in game:
+                    game[key] = value.strip('"')
+            for rom_body in re.findall(r'rom\s*\((.*?)\)\s*$', block, re.M):
+                rom = {k: v.strip('"') for k, v in CMP_FIELD_RE.findall(rom_body)}
+                yield dat_name, game, rom
+
+    def import_dat(self, path):
+        """Load a DAT file, replacing any earlier import of the same DAT. Returns the rom count."""
+        with open(path, 'rb') as f:
+            head = f.read(512).lstrip()
+        rows = self._iter_logiqx(path) if head.startswith(b'<') else self._iter_clrmamepro(path)
+
+        conn = self._connect()
+        c = conn.cursor()
+        count = 0
+        batch = []
+        replaced = set()
+        try:
+            for dat_name, game, rom in rows:
+                if dat_name not in replaced:
+                    c.execute("DELETE FROM dat_roms WHERE dat_name = ?", (dat_name,))
+                    replaced.add(dat_name)
+
+                title, year, publisher = parse_dat_name(game.get('name') or rom.get('name', ''))
+                game_year = (game.get('year') or '')[:4]
+                if game_year.isdigit():
+                    year = int(game_year)
+                publisher = game.get('manufacturer') or publisher
+                size = rom.get('size')
+                batch.append((
+                    dat_name,
+                    game.get('name') or rom.get('name'),
+                    rom.get('name'),
+                    int(size) if size and size.isdigit() else None,
+                    (rom.get('crc') or '').lower() or None,
+                    (rom.get('md5') or '').lower() or None,
+                    (rom.get('sha1') or '').lower() or None,
+                    title, year, publisher
+                ))
+                if len(batch) >= BATCH_SIZE:
+                    count += self._insert(c, batch)
+                    batch = []
+            if batch:
+                count += self._insert(c, batch)
+            conn.commit()
+        finally:
+            conn.close()
+        self.logger.info(f"Imported {count} DAT entries from {path}")
+        return count
+
+    def _insert(self, c, batch):
+        c.executemany('''INSERT INTO dat_roms (
+            dat_name, game_name, rom_name, size, crc32, md5, sha1, title, year, publisher
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+        return len(batch)
+
+    # --------------------------------------------------------------------------
+    # Lookup
+    # --------------------------------------------------------------------------
+    def identify(self, data=None, hashes=None):
+        """
+        Match file contents (or precomputed hashes from file_hashes) against
+        the loaded DATs. Returns a metadata dict or None.
+        """
+        if hashes is None:
+            hashes = file_hashes(data)
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        try:
+            # Strongest hash first; CRC32 alone is only trusted together with the size
+            c.execute("SELECT * FROM dat_roms WHERE sha1 = ? LIMIT 1", (hashes['sha1'],))
+            row = c.fetchone()
+            if row is None and hashes.get('md5'):
+                c.execute("SELECT * FROM dat_roms WHERE md5 = ? LIMIT 1", (hashes['md5'],))
+                row = c.fetchone()
+            if row is None and hashes.get('crc32') and data is not None:
+                c.execute("SELECT * FROM dat_roms WHERE crc32 = ? AND size = ? LIMIT 1",
+                          (hashes['crc32'], len(data)))
+                row = c.fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        return {
+            'title': row['title'],
+            'year': row['year'],
+            'publisher': row['publisher'],
+            'tosec_id': row['game_name'],
+            'dat_name': row['dat_name'],
+        }
+
+    def stats(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("SELECT dat_name, COUNT(*) FROM dat_roms GROUP BY dat_name ORDER BY dat_name")
+        rows = c.fetchall()
+        conn.close()
+        return dict(rows)
+
+if __name__ == "__main__":
+    # Usage: python3 dat_index.py file1.dat [file2.dat ...]
+    logging.basicConfig(level=logging.INFO)
+    index = DatIndex()
+    for dat_path in sys.argv[1:]:
+        index.import_dat(dat_path)
+    for name, count in index.stats().items():
+        print(f"{count:8}  {name}")
@@ -0,0 +1,195 @@
+import os
+import struct
+import threading
+
+REFRESH_INTERVAL = 30.0    # Seconds between background rescans of remote (SMB) directories
+
+# inotify(7) event bits
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT = struct.Struct('iIII') # wd, mask, cookie, name length
+
+class Inotify:
+    """Minimal inotify binding through libc; create() returns None where it is unavailable"""
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+
+    @classmethod
+    def create(cls):
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        return cls(libc, fd) if fd >= 0 else None
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """Watch descriptor for path, or None"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        return wd if wd >= 0 else None
+
+    def read_events(self):
+        """(wd, mask) of every queued event, without blocking"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset + EVENT.size <= len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                events.append((wd, mask))
+                offset += EVENT.size + length
+
+    def close(self):
+        os.close(self.fd)
+
+class DirectoryListing:
+    """One scan of a directory: (name, is_dir, size) entries sorted by name"""
+    def __init__(self, path, entries, mtime):
+        self.path = path
+        self.entries = entries
+        self.mtime = mtime
+        self.watched = False   # Kept valid by inotify rather than an mtime check
+        self.rendered = {}     # Render key (e.g. device ID) -> whatever the caller built from it
+
+def scan_directory(path):
+    """List path with one scandir pass; sizes come from the entries, not per-name stat() calls"""
+    mtime = os.stat(path).st_mtime_ns # Before the scan, so a change during it is noticed next time
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+                size = 0 if is_dir else entry.stat().st_size
+            except OSError:
+                continue # Vanished while listing
+            entries.append((entry.name, is_dir, size))
+    entries.sort()
+    return DirectoryListing(path, entries, mtime)
+
+class DirectoryCache:
+    """
+    Per-directory cache of scans and of what callers render from them
+    (listing.rendered). A local directory is watched with inotify and
+    rescanned only after an event; without inotify its mtime is compared
+    on access, so renames, creations and deletions are still noticed.
+
+    Directories under a remote root (add_remote, e.g. an SMB mount, where
+    inotify sees nothing and each stat is a round trip) are never checked
+    on access: a background thread rescans the ones in use every
+    refresh_interval seconds and swaps in the new listing if it changed.
+    """
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.listings = {}
+        self.lock = threading.Lock()
+        self.remote_roots = []
+        self.inotify = Inotify.create()
+        self.watches = {}       # wd -> path
+        self.hits = 0
+        self.misses = 0
+        self.stopped = threading.Event()
+        self.refresher = None
+
+    def add_remote(self, root):
+        """Serve directories under root from memory, refreshed in the background"""
+        self.remote_roots.append(os.path.join(os.path.abspath(root), ''))
+        if self.refresher is None:
+            self.refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self.refresher.start()
+        # Prefetch so the first LOAD"$" does not wait for the share either
+        threading.Thread(target=self._prefetch, args=(root,), daemon=True).start()
+
+    def is_remote(self, path):
+        path = os.path.join(os.path.abspath(path), '')
+        return any(path.startswith(root) for root in self.remote_roots)
+
+    def get(self, path):
+        """The listing of path, rescanned only if it may have changed"""
+        path = os.path.abspath(path)
+        remote = self.is_remote(path)
+        if self.inotify and not remote:
+            self._apply_events()
+        with self.lock:
+            listing = self.listings.get(path)
+        if listing is not None and (remote or listing.watched or self._unchanged(listing)):
+            self.hits += 1
+            return listing
+        self.misses += 1
+        wd = None
+        if self.inotify and not remote:
+            # Watch before scanning so a change during the scan is not lost
+            wd = self.inotify.add_watch(path)
+            if wd is not None:
+                self.watches[wd] = path
+        listing = scan_directory(path)
+        listing.watched = wd is not None
+        with self.lock:
+            self.listings[path] = listing
+        return listing
+
+    def invalidate(self, path):
+        """Forget a directory (e.g. after writing into it), so the next get() rescans it"""
+        with self.lock:
+            self.listings.pop(os.path.abspath(path), None)
+
+    def close(self):
+        self.stopped.set()
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    def _prefetch(self, path):
+        try:
+            self.get(path)
+        except OSError as e:
+            print(f"[Drive] Could not list {path}: {e}")
+
+    def _unchanged(self, listing):
+        try:
+            return os.stat(listing.path).st_mtime_ns == listing.mtime
+        except OSError:
+            return False
+
+    def _apply_events(self):
+        for wd, mask in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                with self.lock:
+                    self.listings = {p: l for p, l in self.listings.items() if not l.watched}
+                continue
+            path = self.watches.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd] # Directory gone; add_watch again on the next scan
+            self.invalidate(path)
+
+    def _refresh_loop(self):
+        while not self.stopped.wait(self.refresh_interval):
+            with self.lock:
+                remote = [p for p in self.listings if self.is_remote(p)]
+            for path in remote:
+                try:
+                    listing = scan_directory(path)
+                except OSError:
+                    self.invalidate(path)
+                    continue
+                with self.lock:
+                    current = self.listings.get(path)
+                    if current is None or current.entries != listing.entries:
+                        self.listings[path] = listing
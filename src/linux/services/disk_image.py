@@ -0,0 +1,594 @@
+import bisect
+import mmap
+import os
+import struct
+import time
+from collections import OrderedDict
+
+# Commodore disk and tape image parsing (D64/D71/D81/T64).
+# Everything here works on the raw image bytes; callers decide whether those
+# come from a file, a library blob or an mmap.
+
+SECTOR_SIZE = 256
+
+FILE_TYPES = {0: "DEL", 1: "SEQ", 2: "PRG", 3: "USR", 4: "REL", 5: "CBM"}
+
+# Sectors per track for the 1541 zones (tracks 1-17, 18-24, 25-30, 31-40)
+def _d64_sectors(track):
+    if track <= 17:
+        return 21
+    if track <= 24:
+        return 19
+    if track <= 30:
+        return 18
+    return 17
+
+class DiskGeometry:
+    """Track/sector layout of one image format"""
+    def __init__(self, fmt, tracks, sectors_for_track, dir_track, dir_sector, header_sector,
+                 name_offset, id_offset):
+        self.fmt = fmt
+        self.tracks = tracks
+        self.dir_track = dir_track
+        self.dir_sector = dir_sector          # first directory sector
+        self.header_sector = header_sector    # sector holding disk name/ID
+        self.name_offset = name_offset
+        self.id_offset = id_offset
+        # Precompute the byte offset of every track so sector lookup is O(1)
+        self.sectors = [0] + [sectors_for_track(t) for t in range(1, tracks + 1)]
+        self.track_offset = [0] * (tracks + 2)
+        offset = 0
+        for t in range(1, tracks + 1):
+            self.track_offset[t] = offset
+            offset += self.sectors[t] * SECTOR_SIZE
+        self.track_offset[tracks + 1] = offset
+        self.size = offset
+
+    def sector_offset(self, track, sector):
+        if not (1 <= track <= self.tracks) or not (0 <= sector < self.sectors[track]):
+            raise ValueError(f"Illegal track/sector {track}/{sector} for {self.fmt}")
+        return self.track_offset[track] + sector * SECTOR_SIZE
+
+def d64_geometry(tracks=35):
+    return DiskGeometry("D64", tracks, _d64_sectors, 18, 1, 0, 0x90, 0xA2)
+
+def d71_geometry():
+    # Side two repeats the 1541 zones on tracks 36-70
+    return DiskGeometry("D71", 70, lambda t: _d64_sectors(t if t <= 35 else t - 35), 18, 1, 0, 0x90, 0xA2)
+
+def d81_geometry():
+    return DiskGeometry("D81", 80, lambda t: 40, 40, 3, 0, 0x04, 0x16)
+
+# Image size (without/with error bytes) -> geometry factory
+_SIZES = {
+    174848: lambda: d64_geometry(35), 175531: lambda: d64_geometry(35),
+    196608: lambda: d64_geometry(40), 197376: lambda: d64_geometry(40),
+    349696: d71_geometry, 351062: d71_geometry,
+    819200: d81_geometry, 822400: d81_geometry,
+}
+
+IMAGE_TYPES = ("D64", "D71", "D81", "T64")
+
+def detect_geometry(data):
+    factory = _SIZES.get(len(data))
+    if factory is None:
+        raise ValueError(f"Unrecognised disk image size {len(data)}")
+    return factory()
+
+def petscii_to_ascii(raw):
+    """Directory names are PETSCII padded with $A0; map to printable ASCII"""
+    out = []
+    for b in raw.rstrip(b'\xa0'):
+        if 0x20 <= b <= 0x5F:
+            out.append(chr(b))
+        elif 0xC1 <= b <= 0xDA:
+            out.append(chr(b - 0x80)) # Shifted letters
+        elif 0x61 <= b <= 0x7A:
+            out.append(chr(b - 0x20))
+        else:
+            out.append('?')
+    return "".join(out)
+
+def _chain(data, geometry, track, sector):
+    """Yield (offset, used_bytes) for each sector of a track/sector chain"""
+    seen = set()
+    while track:
+        if (track, sector) in seen:
+            raise ValueError(f"Sector chain loops at {track}/{sector}")
+        seen.add((track, sector))
+        offset = geometry.sector_offset(track, sector)
+        next_track, next_sector = data[offset], data[offset + 1]
+        if next_track == 0:
+            # Last sector: byte 1 is the index of the last used byte
+            yield offset, max(next_sector - 1, 0)
+        else:
+            yield offset, SECTOR_SIZE - 2
+        track, sector = next_track, next_sector
+
+def read_disk_directory(data, geometry=None):
+    """
+    Parse the header and directory of a D64/D71/D81.
+    Returns (disk_name, disk_id, entries); each entry is a dict with
+    name, raw_name, file_type, blocks, track, sector.
+    """
+    geometry = geometry or detect_geometry(data)
+    header = geometry.sector_offset(geometry.dir_track, geometry.header_sector)
+    disk_name = petscii_to_ascii(data[header + geometry.name_offset:header + geometry.name_offset + 16])
+    disk_id = petscii_to_ascii(data[header + geometry.id_offset:header + geometry.id_offset + 5])
+
+    entries = []
+    for offset, _ in _chain(data, geometry, geometry.dir_track, geometry.dir_sector):
+        for slot in range(8):
+            e = offset + slot * 32
+            type_byte = data[e + 2]
+            if type_byte == 0:
+                continue # Scratched/empty slot
+            raw_name = bytes(data[e + 5:e + 21])
+            entries.append({
+                'name': petscii_to_ascii(raw_name),
+                'raw_name': raw_name.rstrip(b'\xa0'),
+                'file_type': FILE_TYPES.get(type_byte & 0x0F, "???"),
+                'blocks': data[e + 30] | (data[e + 31] << 8),
+                'track': data[e + 3],
+                'sector': data[e + 4],
+                'data_offset': None,
+                'data_size': None,
+                'load_address': None,
+            })
+    return disk_name, disk_id, entries
+
+def read_disk_file(data, track, sector, geometry=None):
+    """Follow a file's sector chain starting at track/sector and return its bytes"""
+    geometry = geometry or detect_geometry(data)
+    out = bytearray()
+    for offset, used in _chain(data, geometry, track, sector):
+        out += data[offset + 2:offset + 2 + used]
+    return bytes(out)
+
+def read_t64_directory(data):
+    """
+    Parse a T64 tape archive.
+    Returns (tape_name, entries); entries carry data_offset/data_size and
+    load_address instead of track/sector.
+    """
+    if data[:3] != b'C64':
+        raise ValueError("Not a T64 image")
+    max_entries, used_entries = struct.unpack_from('<HH', data, 0x22)
+    tape_name = petscii_to_ascii(bytes(data[0x28:0x40]).rstrip(b' '))
+
+    entries = []
+    for i in range(max(max_entries, used_entries, 1)):
+        e = 0x40 + i * 32
+        if e + 32 > len(data):
+            break
+        if data[e] == 0:
+            continue # Free slot
+        start, end = struct.unpack_from('<HH', data, e + 2)
+        offset = struct.unpack_from('<I', data, e + 8)[0]
+        # Many T64 writers store a bogus end address; clamp to the archive
+        size = min((end - start) & 0xFFFF or 0x10000, len(data) - offset)
+        raw_name = bytes(data[e + 16:e + 32]).rstrip(b' \xa0')
+        entries.append({
+            'name': petscii_to_ascii(raw_name),
+            'raw_name': raw_name,
+            'file_type': FILE_TYPES.get(data[e + 1] & 0x0F or 2, "PRG"), # 0 in old writers means PRG
+            'blocks': (size + 253) // 254,
+            'track': None,
+            'sector': None,
+            'data_offset': offset,
+            'data_size': size,
+            'load_address': start,
+        })
+    return tape_name, entries
+
+def read_t64_file(data, data_offset, data_size, load_address):
+    """Return a T64 entry as a PRG (load address + payload)"""
+    return struct.pack('<H', load_address) + bytes(data[data_offset:data_offset + data_size])
+
+def read_directory(data, file_type):
+    """Directory of any supported image. Returns (name, id, entries)."""
+    if file_type == "T64":
+        name, entries = read_t64_directory(data)
+        return name, "", entries
+    return read_disk_directory(data)
+
+def read_entry(data, entry):
+    """Extract one directory entry (as returned by read_directory or stored in the library)"""
+    if entry.get('data_offset') is not None:
+        return read_t64_file(data, entry['data_offset'], entry['data_size'], entry['load_address'])
+    return read_disk_file(data, entry['track'], entry['sector'])
+
+# ------------------------------------------------------------------------------
+# Mounted images (virtual drive)
+# ------------------------------------------------------------------------------
+SECTOR_CACHE_SIZE = 512    # Sectors kept by MountedImage's LRU cache (a D64 has 683)
+WRITE_BACK_SECTORS = 64    # Dirty sectors that force a write-back...
+WRITE_BACK_DELAY = 1.0     # ...otherwise written back this many seconds after the first change
+FILE_TYPE_CODES = {name: code for code, name in FILE_TYPES.items()}
+
+def _bam_layout(geometry, track):
+    """
+    Where the BAM keeps one track: (free count offset, bitmap offset, bitmap
+    bytes), offsets into the image. None for tracks the BAM does not cover
+    (e.g. 36-40 of a 40-track D64, whose extended BAM formats vary).
+    """
+    if geometry.fmt == "D81":
+        bam = geometry.sector_offset(40, 1 if track <= 40 else 2) + 0x10 + 6 * ((track - 1) % 40)
+        return bam, bam + 1, 5
+    if track <= 35:
+        bam = geometry.sector_offset(18, 0) + 4 * track
+        return bam, bam + 1, 3
+    if geometry.fmt == "D71":
+        return (geometry.sector_offset(18, 0) + 0xDD + track - 36,
+                geometry.sector_offset(53, 0) + 3 * (track - 36), 3)
+    return None
+
+def _system_tracks(geometry):
+    """Tracks holding the directory/BAM, not used for file data"""
+    return {18, 53} if geometry.fmt == "D71" else {geometry.dir_track}
+
+def ascii_to_petscii(name):
+    """A C64 file name for a directory entry: upper case, 16 bytes padded with $A0"""
+    raw = name.upper().encode('ascii', errors='replace')[:16]
+    return raw + b'\xa0' * (16 - len(raw))
+
+def blank_disk(fmt="D64", name="BLANK", disk_id="00"):
+    """A freshly formatted (empty) D64/D71/D81 image"""
+    geometry = {"D64": d64_geometry, "D71": d71_geometry, "D81": d81_geometry}[fmt]()
+    data = bytearray(geometry.size)
+    header = geometry.sector_offset(geometry.dir_track, geometry.header_sector)
+    data[header:header + 2] = bytes((geometry.dir_track, geometry.dir_sector))
+    data[header + 2] = 0x44 if fmt == "D81" else 0x41 # DOS version 'D'/'A'
+    # Name, two $A0, ID, $A0, DOS type, $A0 padding
+    label = header + geometry.name_offset
+    data[label:label + 27] = b'\xa0' * 27
+    data[label:label + 16] = ascii_to_petscii(name)
+    id_bytes = disk_id.upper().encode('ascii')[:2].ljust(2)
+    data[header + geometry.id_offset:header + geometry.id_offset + 2] = id_bytes
+    data[header + geometry.id_offset + 3:header + geometry.id_offset + 5] = b"3D" if fmt == "D81" else b"2A"
+    if fmt == "D81":
+        for sector, next_link in ((1, (40, 2)), (2, (0, 0xFF))):
+            bam = geometry.sector_offset(40, sector)
+            data[bam:bam + 2] = bytes(next_link)
+            data[bam + 2:bam + 6] = b'\x44\xbb' + id_bytes
+            data[bam + 6] = 0xC0
+    elif fmt == "D71":
+        data[header + 3] = 0x80 # Double sided
+    directory = geometry.sector_offset(geometry.dir_track, geometry.dir_sector)
+    data[directory:directory + 2] = b'\x00\xff'
+    used = {(geometry.dir_track, geometry.header_sector), (geometry.dir_track, geometry.dir_sector)}
+    if fmt == "D81":
+        used |= {(40, 1), (40, 2)}
+    elif fmt == "D71":
+        used |= {(53, s) for s in range(geometry.sectors[53])}
+    for track in range(1, geometry.tracks + 1):
+        layout = _bam_layout(geometry, track)
+        if layout is None:
+            continue
+        count_at, map_at, _ = layout
+        free = [s for s in range(geometry.sectors[track]) if (track, s) not in used]
+        data[count_at] = len(free)
+        for s in free:
+            data[map_at + s // 8] |= 1 << (s % 8)
+    return data
+
+class SectorCache:
+    """LRU cache of sector contents keyed by image offset"""
+    def __init__(self, size=SECTOR_CACHE_SIZE):
+        self.size = size
+        self.sectors = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, offset):
+        data = self.sectors.get(offset)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.sectors.move_to_end(offset)
+        return data
+
+    def put(self, offset, data):
+        self.sectors[offset] = data
+        self.sectors.move_to_end(offset)
+        if len(self.sectors) > self.size:
+            self.sectors.popitem(last=False)
+
+class MountedImage:
+    """
+    A D64/D71/D81 mounted on a virtual drive. The directory, BAM and each
+    file's sector chain are parsed once at mount time, so a LOAD is a name
+    lookup plus slicing the sectors of a precomputed chain, and LOAD"$" is a
+    listing rendered once per change.
+
+    The image is memory-mapped and read through an LRU SectorCache. Writes
+    (SAVE, scratch) update the parsed state immediately but only mark
+    sectors dirty; write_back() copies them into the mapping and syncs it
+    once per batch (WRITE_BACK_SECTORS dirty sectors or WRITE_BACK_DELAY
+    seconds), and close() writes back whatever is left.
+    """
+    def __init__(self, path, read_only=False, cache_size=SECTOR_CACHE_SIZE):
+        self.path = path
+        self.read_only = read_only or not os.access(path, os.W_OK)
+        self.file = open(path, 'rb' if self.read_only else 'r+b')
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0,
+                                access=mmap.ACCESS_READ if self.read_only else mmap.ACCESS_WRITE)
+            self.geometry = detect_geometry(self.mm)
+        except (ValueError, OSError):
+            self.file.close()
+            raise
+        self.cache = SectorCache(cache_size)
+        self.dirty = {}          # offset -> bytearray, not yet in the mapping
+        self.dirty_since = None
+        self.rendered = {}       # Whatever callers built from the directory; cleared on every change
+        self.disk_name, self.disk_id, self.entries = read_disk_directory(self.mm, self.geometry)
+        self.index = {}          # Name -> first directory entry with that name
+        for entry in self.entries:
+            self._add_to_index(entry)
+        self.free = {}           # Track -> set of free sectors
+        system = _system_tracks(self.geometry)
+        dir_track = self.geometry.dir_track
+        # Allocation order: outward from the directory track, like the drive's DOS
+        self.data_tracks = [t for d in range(1, self.geometry.tracks)
+                            for t in (dir_track - d, dir_track + d)
+                            if 1 <= t <= self.geometry.tracks and t not in system]
+        for track in range(1, self.geometry.tracks + 1):
+            layout = _bam_layout(self.geometry, track)
+            if layout is not None:
+                _, map_at, _ = layout
+                self.free[track] = {s for s in range(self.geometry.sectors[track])
+                                    if self.mm[map_at + s // 8] & (1 << (s % 8))}
+
+    def _add_to_index(self, entry):
+        entry['chain'] = None # Sector offsets and used byte counts, computed on first read
+        self.index.setdefault(entry['name'], entry)
+
+    # --------------------------------------------------------------------------
+    # Sectors
+    # --------------------------------------------------------------------------
+    def read_sector(self, offset):
+        """Contents of the sector at an image offset (dirty data first, then cache, then mapping)"""
+        data = self.dirty.get(offset)
+        if data is not None:
+            return data
+        data = self.cache.get(offset)
+        if data is None:
+            data = self.mm[offset:offset + SECTOR_SIZE]
+            self.cache.put(offset, data)
+        return data
+
+    def _sector_for_update(self, offset):
+        data = self.dirty.get(offset)
+        if data is None:
+            data = self.dirty[offset] = bytearray(self.read_sector(offset))
+            self.cache.sectors.pop(offset, None)
+            if self.dirty_since is None:
+                self.dirty_since = time.monotonic()
+        return data
+
+    def write_back(self, force=False):
+        """Write dirty sectors into the image if a batch is due (or force). Returns sectors written."""
+        if not self.dirty:
+            return 0
+        if not force and len(self.dirty) < WRITE_BACK_SECTORS \
+                and time.monotonic() - self.dirty_since < WRITE_BACK_DELAY:
+            return 0
+        for offset, data in sorted(self.dirty.items()):
+            self.mm[offset:offset + SECTOR_SIZE] = data
+        self.mm.flush()
+        count = len(self.dirty)
+        self.dirty = {}
+        self.dirty_since = None
+        return count
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.write_back(force=True)
+        self.mm.close()
+        self.file.close()
+        self.mm = None
+
+    # --------------------------------------------------------------------------
+    # Files
+    # --------------------------------------------------------------------------
+    def find(self, pattern):
+        """First directory entry matching a CBM DOS pattern ('?' any character, '*' the rest)"""
+        if '*' not in pattern and '?' not in pattern:
+            return self.index.get(pattern)
+        prefix = pattern.split('*', 1)[0]
+        for entry in self.entries:
+            name = entry['name']
+            if len(prefix) > len(name) or ('*' not in pattern and len(name) != len(pattern)):
+                continue
+            if all(p == '?' or p == c for p, c in zip(prefix, name)):
+                return entry
+        return None
+
+    def read_file(self, entry):
+        """A file's contents (PRG: with its load address), following the chain parsed once"""
+        if entry['chain'] is None:
+            entry['chain'] = list(_chain(self, self.geometry, entry['track'], entry['sector']))
+        return b"".join(self.read_sector(offset)[2:2 + used] for offset, used in entry['chain'])
+
+    def __getitem__(self, offset):
+        # Lets _chain() walk links through the sector cache
+        return self.read_sector(offset - offset % SECTOR_SIZE)[offset % SECTOR_SIZE]
+
+    def blocks_free(self):
+        system = _system_tracks(self.geometry)
+        return sum(len(free) for track, free in self.free.items() if track not in system)
+
+    def listing(self):
+        """The directory as text lines of "BLOCKS TEXT", like the virtual drive's other listings"""
+        disk_id = self.disk_id.replace('?', ' ')
+        lines = [f'0 "{self.disk_name:<16}" {disk_id}']
+        for entry in self.entries:
+            lines.append(f'{entry["blocks"]:<4} "{entry["name"]}" {entry["file_type"]}')
+        lines.append(f"{self.blocks_free()} BLOCKS FREE.")
+        return "\r".join(lines)
+
+    def _changed(self):
+        self.rendered.clear()
+
+    def _claim(self, track, after=None, interleave=0):
+        """Take a free sector on track, the first at or past after + interleave. None if the track is full."""
+        free = self.free.get(track)
+        if not free:
+            return None
+        sectors = self.geometry.sectors[track]
+        start = 0 if after is None else after + interleave
+        sector = next(s % sectors for s in range(start, start + sectors) if s % sectors in free)
+        self._mark(track, sector, False)
+        return track, sector
+
+    def _allocate(self, previous=None):
+        """Next sector of a file: on the previous sector's track if possible. Returns (track, sector)."""
+        interleave = 1 if self.geometry.fmt == "D81" else 10
+        if previous is not None:
+            claimed = self._claim(previous[0], previous[1], interleave)
+            if claimed:
+                return claimed
+        for track in self.data_tracks:
+            claimed = self._claim(track)
+            if claimed:
+                return claimed
+        raise OSError("DISK FULL")
+
+    def _track_sector(self, offset):
+        track = bisect.bisect_right(self.geometry.track_offset, offset, 1, self.geometry.tracks + 1) - 1
+        return track, (offset - self.geometry.track_offset[track]) // SECTOR_SIZE
+
+    def _mark(self, track, sector, free):
+        count_at, map_at, _ = _bam_layout(self.geometry, track)
+        (self.free[track].add if free else self.free[track].discard)(sector)
+        bam = self._sector_for_update(count_at - count_at % SECTOR_SIZE)
+        bam[count_at % SECTOR_SIZE] = len(self.free[track])
+        bitmap = self._sector_for_update(map_at - map_at % SECTOR_SIZE)
+        bit = (map_at % SECTOR_SIZE) + sector // 8
+        if free:
+            bitmap[bit] |= 1 << (sector % 8)
+        else:
+            bitmap[bit] &= ~(1 << (sector % 8)) & 0xFF
+
+    def _directory_slot(self):
+        """Offset of a free 32-byte directory slot, extending the directory chain if it is full"""
+        last = None
+        for offset, _ in _chain(self, self.geometry, self.geometry.dir_track, self.geometry.dir_sector):
+            for slot in range(8):
+                if self.read_sector(offset)[slot * 32 + 2] == 0:
+                    return offset + slot * 32
+            last = offset
+        claimed = self._claim(self.geometry.dir_track, self._track_sector(last)[1], 3)
+        if claimed is None:
+            raise OSError("DISK FULL") # Directory track full
+        offset = self.geometry.sector_offset(*claimed)
+        self._sector_for_update(last)[0:2] = bytes(claimed)
+        new = self._sector_for_update(offset)
+        new[:] = bytes(SECTOR_SIZE)
+        new[0:2] = b'\x00\xff'
+        return offset
+
+    def write_file(self, name, data, file_type="PRG", replace=None):
+        """
+        Add a file. With replace (a directory entry, SAVE"@:...") the data
+        goes to free sectors first, then the old entry's directory slot is
+        pointed at it and only then are the old sectors freed, as CBM DOS
+        does: the old file's blocks are not available to the new one, and a
+        full disk leaves the old file intact. Raises OSError("DISK FULL")
+        (leaving the image unchanged) or PermissionError.
+        """
+        if self.read_only:
+            raise PermissionError("WRITE PROTECT ON")
+        blocks = max(1, (len(data) + 253) // 254)
+        if blocks > self.blocks_free():
+            raise OSError("DISK FULL")
+        if replace is not None:
+            if replace.get('slot') is None:
+                replace['slot'] = self._find_slot(replace)
+            slot = replace['slot']
+            old_chain = list(_chain(self, self.geometry, replace['track'], replace['sector']))
+        else:
+            slot = self._directory_slot()
+        chain = []
+        for i in range(blocks):
+            chain.append(self._allocate(chain[-1] if chain else None))
+        spans = []
+        for i, (track, sector) in enumerate(chain):
+            offset = self.geometry.sector_offset(track, sector)
+            part = data[i * 254:(i + 1) * 254]
+            sector_data = self._sector_for_update(offset)
+            sector_data[:] = bytes(SECTOR_SIZE)
+            if i + 1 < len(chain):
+                sector_data[0:2] = bytes(chain[i + 1])
+            else:
+                sector_data[0:2] = bytes((0, len(part) + 1))
+            sector_data[2:2 + len(part)] = part
+            spans.append((offset, len(part)))
+
+        directory = self._sector_for_update(slot - slot % SECTOR_SIZE)
+        e = slot % SECTOR_SIZE
+        raw_name = ascii_to_petscii(name)
+        directory[e + 2:e + 32] = bytes(30)
+        directory[e + 2] = 0x80 | FILE_TYPE_CODES.get(file_type, 2)
+        directory[e + 3:e + 5] = bytes(chain[0])
+        directory[e + 5:e + 21] = raw_name
+        directory[e + 30:e + 32] = struct.pack('<H', blocks)
+        entry = {
+            'name': petscii_to_ascii(raw_name),
+            'raw_name': raw_name.rstrip(b'\xa0'),
+            'file_type': file_type,
+            'blocks': blocks,
+            'track': chain[0][0],
+            'sector': chain[0][1],
+            'data_offset': None,
+            'data_size': None,
+            'load_address': None,
+            'slot': slot,
+        }
+        if replace is not None:
+            for offset, _ in old_chain:
+                track, sector = self._track_sector(offset)
+                if track in self.free:
+                    self._mark(track, sector, True)
+            # Same place in the listing, as the slot is reused
+            self.entries[self.entries.index(replace)] = entry
+            self._reindex()
+        else:
+            self.entries.append(entry)
+            self._add_to_index(entry)
+        entry['chain'] = spans
+        self._changed()
+        return entry
+
+    def scratch(self, entry):
+        """Delete a file: free its sectors and clear its directory slot"""
+        if self.read_only:
+            raise PermissionError("WRITE PROTECT ON")
+        if entry.get('slot') is None:
+            entry['slot'] = self._find_slot(entry)
+        for offset, _ in list(_chain(self, self.geometry, entry['track'], entry['sector'])):
+            track, sector = self._track_sector(offset)
+            if track in self.free:
+                self._mark(track, sector, True)
+        directory = self._sector_for_update(entry['slot'] - entry['slot'] % SECTOR_SIZE)
+        directory[entry['slot'] % SECTOR_SIZE + 2] = 0
+        self.entries.remove(entry)
+        self._reindex()
+        self._changed()
+
+    def _reindex(self):
+        self.index = {}
+        for entry in self.entries:
+            self.index.setdefault(entry['name'], entry)
+
+    def _find_slot(self, entry):
+        for offset, _ in _chain(self, self.geometry, self.geometry.dir_track, self.geometry.dir_sector):
+            sector = self.read_sector(offset)
+            for slot in range(8):
+                e = slot * 32
+                if sector[e + 2] and (sector[e + 3], sector[e + 4]) == (entry['track'], entry['sector']):
+                    return offset + e
+        raise ValueError(f"No directory slot for {entry['name']}")
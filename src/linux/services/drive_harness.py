@@ -0,0 +1,319 @@
+import argparse
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from bridge_harness import LoopbackFpga
+from fpga_interface import DRV_OPEN, DRV_CLOSE, DRV_LOAD, DRV_SAVE, DRV_READ, DRV_WRITE
+from virtual_drive_service import VirtualDriveService, ST_EOI
+from directory_cache import DirectoryCache
+from disk_image import MountedImage, blank_disk, read_disk_directory, read_disk_file
+
+# Loopback harness for VirtualDriveService: the FPGA drive mailbox and C64
+# RAM are simulated (LoopbackFpga models the REU DMA), so LOAD/SAVE/OPEN can
+# be exercised and timed on any Linux machine.
+#
+#   python drive_harness.py               # 200-block LOAD, directory, SAVE and channel I/O
+#   python drive_harness.py --blocks 600  # size of the program to load
+#   python drive_harness.py --listing 2000   # LOAD"$" on a 2000-file directory, cached vs uncached
+#   python drive_harness.py --image D81   # only the mounted image checks, for one format
+
+DEVICE = 10
+IEC_RATE = 400         # Bytes/s of a stock 1541 LOAD
+JIFFYDOS_RATE = 4000   # Bytes/s with JiffyDOS on both ends
+
+class MailboxFpga(LoopbackFpga):
+    """LoopbackFpga with the drive mailbox; command() plays the C64's KERNAL hook"""
+    def __init__(self):
+        super().__init__()
+        self.pending = None
+        self.reply = None
+        self.mailbox = threading.Condition()
+
+    def read_drive_command(self):
+        with self.mailbox:
+            return self.pending
+
+    def complete_drive_command(self, error=0, status=0, end_address=0, data=b""):
+        with self.mailbox:
+            self.pending = None
+            self.reply = {'error': error, 'status': status, 'end': end_address, 'data': bytes(data)}
+            self.mailbox.notify_all()
+
+    def command(self, code, secondary=0, name=b"", address=0, end=0, device=DEVICE, timeout=5.0):
+        with self.mailbox:
+            self.reply = None
+            self.pending = {'code': code, 'device': device, 'secondary': secondary,
+                            'address': address, 'end': end, 'data': name}
+            if not self.mailbox.wait_for(lambda: self.reply is not None, timeout):
+                raise TimeoutError(f"No reply to drive command {code}")
+            return self.reply
+
+def start_service(fpga, path):
+    config = {'drives': [{'device_id': DEVICE, 'type': 'local', 'path': path}]}
+    service = VirtualDriveService(fpga=fpga, config=config)
+    thread = threading.Thread(target=service.run, daemon=True)
+    thread.start()
+    return service, thread
+
+def load_program(blocks=200, load_address=0x0801):
+    """LOAD"GAME",10,1 of a `blocks`-block PRG. Returns (seconds, end address, intact)."""
+    size = blocks * 254 - 2
+    program = bytes((i * 13) & 0xFF for i in range(size))
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, 'game.prg'), 'wb') as f:
+            f.write(struct.pack('<H', load_address) + program)
+        fpga = MailboxFpga()
+        service, thread = start_service(fpga, directory)
+        start = time.perf_counter()
+        reply = fpga.command(DRV_LOAD, 1, b"GAME")
+        elapsed = time.perf_counter() - start
+        service.stop()
+        thread.join()
+    intact = reply['error'] == 0 and fpga.ram[load_address:load_address + size] == program
+    return elapsed, reply['end'], intact
+
+def round_trip():
+    """Directory, SAVE, channel read/write and the command channel. Returns a list of (check, ok)."""
+    checks = []
+    with tempfile.TemporaryDirectory() as directory:
+        fpga = MailboxFpga()
+        service, thread = start_service(fpga, directory)
+
+        fpga.ram[0x0801:0x0811] = bytes(range(16))
+        reply = fpga.command(DRV_SAVE, 0, b"TEST", 0x0801, 0x0811)
+        with open(os.path.join(directory, 'test.prg'), 'rb') as f:
+            checks.append(("SAVE", reply['error'] == 0 and f.read() == b"\x01\x08" + bytes(range(16))))
+        fpga.command(DRV_SAVE, 0, b"TEST", 0x0801, 0x0811)
+        status = fpga.command(DRV_READ, 15)['data']
+        checks.append(("SAVE over existing file refused", status.startswith(b"63,")))
+
+        reply = fpga.command(DRV_LOAD, 0, b"$", 0x0801)
+        listing = bytes(fpga.ram[0x0801:reply['end']])
+        checks.append(('LOAD"$"', reply['error'] == 0 and b'"TEST.PRG"' in listing))
+
+        reply = fpga.command(DRV_LOAD, 0, b"T*", 0x1000)
+        checks.append(("LOAD with pattern, relocated", reply['end'] == 0x1010 and fpga.ram[0x1000:0x1010] == bytes(range(16))))
+
+        # A program on the C64 owns the REU: its registers and the staging area survive a LOAD
+        staging = service.reu_size - 0x10000
+        fpga.reu[staging:staging + 16] = b"GEOS RAM DISK..."
+        for reg in range(2, 9):
+            fpga.reu_regs[reg] = 0x10 + reg
+        fpga.command(DRV_LOAD, 0, b"TEST", 0x0801)
+        checks.append(("REU staging area and registers preserved", fpga.reu[staging:staging + 16] == b"GEOS RAM DISK..."
+                       and fpga.reu_regs[2:9] == bytearray(0x10 + reg for reg in range(2, 9))))
+
+        fpga.command(DRV_OPEN, 2, b"NOTES,S,W")
+        fpga.command(DRV_WRITE, 2, b"HELLO\r" * 100)
+        fpga.command(DRV_CLOSE, 2)
+        fpga.command(DRV_OPEN, 3, b"NOTES,S,R")
+        data = b""
+        while True:
+            reply = fpga.command(DRV_READ, 3)
+            data += reply['data']
+            if reply['error'] or reply['status'] & ST_EOI:
+                break
+        fpga.command(DRV_CLOSE, 3)
+        checks.append(("Sequential write/read", data == b"HELLO\r" * 100))
+
+        fpga.command(DRV_OPEN, 15, b"S:NOTES*")
+        status = fpga.command(DRV_READ, 15)['data']
+        checks.append(("Scratch", status.startswith(b"01,") and not os.path.exists(os.path.join(directory, 'notes.seq'))))
+
+        reply = fpga.command(DRV_LOAD, 0, b"MISSING", 0x0801)
+        checks.append(("FILE NOT FOUND", reply['error'] == 4))
+        reply = fpga.command(DRV_LOAD, 1, b"TEST", device=DEVICE + 1)
+        checks.append(("DEVICE NOT PRESENT", reply['error'] == 5))
+
+        service.stop()
+        thread.join()
+    return checks
+
+def image_round_trip(fmt="D64", blocks=200):
+    """
+    SAVE/LOAD/scratch on a blank image mounted with CD, then the image file is
+    checked with the stateless parser. Returns (checks, seconds for the LOAD).
+    """
+    checks = []
+    program = bytes((i * 7) & 0xFF for i in range(blocks * 254 - 2))
+    with tempfile.TemporaryDirectory() as directory:
+        image_path = os.path.join(directory, f'disk.{fmt.lower()}')
+        with open(image_path, 'wb') as f:
+            f.write(blank_disk(fmt, "HARNESS", "HT"))
+        fpga = MailboxFpga()
+        service, thread = start_service(fpga, directory)
+
+        fpga.command(DRV_OPEN, 15, f"CD:DISK.{fmt}".encode())
+        status = fpga.command(DRV_READ, 15)['data']
+        image = service.drives[DEVICE].get('image')
+        checks.append((f"{fmt}: CD mounts the image", status.startswith(b"00,") and image is not None))
+        if image is None:
+            service.stop()
+            thread.join()
+            return checks, 0
+        free = image.blocks_free()
+
+        fpga.ram[0x0801:0x0801 + len(program)] = program
+        fpga.command(DRV_SAVE, 0, b"GAME", 0x0801, 0x0801 + len(program))
+        fpga.ram[0xC000:0xC100] = bytes(range(256))
+        fpga.command(DRV_SAVE, 0, b"TOOL", 0xC000, 0xC100)
+        fpga.command(DRV_OPEN, 2, b"NOTES,S,W")
+        fpga.command(DRV_WRITE, 2, b"HELLO\r" * 100)
+        fpga.command(DRV_CLOSE, 2)
+        checks.append((f"{fmt}: SAVE", fpga.command(DRV_READ, 15)['data'].startswith(b"00,")
+                       and image.blocks_free() == free - blocks - 2 - 3))
+
+        reply = fpga.command(DRV_LOAD, 0, b"$", 0x0801)
+        listing = bytes(fpga.ram[0x0801:reply['end']])
+        checks.append((f'{fmt}: LOAD"$"', b'"HARNESS' in listing and b'"GAME"' in listing
+                       and struct.pack('<H', image.blocks_free()) + b'BLOCKS FREE.' in listing))
+
+        fpga.ram[0x0801:0x0801 + len(program)] = bytes(len(program))
+        start = time.perf_counter()
+        reply = fpga.command(DRV_LOAD, 1, b"GAME")
+        elapsed = time.perf_counter() - start
+        checks.append((f"{fmt}: LOAD", reply['end'] == 0x0801 + len(program)
+                       and fpga.ram[0x0801:0x0801 + len(program)] == program))
+        reply = fpga.command(DRV_LOAD, 0, b"T?OL", 0x2000)
+        checks.append((f"{fmt}: LOAD with pattern", fpga.ram[0x2000:0x2100] == bytes(range(256))))
+
+        fpga.command(DRV_SAVE, 0, b"TOOL", 0xC000, 0xC100)
+        status = fpga.command(DRV_READ, 15)['data']
+        fpga.ram[0xC000:0xC010] = b"REPLACED" * 2
+        position = [e['name'] for e in image.entries].index("TOOL")
+        before = image.blocks_free()
+        fpga.command(DRV_SAVE, 0, b"@0:TOOL", 0xC000, 0xC010)
+        replaced = (fpga.command(DRV_LOAD, 1, b"TOOL")['end'] == 0xC010
+                    and [e['name'] for e in image.entries].index("TOOL") == position
+                    and image.blocks_free() == before + 2 - 1)
+        checks.append((f"{fmt}: SAVE over existing refused, @ replaces", status.startswith(b"63,") and replaced))
+
+        fpga.command(DRV_OPEN, 15, b"S:NOTES")
+        status = fpga.command(DRV_READ, 15)['data']
+        checks.append((f"{fmt}: Scratch", status.startswith(b"01,FILES SCRATCHED,01")
+                       and image.blocks_free() == free - blocks - 1))
+
+        for i in range(16):
+            fpga.command(DRV_SAVE, 0, b"HUGE%d" % i, 0x0000, 0xFFFF)
+            status = fpga.command(DRV_READ, 15)['data']
+            if not status.startswith(b"00,"):
+                break
+        checks.append((f"{fmt}: DISK FULL", status.startswith(b"72,") and image.blocks_free() < 258))
+        free = image.blocks_free()
+
+        fpga.command(DRV_SAVE, 0, b"@0:TOOL", 0x0000, 0xFFFF)
+        status = fpga.command(DRV_READ, 15)['data']
+        kept = fpga.command(DRV_LOAD, 1, b"TOOL")['end'] == 0xC010 and fpga.ram[0xC000:0xC010] == b"REPLACED" * 2
+        checks.append((f"{fmt}: @ on a full disk keeps the old file", status.startswith(b"72,") and kept
+                       and image.blocks_free() == free))
+
+        fpga.command(DRV_OPEN, 15, b"CD..")
+        closed = 'image' not in service.drives[DEVICE] and image.mm is None
+        service.stop()
+        thread.join()
+
+        # What was written back, read with the stateless parser
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        _, _, entries = read_disk_directory(data)
+        files = {e['name']: read_disk_file(data, e['track'], e['sector']) for e in entries}
+        checks.append((f"{fmt}: CD.. writes the image back", closed
+                       and files.get("GAME") == b"\x01\x08" + program
+                       and files.get("TOOL") == b"\x00\xc0" + b"REPLACED" * 2 and "NOTES" not in files))
+        mounted_again = MountedImage(image_path, read_only=True)
+        checks.append((f"{fmt}: BAM written back", mounted_again.blocks_free() == free))
+        mounted_again.close()
+    return checks, elapsed
+
+def uncached_listing(path):
+    """The listing as it was built before the cache: listdir plus two stat calls per name"""
+    lines = []
+    for f in os.listdir(path):
+        full = os.path.join(path, f)
+        lines.append(f'{os.path.getsize(full) // 254:<4} "{f}" {"DIR" if os.path.isdir(full) else "PRG"}')
+    return "\r".join(lines)
+
+def directory_loads(files=2000, repeats=20):
+    """
+    LOAD"$" timings on a directory of `files` files. Returns a dict of seconds
+    per listing and whether changes showed up in each invalidation mode.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(files):
+            with open(os.path.join(directory, f'game{i:04d}.prg'), 'wb') as f:
+                f.write(b"\x01\x08" + bytes(i % 700))
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            uncached_listing(directory)
+        results['uncached'] = (time.perf_counter() - start) / repeats
+
+        for mode in ('inotify', 'mtime', 'remote'):
+            fpga = MailboxFpga()
+            service, thread = start_service(fpga, directory)
+            if mode == 'mtime' and service.dir_cache.inotify:
+                service.dir_cache.inotify.close()
+                service.dir_cache.inotify = None
+            elif mode == 'remote':
+                service.dir_cache.refresh_interval = 0.2
+                service.dir_cache.add_remote(directory)
+            start = time.perf_counter()
+            fpga.command(DRV_LOAD, 0, b"$", 0x0801)
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(repeats):
+                fpga.command(DRV_LOAD, 0, b"$", 0x0801)
+            warm = (time.perf_counter() - start) / repeats
+
+            name = f'new{mode}.prg'
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(b"\x01\x08")
+            if mode == 'remote':
+                time.sleep(0.5) # Next background refresh
+            reply = fpga.command(DRV_LOAD, 0, b"$", 0x0801)
+            seen = name.upper().encode() in bytes(fpga.ram[0x0801:reply['end']])
+            results[mode] = (cold, warm, seen, service.dir_cache.hits, service.dir_cache.misses)
+            service.stop()
+            thread.join()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Virtual drive loopback harness')
+    parser.add_argument('--blocks', type=int, default=200, help='Size of the program for the LOAD test')
+    parser.add_argument('--listing', type=int, metavar='FILES', help='Only run the directory listing test')
+    parser.add_argument('--image', choices=('D64', 'D71', 'D81'), help='Only run the mounted image checks')
+    args = parser.parse_args()
+
+    if args.listing:
+        results = directory_loads(args.listing)
+        print(f"Uncached listing of {args.listing} files: {results['uncached'] * 1000:.2f} ms")
+        for mode in ('inotify', 'mtime', 'remote'):
+            cold, warm, seen, hits, misses = results[mode]
+            print(f"LOAD\"$\" ({mode}): first {cold * 1000:.2f} ms, repeated {warm * 1000:.3f} ms, "
+                  f"new file {'listed' if seen else 'MISSING'} ({hits} hits, {misses} scans)")
+        return
+
+    if args.image:
+        formats = [args.image]
+    else:
+        formats = ['D64', 'D71', 'D81']
+        for check, ok in round_trip():
+            print(f"{check}: {'ok' if ok else 'FAILED'}")
+    for fmt in formats:
+        checks, elapsed = image_round_trip(fmt, args.blocks)
+        for check, ok in checks:
+            print(f"{check}: {'ok' if ok else 'FAILED'}")
+        print(f"{fmt}: LOAD of {args.blocks} blocks from the image: {elapsed * 1000:.1f} ms")
+    if args.image:
+        return
+    elapsed, end, intact = load_program(args.blocks)
+    size = args.blocks * 254
+    print(f"LOAD of {args.blocks} blocks: {elapsed * 1000:.1f} ms (end ${end:04X}), "
+          f"{'intact' if intact else 'CORRUPT'}; stock IEC {size / IEC_RATE:.0f}s, JiffyDOS {size / JIFFYDOS_RATE:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,26 @@ UART_RX_FIFO_STATUS = 0x00010004 # Read to check if we can write (Full/Empty)
 UART_TX_FIFO_DATA = 0x00010008  # Read here to get data FROM C64
 UART_TX_FIFO_STATUS = 0x0001000C # Read to check if there is data (Valid/Empty)
 
+# Virtual drive mailbox (hypothetical, like the offsets above). The C64-side
+# KERNAL hook fills in a command for a virtual device and waits; Linux
+# answers and writes DRV_DONE to let the C64 continue.
+DRV_CMD_STATUS    = 0x00030000 # Bit 0: command pending
+DRV_CMD_CODE      = 0x00030004 # DRV_OPEN .. DRV_WRITE
+DRV_CMD_DEVICE    = 0x00030008
+DRV_CMD_SECONDARY = 0x0003000C
+DRV_CMD_ADDRESS   = 0x00030010 # LOAD: target if secondary is 0; SAVE: start
+DRV_CMD_END       = 0x00030014 # SAVE: end address (exclusive)
+DRV_CMD_LENGTH    = 0x00030018 # Bytes in DRV_BUFFER (file name, or data for WRITE)
+DRV_REPLY_ERROR   = 0x00030020 # KERNAL error number (0 = OK, 4 = FILE NOT FOUND, ...)
+DRV_REPLY_ST      = 0x00030024 # Value for the status byte ST ($90)
+DRV_REPLY_END     = 0x00030028 # LOAD: end address returned in X/Y
+DRV_REPLY_LENGTH  = 0x0003002C # READ: bytes placed in DRV_BUFFER
+DRV_DONE          = 0x00030030 # Write 1 when the reply is complete
+DRV_BUFFER        = 0x00030100 # File name or channel data
+DRV_BUFFER_SIZE   = 256
+
+DRV_OPEN, DRV_CLOSE, DRV_LOAD, DRV_SAVE, DRV_READ, DRV_WRITE = range(1, 7)
+
 class FpgaInterface:
     def __init__(self):
         self.mem = None
@@ -59,14 +79,84 @@ class FpgaInterface:
         if self.mem:
             # Check if data is valid (Bit 0 of status)
             status = struct.unpack('<I', self.mem[UART_TX_FIFO_STATUS:UART_TX_FIFO_STATUS+4])[0]
-           self.mem_heavy:
-            self.mem_heavy.close()
-        if  if status & 0x01: # Assuming bit 0 is VALID/NOT EMPTY
+            if status & 0x01: # Assuming bit 0 is VALID/NOT EMPTY
                 data = struct.unpack('<I', self.mem[UART_TX_FIFO_DATA:UART_TX_FIFO_DATA+4])[0]
                 return data & 0xFF
         return None
 
+    def read_tx_burst(self, max_bytes=256):
+        """Read up to max_bytes FROM the C64, stopping when the TX FIFO is empty"""
+        if not self.mem:
+            return b""
+        mem = self.mem
+        data = bytearray()
+        while len(data) < max_bytes:
+            if not struct.unpack_from('<I', mem, UART_TX_FIFO_STATUS)[0] & 0x01:
+                break
+            data.append(struct.unpack_from('<I', mem, UART_TX_FIFO_DATA)[0] & 0xFF)
+        return bytes(data)
+
+    def write_rx_burst(self, data):
+        """Send bytes TO the C64 until the RX FIFO is full. Returns the number written."""
+        if not self.mem:
+            return 0
+        mem = self.mem
+        count = 0
+        for byte in data:
+            if struct.unpack_from('<I', mem, UART_RX_FIFO_STATUS)[0] & 0x01:
+                break
+            struct.pack_into('<I', mem, UART_RX_FIFO_DATA, byte)
+            count += 1
+        return count
+
+    def open_fifo_irq(self, device):
+        """
+        Open the UART FIFO interrupt as a UIO device (e.g. /dev/uio0) so callers
+        can select() on it instead of polling. Returns the fd, or None.
+        """
+        if not device:
+            return None
+        try:
+            fd = os.open(device, os.O_RDWR | os.O_NONBLOCK)
+            os.write(fd, struct.pack('<I', 1)) # Enable the interrupt
+            return fd
+        except OSError as e:
+            print(f"[FPGA] Warning: FIFO interrupt {device} unavailable, polling instead. {e}")
+            return None
+
+    def ack_fifo_irq(self, fd):
+        """Consume a UIO interrupt event and re-enable the interrupt"""
+        try:
+            os.read(fd, 4)
+            os.write(fd, struct.pack('<I', 1))
+        except OSError:
+            pass
+
+    def read_drive_command(self):
+        """The pending virtual drive command as a dict, or None"""
+        if not self.mem:
+            return None
+        mem = self.mem
+        if not struct.unpack_from('<I', mem, DRV_CMD_STATUS)[0] & 0x01:
+            return None
+        code, device, secondary, address, end, length = struct.unpack_from('<6I', mem, DRV_CMD_CODE)
+        length = min(length, DRV_BUFFER_SIZE)
+        return {'code': code, 'device': device, 'secondary': secondary, 'address': address & 0xFFFF,
+                'end': end & 0x1FFFF, 'data': bytes(mem[DRV_BUFFER:DRV_BUFFER + length])}
+
+    def complete_drive_command(self, error=0, status=0, end_address=0, data=b""):
+        """Answer the pending drive command and release the C64"""
+        if not self.mem:
+            return
+        mem = self.mem
+        data = data[:DRV_BUFFER_SIZE]
+        mem[DRV_BUFFER:DRV_BUFFER + len(data)] = data
+        struct.pack_into('<4I', mem, DRV_REPLY_ERROR, error, status, end_address, len(data))
+        struct.pack_into('<I', mem, DRV_DONE, 1)
+
     def close(self):
+        if self.mem_heavy:
+            self.mem_heavy.close()
         if self.mem:
             self.mem.close()
         if hasattr(self, 'fd'):
@@ -111,7 +201,17 @@ class FpgaInterface:
         
         # Setup Command
         self.mem[DBG_CMD_TYPE:DBG_CMD_TYPE+4] = struct.pack('<I', 1) # Write
-        self.mem[DBG_CMD_ADDR:DBG"""
+        self.mem[DBG_CMD_ADDR:DBG_CMD_ADDR+4] = struct.pack('<I', address)
+        self.mem[DBG_CMD_WDATA:DBG_CMD_WDATA+4] = struct.pack('<I', data & 0xFF)
+        
+        # Trigger
+        self.mem[DBG_CMD_VALID:DBG_CMD_VALID+4] = struct.pack('<I', 1)
+        self.mem[DBG_CMD_VALID:DBG_CMD_VALID+4] = struct.pack('<I', 0)
+        
+        self.debug_wait_done()
+
+    def read_block(self, address, length):
+        """Read a block of memory"""
         # Use Heavyweight bridge if available and address is within range
         if self.mem_heavy and address < HPS2FPGA_SPAN:
             if address + length <= HPS2FPGA_SPAN:
@@ -133,15 +233,5 @@ class FpgaInterface:
                 return
 
         # Fallback to slow poke
-
-    def read_block(self, address, length):
-        """Read a block of memory (Slow byte-by-byte for now)"""
-        data = bytearray(length)
-        for i in range(length):
-            data[i] = self.peek(address + i)
-        return data
-
-    def write_block(self, address, data):
-        """Write a block of memory"""
         for i, byte in enumerate(data):
             self.poke(address + i, byte)
@@ -1,26 +1,56 @@
 import sqlite3
 import os
 import json
+import hashlib
+import shutil
 import logging
-from datetime import datetime
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '../../data/library.db')
 STORAGE_PATH = os.path.join(os.path.dirname(__file__), '../../data/storage')
+# Seconds a connection waits for a lock. The enrichment workers hold write
+# transactions (BEGIN IMMEDIATE) on this database; sqlite's default 5 s is
+# not enough while they, a scan and the TOSEC import all write.
+BUSY_TIMEOUT = 30
+
+# Columns carried through export/import. id and file_path are local to one
+# library; content_hash is what ties a record to its file across systems.
+METADATA_COLUMNS = (
+    'title', 'filename', 'file_size', 'file_type', 'year', 'publisher',
+    'developer', 'genre', 'sub_genre', 'description', 'ai_summary', 'ai_tags',
+    'tosec_id', 'added_date', 'play_count', 'favorite'
+)
+
+def content_hash(data):
+    """SHA-1 of the file contents. Doubles as the storage key and the TOSEC match key."""
+    return hashlib.sha1(data).hexdigest()
+
+def blob_relpath(digest):
+    """Sharded location of a blob inside storage: ab/abcdef..."""
+    return os.path.join(digest[:2], digest)
+
+def like_escape(text):
+    """Escape LIKE's own wildcards so user text matches literally (use with ESCAPE '\\')"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
 class LibraryDatabase:
-    def __init__(self):
+    def __init__(self, db_path=DB_PATH, storage_path=STORAGE_PATH):
         self.logger = logging.getLogger("LibraryDB")
+        self.db_path = db_path
+        self.storage_path = storage_path
         self._ensure_paths()
         self._init_db()
 
     def _ensure_paths(self):
-        if not os.path.exists(os.path.dirname(DB_PATH)):
-            os.makedirs(os.path.dirname(DB_PATH))
-        if not os.path.exists(STORAGE_PATH):
-            os.makedirs(STORAGE_PATH)
+        if not os.path.exists(os.path.dirname(self.db_path)):
+            os.makedirs(os.path.dirname(self.db_path))
+        if not os.path.exists(self.storage_path):
+            os.makedirs(self.storage_path)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
 
     def _init_db(self):
-        conn = sqlite3.connect(DB_PATH)
+        conn = self._connect()
         c = conn.cursor()
         
         # Main Items Table
@@ -42,65 +72,339 @@ class LibraryDatabase:
             tosec_id TEXT,
             added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             play_count INTEGER DEFAULT 0,
-            favorite BOOLEAN DEFAULT 0
+            favorite BOOLEAN DEFAULT 0,
+            content_hash TEXT -- SHA-1 of the file, key into blobs
+        )''')
+
+        # Databases created before content-addressed storage lack the hash column
+        columns = [r[1] for r in c.execute("PRAGMA table_info(items)")]
+        needs_migration = 'content_hash' not in columns
+        if needs_migration:
+            c.execute("ALTER TABLE items ADD COLUMN content_hash TEXT")
+
+        # Duplicate detection on ingest is a lookup on this index
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_items_content_hash ON items(content_hash)")
+
+        # Content-addressed blobs in data/storage/<ab>/<hash>.
+        # The unique hash index gives every blob exactly one owning row, so a
+        # blob lives exactly as long as its item. (Databases from before this
+        # keep an unused ref_count column.)
+        c.execute('''CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL
         )''')
         
+        # Files inside disk/tape images (D64/D71/D81/T64), filled at ingest so
+        # listing, searching and extracting never have to reparse the image.
+        c.execute('''CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL REFERENCES items(id),
+            position INTEGER NOT NULL, -- order in the image directory
+            name TEXT NOT NULL,
+            raw_name BLOB, -- PETSCII as stored in the image
+            file_type TEXT, -- PRG, SEQ, USR, REL, DEL
+            blocks INTEGER,
+            track INTEGER, -- first track/sector (disk images)
+            sector INTEGER,
+            data_offset INTEGER, -- payload offset/size (tape images)
+            data_size INTEGER,
+            load_address INTEGER
+        )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_entries_item ON entries(item_id, position)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_entries_name ON entries(name COLLATE NOCASE)")
+
         # Categories/Tags mapping (Optional normalization, but keeping simple for now)
         
         conn.commit()
         conn.close()
 
+        if needs_migration:
+            self.migrate_storage()
+
+    # --------------------------------------------------------------------------
+    # Content-addressed storage
+    # --------------------------------------------------------------------------
+    def blob_path(self, digest):
+        return os.path.join(self.storage_path, blob_relpath(digest))
+
+    def get_item_path(self, item):
+        """Absolute path of an item's file (item is a dict from get_item)"""
+        return os.path.join(self.storage_path, item['file_path'])
+
+    def has_blob(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def _write_blob(self, digest, file_data):
+        """Write a blob unless an identical one is already on disk"""
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return False
+        shard = os.path.dirname(path)
+        if not os.path.exists(shard):
+            os.makedirs(shard, exist_ok=True)
+        # Write to a temp name first so a crash never leaves a truncated blob
+        # under its final (trusted) name.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(file_data)
+        os.replace(tmp_path, path)
+        return True
+
+    def _add_blob(self, c, digest, size):
+        c.execute("INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)", (digest, size))
+
+    def find_by_hash(self, digest):
+        """Return the item id holding this content, or None"""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("SELECT id FROM items WHERE content_hash = ?", (digest,))
+        row = c.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def migrate_storage(self):
+        """Move files stored under the old <timestamp>_<title> scheme into content-addressed storage"""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("SELECT id, file_path FROM items WHERE content_hash IS NULL")
+        rows = c.fetchall()
+        migrated = 0
+        for item_id, rel_path in rows:
+            legacy_path = os.path.join(self.storage_path, rel_path)
+            if not os.path.isfile(legacy_path):
+                continue
+            with open(legacy_path, 'rb') as f:
+                data = f.read()
+            digest = content_hash(data)
+            c.execute("SELECT id FROM items WHERE content_hash = ?", (digest,))
+            if c.fetchone():
+                # Legacy duplicate: keep its own file, the unique index allows one owner per hash
+                self.logger.warning(f"Item {item_id} duplicates existing content {digest}, left unmigrated")
+                continue
+            self._write_blob(digest, data)
+            self._add_blob(c, digest, len(data))
+            c.execute("UPDATE items SET content_hash = ?, file_path = ? WHERE id = ?",
+                      (digest, blob_relpath(digest), item_id))
+            conn.commit()
+            os.remove(legacy_path)
+            migrated += 1
+        conn.close()
+        if migrated:
+            self.logger.info(f"Migrated {migrated} items to content-addressed storage")
+        return migrated
+
     def add_item(self, metadata, file_data):
         """
         metadata: dict containing title, year, etc.
         file_data: binary content
+
+        Identical content is stored once: if the hash is already in the
+        library the existing item id is returned and nothing is written.
         """
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Generate safe filename/storage path
-        # Using timestamp + safe title to avoid collisions
+        digest = content_hash(file_data)
+        existing = self.find_by_hash(digest)
+        if existing:
+            self.logger.info(f"Duplicate content {digest}, already stored as item {existing}")
+            # Metadata may have been imported before the file arrived
+            self._write_blob(digest, file_data)
+            return existing
+
         safe_title = "".join([c for c in metadata.get('title', 'unknown') if c.isalnum() or c in (' ', '-', '_')]).strip()
-        storage_filename = f"{int(datetime.now().timestamp())}_{safe_title}.{metadata.get('extension', 'prg')}"
-        full_path = os.path.join(STORAGE_PATH, storage_filename)
         
-        # Write file
+        # Write file (no-op if the blob is already on disk from an earlier import)
         try:
-            with open(full_path, 'wb') as f:
-                f.write(file_data)
+            self._write_blob(digest, file_data)
         except Exception as e:
             self.logger.error(f"Failed to write file: {e}")
             return None
 
+        conn = self._connect()
+        c = conn.cursor()
+
         # Insert DB Record
         try:
             c.execute('''INSERT INTO items (
                 title, filename, file_path, file_size, file_type, 
-                year, publisher, genre, description, ai_tags
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
+                year, publisher, genre, description, ai_tags, tosec_id, content_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
                 metadata.get('title'),
                 metadata.get('filename', safe_title),
-                storage_filename, # Store relative path
+                blob_relpath(digest), # Store relative path
                 len(file_data),
                 metadata.get('file_type', 'PRG'),
                 metadata.get('year'),
                 metadata.get('publisher'),
                 metadata.get('genre'),
                 metadata.get('description'),
-                json.dumps(metadata.get('tags', []))
+                json.dumps(metadata.get('tags', [])),
+                metadata.get('tosec_id'),
+                digest
             ))
             item_id = c.lastrowid
+            self._add_blob(c, digest, len(file_data))
             conn.commit()
             return item_id
+        except sqlite3.IntegrityError:
+            # Lost a race with a concurrent ingest of the same content
+            conn.rollback()
+            return self.find_by_hash(digest)
         except Exception as e:
             self.logger.error(f"DB Insert failed: {e}")
             return None
         finally:
             conn.close()
 
+    def delete_item(self, item_id):
+        """Remove an item together with its file (each blob has a single owning row)"""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("SELECT content_hash, file_path FROM items WHERE id = ?", (item_id,))
+        row = c.fetchone()
+        if not row:
+            conn.close()
+            return False
+        digest, rel_path = row
+        c.execute("DELETE FROM entries WHERE item_id = ?", (item_id,))
+        c.execute("DELETE FROM items WHERE id = ?", (item_id,))
+        if digest:
+            c.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+        conn.commit()
+        conn.close()
+
+        path = self.blob_path(digest) if digest else os.path.join(self.storage_path, rel_path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def iter_items(self, batch_size=1000, after_id=0):
+        """Stream every item (with an ID above after_id) as a dict from a single cursor"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            c = conn.cursor()
+            c.execute("SELECT * FROM items WHERE id > ? ORDER BY id", (after_id,))
+            while True:
+                rows = c.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+
+    def _link_blob(self, digest, rel_path, source_storage):
+        """
+        Make sure the blob for digest is in local storage.
+        Copies it from source_storage (another library's storage dir) when given.
+        Returns True if the file is present afterwards.
+        """
+        if self.has_blob(digest):
+            return True
+        if not source_storage:
+            return False
+        for candidate in (rel_path, blob_relpath(digest)):
+            if not candidate:
+                continue
+            src = os.path.join(source_storage, candidate)
+            if os.path.isfile(src):
+                dst = self.blob_path(digest)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                tmp_path = f"{dst}.{os.getpid()}.tmp"
+                shutil.copyfile(src, tmp_path)
+                os.replace(tmp_path, dst)
+                return True
+        return False
+
+    def bulk_upsert_items(self, items, batch_size=1000, source_storage=None):
+        """
+        Insert or update many items keyed by content_hash.
+
+        items: iterable of dicts as produced by iter_items (or an export file).
+        Each batch is one transaction. Files are relinked by hash: a blob
+        already in storage is reused, otherwise it is copied from
+        source_storage if that is given. Records whose file cannot be found
+        are still imported and counted as missing. Records that repeat a hash
+        already in the same batch replace that record (the last one wins) and
+        are counted once, as duplicates, instead of as further items.
+        """
+        cols = METADATA_COLUMNS + ('file_path', 'content_hash')
+        placeholders = ", ".join("?" for _ in cols)
+        updates = ", ".join(f"{col} = excluded.{col}" for col in METADATA_COLUMNS)
+        upsert_sql = (f"INSERT INTO items ({', '.join(cols)}) VALUES ({placeholders}) "
+                      f"ON CONFLICT(content_hash) DO UPDATE SET {updates}")
+
+        stats = {'inserted': 0, 'updated': 0, 'missing': 0, 'skipped': 0, 'duplicates': 0}
+        conn = self._connect()
+        c = conn.cursor()
+
+        def flush(batch):
+            hashes = list(batch)
+            known = set()
+            # Stay under SQLite's host parameter limit
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                c.execute(f"SELECT content_hash FROM items WHERE content_hash IN ({', '.join('?' for _ in chunk)})", chunk)
+                known.update(r[0] for r in c.fetchall())
+
+            rows = []
+            new_blobs = []
+            for digest, item in batch.items():
+                row = []
+                for col in METADATA_COLUMNS:
+                    value = item.get(col)
+                    if col == 'ai_tags' and isinstance(value, list):
+                        value = json.dumps(value)
+                    row.append(value)
+                row[METADATA_COLUMNS.index('title')] = item.get('title') or 'unknown'
+                row[METADATA_COLUMNS.index('filename')] = item.get('filename') or item.get('title') or digest
+                row += [blob_relpath(digest), digest]
+                rows.append(row)
+                if digest in known:
+                    stats['updated'] += 1
+                else:
+                    stats['inserted'] += 1
+                    new_blobs.append((digest, item.get('file_size') or 0))
+
+            c.executemany(upsert_sql, rows)
+            c.executemany("INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)", new_blobs)
+            conn.commit()
+
+        try:
+            batch = {}
+            for item in items:
+                digest = item.get('content_hash')
+                if not digest and source_storage and item.get('file_path'):
+                    # Export from a library that predates content hashing
+                    src = os.path.join(source_storage, item['file_path'])
+                    if os.path.isfile(src):
+                        with open(src, 'rb') as f:
+                            digest = content_hash(f.read())
+                if not digest:
+                    stats['skipped'] += 1
+                    continue
+
+                if digest in batch:
+                    # Same content twice in one batch: the last record wins, counted when flushed
+                    batch[digest] = item
+                    stats['duplicates'] += 1
+                    continue
+                if not self._link_blob(digest, item.get('file_path'), source_storage):
+                    stats['missing'] += 1
+                batch[digest] = item
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = {}
+            if batch:
+                flush(batch)
+        finally:
+            conn.close()
+        return stats
+
     def update_ai_metadata(self, item_id, ai_data):
         """Update record with AI enriched data"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = self._connect()
         c = conn.cursor()
         c.execute('''UPDATE items SET 
             ai_summary = ?, 
@@ -116,7 +420,7 @@ class LibraryDatabase:
         conn.close()
 
     def get_item(self, item_id):
-        conn = sqlite3.connect(DB_PATH)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         c.execute("SELECT * FROM items WHERE id = ?", (item_id,))
@@ -125,7 +429,7 @@ class LibraryDatabase:
         return dict(row) if row else None
 
     def search(self, query=None, genre=None, year=None, favorite=None):
-        conn = sqlite3.connect(DB_PATH)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         
@@ -151,8 +455,74 @@ class LibraryDatabase:
         conn.close()
         return [dict(r) for r in rows]
 
+    def set_entries(self, item_id, entries):
+        """Replace the indexed directory of a disk/tape image item"""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute("DELETE FROM entries WHERE item_id = ?", (item_id,))
+        c.executemany('''INSERT INTO entries (
+            item_id, position, name, raw_name, file_type, blocks,
+            track, sector, data_offset, data_size, load_address
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', [
+            (item_id, pos, e['name'], e.get('raw_name'), e.get('file_type'), e.get('blocks'),
+             e.get('track'), e.get('sector'), e.get('data_offset'), e.get('data_size'), e.get('load_address'))
+            for pos, e in enumerate(entries)
+        ])
+        conn.commit()
+        conn.close()
+
+    def unindexed_images(self, image_types):
+        """IDs of items of the given (upper case) types that have no entries yet"""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute(f'''SELECT id FROM items
+            WHERE UPPER(file_type) IN ({', '.join('?' for _ in image_types)})
+            AND NOT EXISTS (SELECT 1 FROM entries WHERE entries.item_id = items.id)
+            ORDER BY id''', tuple(image_types))
+        rows = c.fetchall()
+        conn.close()
+        return [r[0] for r in rows]
+
+    def list_entries(self, item_id):
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute("SELECT * FROM entries WHERE item_id = ? ORDER BY position", (item_id,))
+        rows = c.fetchall()
+        conn.close()
+        return [dict(r) for r in rows]
+
+    def get_entry(self, entry_id):
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        c.execute("SELECT * FROM entries WHERE id = ?", (entry_id,))
+        row = c.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def search_entries(self, query):
+        """Find programs inside disk/tape images by name"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        c = conn.cursor()
+        # A plain prefix uses the NOCASE name index; otherwise fall back to a substring scan
+        if query.endswith('*') and '*' not in query[:-1]:
+            c.execute('''SELECT e.id, e.item_id, e.name, e.file_type, e.blocks, i.title
+                FROM entries e JOIN items i ON i.id = e.item_id
+                WHERE e.name >= ? COLLATE NOCASE AND e.name < ? COLLATE NOCASE
+                ORDER BY e.name COLLATE NOCASE''', (query[:-1], query[:-1] + '\uffff'))
+        else:
+            c.execute('''SELECT e.id, e.item_id, e.name, e.file_type, e.blocks, i.title
+                FROM entries e JOIN items i ON i.id = e.item_id
+                WHERE e.name LIKE ? ESCAPE '\\'
+                ORDER BY e.name COLLATE NOCASE''', (f"%{like_escape(query)}%",))
+        rows = c.fetchall()
+        conn.close()
+        return [dict(r) for r in rows]
+
     def get_genres(self):
-        conn = sqlite3.connect(DB_PATH)
+        conn = self._connect()
         c = conn.cursor()
         c.execute("SELECT DISTINCT genre FROM items WHERE genre IS NOT NULL ORDER BY genre")
         rows = c.fetchall()
@@ -1,63 +1,147 @@
 import os
 import logging
 import json
-from library_db import LibraryDatabase
+from library_db import LibraryDatabase, content_hash
 from ai_enricher import AiEnricher
+from dat_index import DatIndex
+from disk_image import IMAGE_TYPES, read_directory, read_entry
 from fpga_interface import FpgaInterface
+from name_index import NameIndex
 
 class LibraryManager:
-    def __init__(self):
-        self.db = LibraryDatabase()
+    def __init__(self, db=None):
+        self.db = db or LibraryDatabase()
         self.ai = AiEnricher(self.db)
+        self.dat = DatIndex(self.db.db_path)
         self.fpga = FpgaInterface()
+        self.names = NameIndex()
         self.logger = logging.getLogger("LibraryManager")
 
     def export_library_to_json(self, json_path):
-        """Export entire library metadata to a JSON file"""
+        """
+        Export entire library metadata to a JSON file.
+        Items are streamed from one cursor and written as they are read.
+        A .jsonl path produces JSON Lines (one item per line), anything else
+        a JSON array.
+        """
+        json_lines = json_path.endswith('.jsonl')
         try:
-            items = self.db.search() # Get all items
-            # Fetch full details for each
-            full_items = []
-            for item in items:
-                full_details = self.db.get_item(item['id'])
-                # Convert row to dict if needed (already dict from get_item)
-                full_items.append(full_details)
-            
+            count = 0
             with open(json_path, 'w') as f:
-                json.dump(full_items, f, indent=4, default=str)
+                if not json_lines:
+                    f.write("[\n")
+                for item in self.db.iter_items():
+                    if json_lines:
+                        f.write(json.dumps(item, default=str))
+                        f.write("\n")
+                    else:
+                        if count:
+                            f.write(",\n")
+                        f.write(json.dumps(item, indent=4, default=str))
+                    count += 1
+                if not json_lines:
+                    f.write("\n]\n")
             
-            self.logger.info(f"Exported {len(full_items)} items to {json_path}")
+            self.logger.info(f"Exported {count} items to {json_path}")
             return True
         except Exception as e:
             self.logger.error(f"Export failed: {e}")
             return False
 
-    def import_library_from_json(self, json_path):
-        """Import library metadata from a JSON file"""
+    def _read_export(self, f):
+        """Yield items from a JSON array or JSON Lines export"""
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == '[':
+            # Plain JSON has to be parsed whole
+            for item in json.loads(first + f.read()):
+                yield item
+            return
+        line = first + f.readline()
+        while line:
+            if line.strip():
+                yield json.loads(line)
+            line = f.readline()
+
+    def import_library_from_json(self, json_path, storage_dir=None):
+        """
+        Import library metadata from a JSON or JSON Lines export.
+        Records are upserted by content hash in batched transactions. Files
+        already in local storage are relinked; storage_dir points at the
+        exporting system's data/storage to copy in any that are missing.
+        """
         try:
             with open(json_path, 'r') as f:
-                items = json.load(f)
+                stats = self.db.bulk_upsert_items(self._read_export(f), source_storage=storage_dir)
+            self.names.clear() # Titles of existing items may have changed
+            # Imported disk/tape images get their directories indexed like ingested ones
+            for item_id in self.db.unindexed_images(IMAGE_TYPES):
+                item = self.db.get_item(item_id)
+                if item['content_hash'] and self.db.has_blob(item['content_hash']):
+                    self.index_item_contents(item_id)
             
-            count = 0
-            for item in items:
-                # Check if file exists
-                # If importing from another system, file paths might be wrong.
-                # For now, assume paths are relative or fixed up manually.
-                # Or just insert metadata and hope file is there.
-                
-                # We use add_item but bypass file writing if we just want to update DB
-                # But add_item expects file_data.
-                # We might need a direct DB insert method for restore.
-                # For now, let's just log.
-                self.logger.info(f"Importing {item.get('title')}...")
-                count += 1
-                
-            self.logger.info(f"Imported {count} items (Mock implementation)")
+            self.logger.info(f"Imported {stats['inserted']} new / {stats['updated']} updated items from {json_path} "
+                             f"({stats['missing']} without files, {stats['skipped']} skipped, "
+                             f"{stats['duplicates']} duplicate records)")
             return True
         except Exception as e:
             self.logger.error(f"Import failed: {e}")
             return False
 
+    def import_dat(self, dat_path):
+        """Load a TOSEC/No-Intro DAT into the identification index"""
+        try:
+            return self.dat.import_dat(dat_path)
+        except Exception as e:
+            self.logger.error(f"DAT import failed: {e}")
+            return 0
+
+    def identify(self, data, metadata):
+        """
+        Fill in canonical title/year/publisher from the DAT index.
+        DAT values take precedence over user-typed ones; everything else is kept.
+        """
+        match = self.dat.identify(data)
+        if not match:
+            return metadata
+        self.logger.info(f"Identified as '{match['tosec_id']}' ({match['dat_name']})")
+        merged = dict(metadata)
+        for key in ('title', 'year', 'publisher', 'tosec_id'):
+            if match.get(key):
+                merged[key] = match[key]
+        return merged
+
+    def index_item_contents(self, item_id, data=None):
+        """
+        Parse the directory of a disk/tape image item into the entries table.
+        Returns the number of entries, or None if the item is not an image.
+        """
+        item = self.db.get_item(item_id)
+        if not item or (item.get('file_type') or '').upper() not in IMAGE_TYPES:
+            return None
+        try:
+            if data is None:
+                with open(self.db.get_item_path(item), 'rb') as f:
+                    data = f.read()
+            disk_name, disk_id, entries = read_directory(data, item['file_type'].upper())
+        except Exception as e:
+            self.logger.error(f"Could not index contents of item {item_id}: {e}")
+            return None
+        self.db.set_entries(item_id, entries)
+        self.logger.info(f"Indexed {len(entries)} files in '{disk_name}' (item {item_id})")
+        return len(entries)
+
+    def extract_entry(self, entry_id):
+        """Return the bytes of one file inside a disk/tape image, using the indexed location"""
+        entry = self.db.get_entry(entry_id)
+        if not entry:
+            return None
+        item = self.db.get_item(entry['item_id'])
+        with open(self.db.get_item_path(item), 'rb') as f:
+            data = f.read()
+        return read_entry(data, entry)
+
     def ingest_from_ram(self, start_addr=0x0801, end_addr=None, metadata=None):
         """
         Capture running program from C64 RAM and add to library.
@@ -92,9 +176,17 @@ class LibraryManager:
         file_data = load_addr_bytes + data
 
         # 4. Save to DB
+        existing = self.db.find_by_hash(content_hash(file_data))
+        if existing:
+            self.logger.info(f"Capture is identical to item {existing}, not stored again.")
+            return True
+
+        # Identify against the DAT index before anything is queued for the AI
+        metadata = self.identify(file_data, metadata)
         item_id = self.db.add_item(metadata, file_data)
         
         if item_id:
+            self._sync_names()
             self.logger.info(f"Item saved with ID {item_id}. Starting AI enrichment...")
             # 5. Trigger AI
             self.ai.enrich_item_async(item_id, metadata)
@@ -107,15 +199,92 @@ class LibraryManager:
         try:
             with open(source_path, 'rb') as f:
                 data = f.read()
-            
+
+            if 'file_type' not in metadata:
+                ext = os.path.splitext(source_path)[1][1:].upper()
+                metadata = dict(metadata, file_type=ext or 'PRG', extension=ext.lower() or 'prg')
+
+            existing = self.db.find_by_hash(content_hash(data))
+            if existing:
+                self.logger.info(f"{source_path} is already in the library as item {existing}")
+                return True
+
+            metadata = self.identify(data, metadata)
             item_id = self.db.add_item(metadata, data)
             if item_id:
+                self._sync_names()
+                self.index_item_contents(item_id, data)
                 self.ai.enrich_item_async(item_id, metadata)
                 return True
         except Exception as e:
             self.logger.error(f"File ingest failed: {e}")
             return False
 
+    # --------------------------------------------------------------------------
+    # C64 names (LOAD "NAME",10 on the //LIB drive)
+    # --------------------------------------------------------------------------
+    def name_index(self):
+        """The NameIndex, built from the database on first use (and after an import)"""
+        if self.names.stale:
+            self.names.clear()
+            for item in self.db.iter_items():
+                self.names.add(item['id'], item['title'], item['year'], item['genre'])
+            self.names.stale = False
+            self.logger.info(f"Name index built: {len(self.names)} items")
+        return self.names
+
+    def _sync_names(self):
+        """
+        After an add: index every item above last_id: ours, plus any that another
+        process inserted before it, so names stay in ID order. A stale index
+        is left alone; the next name_index() builds it with everything.
+        """
+        if not self.names.stale:
+            self._index_new_items()
+
+    def _index_new_items(self):
+        """Add items inserted by other processes. Returns how many were added."""
+        names = self.name_index()
+        count = 0
+        for item in self.db.iter_items(after_id=names.last_id):
+            names.add(item['id'], item['title'], item['year'], item['genre'])
+            count += 1
+        return count
+
+    def c64_name(self, item):
+        """The name an item (a row from search/get_item) is listed and LOADed under"""
+        name = self.name_index().name_of(item['id'])
+        if name is None and self._index_new_items():
+            name = self.names.name_of(item['id'])
+        return name or item['title']
+
+    def _category_filter(self, parts):
+        """accept(item_id) for the items listed in a //LIB directory, None for all, False for none"""
+        if len(parts) <= 1 or parts[1] == "ALL GAMES":
+            return None # LOAD in the root finds anything in the library
+        attributes = self.names.attributes
+        if parts[1] == "BY YEAR" and len(parts) > 2:
+            return lambda item_id: str(attributes[item_id][0]) == parts[2]
+        if parts[1] == "BY GENRE" and len(parts) > 2:
+            genre = parts[2].upper()
+            return lambda item_id: genre in (attributes[item_id][1] or "").upper()
+        return False
+
+    def resolve_name(self, path, pattern):
+        """
+        Item ID for a C64 file name or CBM DOS pattern in a //LIB directory,
+        from the in-memory name index. None if nothing matches.
+        """
+        names = self.name_index()
+        accept = self._category_filter([p for p in path.split('/') if p])
+        if accept is False:
+            return None
+        item_id = names.match(pattern, accept)
+        # A name nobody has may belong to an item added by another process
+        if item_id is None and names.match(pattern) is None and self._index_new_items():
+            item_id = names.match(pattern, accept)
+        return item_id
+
     def get_virtual_listing(self, path):
         """
         Generates a directory listing for the Virtual Drive based on DB queries.
@@ -136,7 +305,7 @@ class LibraryManager:
         
         if category == "ALL GAMES":
             items = self.db.search()
-            return [("PRG", i['title'], i['id']) for i in items]
+            return [("PRG", self.c64_name(i), i['id']) for i in items]
             
         elif category == "BY YEAR":
             if len(parts) == 2:
@@ -146,7 +315,7 @@ class LibraryManager:
             else:
                 year = parts[2]
                 items = self.db.search(year=year)
-                return [("PRG", i['title'], i['id']) for i in items]
+                return [("PRG", self.c64_name(i), i['id']) for i in items]
 
         elif category == "BY GENRE":
             if len(parts) == 2:
@@ -155,7 +324,7 @@ class LibraryManager:
             else:
                 genre = parts[2]
                 items = self.db.search(genre=genre)
-                return [("PRG", i['title'], i['id']) for i in items]
+                return [("PRG", self.c64_name(i), i['id']) for i in items]
                 
         return []
 
@@ -0,0 +1,132 @@
+import bisect
+import unicodedata
+
+# C64 file names for library items, for LOAD "NAME",10 on the //LIB drive.
+# A name is what the C64 can type and the drive can match: at most 16
+# characters from the unshifted PETSCII range ($20-$5F, i.e. upper case
+# ASCII), without the characters CBM DOS gives a meaning to.
+NAME_LENGTH = 16
+RESERVED = '",:*?'      # Option separators, drive prefix and wildcards
+LEADING = '@$# '        # Replace, directory and direct-access prefixes
+
+def petscii_name(title):
+    """The 16-character C64 name for a title: accents stripped, upper case, reserved characters dropped"""
+    text = unicodedata.normalize('NFKD', title or "").encode('ascii', errors='ignore').decode('ascii').upper()
+    text = "".join(c for c in text if 0x20 <= ord(c) <= 0x5F and c not in RESERVED)
+    text = " ".join(text.split()).lstrip(LEADING)
+    return text[:NAME_LENGTH].rstrip() or "UNTITLED"
+
+def suffixed(name, number):
+    """The number-th name of a group that shares a base name: "ELITE", "ELITE#2", "ELITE#3", ..."""
+    suffix = f"#{number}"
+    return name[:NAME_LENGTH - len(suffix)].rstrip() + suffix
+
+def name_matches(pattern, name):
+    """CBM DOS pattern: '?' matches any character, '*' the rest of the name"""
+    for i, char in enumerate(pattern):
+        if char == '*':
+            return True
+        if i >= len(name) or (char != '?' and char != name[i]):
+            return False
+    return len(pattern) == len(name)
+
+class NameIndex:
+    """
+    Maps C64 names to library item IDs, in memory.
+
+    Names are handed out in item ID order: the first item with a given
+    petscii_name() gets it as is, later ones the lowest free "#n" suffix.
+    Items only ever arrive with higher IDs than the ones already indexed
+    (SQLite AUTOINCREMENT), so adding them one at a time gives the same
+    names as rebuilding from the database. Names are not stored, though:
+    they are only stable for the life of the index. Once an item is deleted,
+    the next rebuild (after a restart or an import) moves later duplicates
+    up, so "ELITE#2" becomes "ELITE" when the first ELITE is gone.
+
+    An exact name is a dict lookup. Patterns walk the sorted name list as
+    an implicit trie: literal characters narrow the range by bisection, and
+    a '?' tries each distinct character at that position in ascending order
+    (one bisect per distinct character), so even "?LITE" costs a few
+    dozen bisects rather than a scan. The first match in name order wins.
+    """
+    def __init__(self):
+        self.ids = {}          # C64 name -> item ID
+        self.names = {}        # Item ID -> C64 name
+        self.attributes = {}   # Item ID -> (year, genre) for the //LIB category directories
+        self.sorted = []       # All C64 names, sorted
+        self.last_id = 0
+        self.stale = True
+
+    def clear(self):
+        self.ids.clear()
+        self.names.clear()
+        self.attributes.clear()
+        self.sorted = []
+        self.last_id = 0
+        self.stale = True
+
+    def add(self, item_id, title, year=None, genre=None):
+        """Index one item. Returns its C64 name."""
+        if item_id in self.names:
+            return self.names[item_id]
+        base = petscii_name(title)
+        name = base
+        number = 1
+        while name in self.ids:
+            number += 1
+            name = suffixed(base, number)
+        self.ids[name] = item_id
+        self.names[item_id] = name
+        self.attributes[item_id] = (year, genre)
+        bisect.insort(self.sorted, name)
+        self.last_id = max(self.last_id, item_id)
+        return name
+
+    def name_of(self, item_id):
+        return self.names.get(item_id)
+
+    def match(self, pattern, accept=None):
+        """
+        Item ID of the first name (in sort order) matching a CBM DOS pattern
+        and, if given, accept(item_id). None if nothing matches.
+        """
+        if '*' not in pattern and '?' not in pattern:
+            item_id = self.ids.get(pattern)
+            return item_id if item_id is not None and (accept is None or accept(item_id)) else None
+        return self._walk(pattern, "", accept)
+
+    def _walk(self, pattern, prefix, accept):
+        """First match of pattern among the names starting with prefix (which matched pattern so far)"""
+        i = len(prefix)
+        while i < len(pattern) and pattern[i] not in '*?':
+            i += 1
+        prefix += pattern[len(prefix):i]
+        names = self.sorted
+        position = bisect.bisect_left(names, prefix)
+        if i == len(pattern):
+            if position < len(names) and names[position] == prefix:
+                item_id = self.ids[prefix]
+                if accept is None or accept(item_id):
+                    return item_id
+            return None
+        if pattern[i] == '*':
+            while position < len(names) and names[position].startswith(prefix):
+                item_id = self.ids[names[position]]
+                if accept is None or accept(item_id):
+                    return item_id
+                position += 1
+            return None
+        # '?': each distinct character that follows prefix, in order
+        while position < len(names) and names[position].startswith(prefix):
+            name = names[position]
+            if len(name) == i:
+                position += 1 # prefix itself is a name, too short for the '?'
+                continue
+            item_id = self._walk(pattern, prefix + name[i], accept)
+            if item_id is not None:
+                return item_id
+            position = bisect.bisect_left(names, prefix + chr(ord(name[i]) + 1), position)
+        return None
+
+    def __len__(self):
+        return len(self.ids)
@@ -0,0 +1,345 @@
+import argparse
+import os
+import pty
+import re
+import select
+import subprocess
+import threading
+import time
+
+GREETING_MAX = 4096        # Boot output kept and replayed when a warm session is handed out
+SETTLE = 1.0               # Quiet seconds after which a session without a ready pattern counts as booted
+IDLE_TIMEOUT = 1800        # Seconds without a dial before a target shrinks to its min_size
+MEMORY_BUDGET_MB = 256     # Resident memory allowed for all warm sessions together
+RETRY_MAX = 60             # Longest back-off after sessions die while booting
+RSS_INTERVAL = 5.0
+
+class LocalProcessConnection:
+    """Wraps a local subprocess (PTY) to look like a socket"""
+    def __init__(self, command):
+        self.command = command
+        self.greeting = b"" # Output produced before the connection was handed out (warm sessions)
+        self.master_fd, self.slave_fd = pty.openpty()
+        self.process = subprocess.Popen(
+            command,
+            stdin=self.slave_fd,
+            stdout=self.slave_fd,
+            stderr=self.slave_fd,
+            shell=True,
+            preexec_fn=os.setsid,
+            close_fds=True
+        )
+        os.close(self.slave_fd) # Close slave in parent
+
+    def send(self, data):
+        """Like socket.send: bytes written; BlockingIOError when non-blocking and the PTY is full"""
+        return os.write(self.master_fd, data)
+
+    def sendall(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.master_fd, view):]
+
+    def recv(self, bufsize):
+        try:
+            return os.read(self.master_fd, bufsize)
+        except BlockingIOError:
+            raise
+        except OSError:
+            return b"" # EIO once the child has exited: end of session
+
+    def setblocking(self, flag):
+        os.set_blocking(self.master_fd, flag)
+
+    def close(self):
+        try:
+            os.close(self.master_fd)
+            self.process.terminate()
+            self.process.wait()
+        except:
+            pass
+
+    def fileno(self):
+        return self.master_fd
+
+def session_rss(sid):
+    """Resident memory in bytes of every process in a session (the shell and what it started)"""
+    page = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+            # Fields after "(comm)": state ppid pgrp session ...
+            if int(stat[stat.rindex(b')') + 2:].split()[3]) != sid:
+                continue
+            with open(f'/proc/{entry}/statm', 'r') as f:
+                total += int(f.read().split()[1]) * page
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+class WarmSession:
+    def __init__(self, target, command):
+        self.target = target
+        self.conn = LocalProcessConnection(command)
+        self.started = time.monotonic()
+        self.last_output = None
+        self.ready_at = None
+        self.output = bytearray()
+        self.rss = 0
+
+class PtyPool:
+    """
+    Keeps pre-booted local sessions (SIMH, SHELL) so a dial does not pay the
+    boot time. A background thread spawns sessions up to each target's size,
+    drains their boot output (the last GREETING_MAX bytes are replayed to the
+    caller) and notices when they are ready: when the `ready` regex matches
+    the output, or after `settle` quiet seconds.
+
+    targets: {"SIMH": {"command": "...", "size": 1, "min_size": 0,
+                       "ready": "login: $", "settle": 1.0, "idle_timeout": 1800}}
+
+    A target that has not been dialled for idle_timeout seconds shrinks to
+    min_size. While the warm sessions use more than memory_budget_mb no new
+    ones are started, and the sessions of the least recently dialled targets
+    are reaped first.
+    """
+    def __init__(self, targets, memory_budget_mb=MEMORY_BUDGET_MB):
+        now = time.monotonic()
+        self.targets = {}
+        for name, target in targets.items():
+            ready = target.get('ready')
+            self.targets[name] = {
+                'command': target['command'],
+                'size': target.get('size', 1),
+                'min_size': target.get('min_size', 0),
+                'ready': re.compile(ready.encode()) if ready else None,
+                'settle': target.get('settle', SETTLE),
+                'idle_timeout': target.get('idle_timeout', IDLE_TIMEOUT),
+            }
+        self.budget = memory_budget_mb * 1024 * 1024
+        self.sessions = {name: [] for name in self.targets}
+        self.last_used = {name: now for name in self.targets}
+        self.failures = {name: 0 for name in self.targets}
+        self.retry_at = {name: 0.0 for name in self.targets}
+        self.rss_estimate = {name: 0 for name in self.targets} # Last measured size of one session
+        self.rss_checked = 0.0
+        self.discarded = [] # Connections to close once the lock is released
+        self.lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def acquire(self, target):
+        """
+        A warm connection for target, booted ones first, or None if there is
+        none. The output it produced so far is in conn.greeting.
+        """
+        with self.lock:
+            if target not in self.sessions:
+                return None
+            self.last_used[target] = time.monotonic()
+            pool = self.sessions[target]
+            if not pool:
+                session = None
+            else:
+                pool.sort(key=lambda s: (s.ready_at is None, s.started))
+                session = pool.pop(0)
+        self._wake() # Replenish
+        if session is None:
+            return None
+        session.conn.greeting = bytes(session.output)
+        return session.conn
+
+    def status(self):
+        with self.lock:
+            return {name: {'warm': len(pool), 'ready': sum(1 for s in pool if s.ready_at is not None),
+                           'rss_mb': sum(s.rss for s in pool) / (1024 * 1024)}
+                    for name, pool in self.sessions.items()}
+
+    def close(self):
+        self.running = False
+        self._wake()
+        self.thread.join(timeout=5)
+        with self.lock:
+            for pool in self.sessions.values():
+                self.discarded += [session.conn for session in pool]
+                pool.clear()
+        self._close_discarded()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except OSError:
+            pass
+
+    def _wanted(self, name, now):
+        target = self.targets[name]
+        if now - self.last_used[name] > target['idle_timeout']:
+            return target['min_size']
+        return target['size']
+
+    def _run(self):
+        while self.running:
+            self._maintain()
+            self._close_discarded()
+            with self.lock:
+                fds = {s.conn.master_fd: s for pool in self.sessions.values() for s in pool}
+            try:
+                readable, _, _ = select.select([self._wake_r, *fds], [], [], 1.0)
+            except (OSError, ValueError):
+                continue # A session was handed out or closed meanwhile
+            for fd in readable:
+                if fd == self._wake_r:
+                    os.read(fd, 64)
+                    continue
+                with self.lock:
+                    session = fds[fd]
+                    if session not in self.sessions[session.target]:
+                        continue # Handed out since the select
+                    data = session.conn.recv(4096)
+                    if data:
+                        self._output(session, data)
+                    else:
+                        self._discard(session)
+            self._close_discarded()
+
+    def _output(self, session, data):
+        session.output += data
+        if len(session.output) > GREETING_MAX:
+            del session.output[:-GREETING_MAX]
+        session.last_output = time.monotonic()
+        pattern = self.targets[session.target]['ready']
+        if session.ready_at is None and pattern is not None and pattern.search(session.output):
+            self._booted(session)
+
+    def _booted(self, session):
+        session.ready_at = time.monotonic()
+        self.failures[session.target] = 0
+        print(f"[Pool] {session.target} ready after {session.ready_at - session.started:.1f}s")
+
+    def _discard(self, session, reaped=False):
+        """
+        Drop a session (lock held). Dying before it booted delays the next
+        attempt. The connection is closed by _close_discarded, after the lock
+        is released: close() waits for the process to exit, and acquire()
+        must not wait with it.
+        """
+        self.sessions[session.target].remove(session)
+        self.discarded.append(session.conn)
+        if reaped or session.ready_at is not None:
+            return
+        name = session.target
+        self.failures[name] += 1
+        delay = min(RETRY_MAX, 2 ** self.failures[name])
+        self.retry_at[name] = time.monotonic() + delay
+        tail = bytes(session.output[-200:]).decode('ascii', errors='replace').strip()
+        print(f"[Pool] {name} exited while booting, retrying in {delay}s: {tail}")
+
+    def _close_discarded(self):
+        with self.lock:
+            discarded, self.discarded = self.discarded, []
+        for conn in discarded:
+            conn.close()
+
+    def _maintain(self):
+        now = time.monotonic()
+        with self.lock:
+            # Sessions without a ready pattern are booted once their output settles
+            for pool in self.sessions.values():
+                for session in pool:
+                    settle = self.targets[session.target]['settle']
+                    if (session.ready_at is None and self.targets[session.target]['ready'] is None
+                            and session.last_output is not None and now - session.last_output >= settle):
+                        self._booted(session)
+
+            if now - self.rss_checked >= RSS_INTERVAL:
+                self.rss_checked = now
+                for name, pool in self.sessions.items():
+                    for session in pool:
+                        session.rss = session_rss(session.conn.process.pid)
+                        self.rss_estimate[name] = max(self.rss_estimate[name], session.rss)
+            used = sum(s.rss for pool in self.sessions.values() for s in pool)
+
+            # Over budget: reap from the least recently dialled targets first
+            if used > self.budget:
+                for name in sorted(self.sessions, key=lambda n: self.last_used[n]):
+                    while self.sessions[name] and used > self.budget:
+                        session = self.sessions[name][-1]
+                        used -= session.rss
+                        print(f"[Pool] Reaping {name} session, memory budget exceeded")
+                        self._discard(session, reaped=True)
+
+            for name, pool in self.sessions.items():
+                wanted = self._wanted(name, now)
+                while len(pool) > wanted:
+                    print(f"[Pool] Reaping idle {name} session")
+                    self._discard(pool[-1], reaped=True)
+                # One spawn per pass spreads the boot load
+                estimate = self.rss_estimate[name]
+                if len(pool) < wanted and now >= self.retry_at[name] and used + estimate <= self.budget:
+                    try:
+                        session = WarmSession(name, self.targets[name]['command'])
+                        session.rss = estimate # Until measured
+                        pool.append(session)
+                        used += estimate
+                    except OSError as e:
+                        print(f"[Pool] Could not start {name}: {e}")
+                        self.retry_at[name] = now + RETRY_MAX
+
+def time_to_prompt(conn, pattern, timeout=30.0):
+    """Seconds until pattern shows up in conn's output (greeting included)"""
+    start = time.monotonic()
+    output = bytearray(conn.greeting)
+    while not pattern.search(output):
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            raise TimeoutError(f"No prompt within {timeout}s")
+        readable, _, _ = select.select([conn], [], [], remaining)
+        if readable:
+            data = conn.recv(4096)
+            if not data:
+                raise EOFError("Session exited")
+            output += data
+    return time.monotonic() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cold and warm connect-to-prompt latency')
+    parser.add_argument('--command', default='/bin/bash -i')
+    parser.add_argument('--ready', default=r'[$#] $', help='Prompt regex')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    pattern = re.compile(args.ready.encode())
+
+    cold = []
+    for _ in range(args.runs):
+        start = time.monotonic()
+        conn = LocalProcessConnection(args.command)
+        time_to_prompt(conn, pattern)
+        cold.append(time.monotonic() - start)
+        conn.close()
+
+    pool = PtyPool({'BENCH': {'command': args.command, 'ready': args.ready, 'size': 1}})
+    warm = []
+    for _ in range(args.runs):
+        deadline = time.monotonic() + 60
+        while not pool.status()['BENCH']['ready'] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        start = time.monotonic()
+        conn = pool.acquire('BENCH')
+        time_to_prompt(conn, pattern)
+        warm.append(time.monotonic() - start)
+        conn.close()
+    pool.close()
+
+    print(f"Cold: {min(cold) * 1000:.1f} ms (best of {args.runs})")
+    print(f"Warm: {min(warm) * 1000:.3f} ms (best of {args.runs})")
+
+if __name__ == "__main__":
+    main()
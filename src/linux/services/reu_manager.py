@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 import logging
 from fpga_interface import FpgaInterface
 from config_manager import ConfigManager
@@ -9,6 +10,88 @@ REU_SIZE_512KB = 512 * 1024
 REU_SIZE_16MB = 16 * 1024 * 1024
 DEFAULT_REU_SIZE = REU_SIZE_512KB
 
+# 1764/1750 registers as the C64 sees them (reached through the debug bridge)
+REU_IO = 0xDF00
+REU_STATUS = 0x00
+REU_COMMAND = 0x01
+REU_END_OF_BLOCK = 0x40
+REU_EXECUTE_STASH = 0x90     # Execute now (no $FF00 trigger), C64 -> REU
+REU_EXECUTE_FETCH = 0x91     # Execute now (no $FF00 trigger), REU -> C64
+DMA_TIMEOUT = 1.0
+STAGING_SIZE = 0x10000       # Top 64 KB of the REU stage host <-> C64 RAM copies
+SAVED_REGISTERS = (0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x08, 0x0A) # The ones _dma() writes
+
+def dma_to_c64(fpga, reu_address, c64_address, length, timeout=DMA_TIMEOUT):
+    """
+    Have the REU copy length bytes (1-65536) from REU memory into C64 RAM.
+    Returns True once the REU reports the end of the block.
+    """
+    return _dma(fpga, REU_EXECUTE_FETCH, reu_address, c64_address, length, timeout)
+
+def dma_from_c64(fpga, c64_address, reu_address, length, timeout=DMA_TIMEOUT):
+    """Have the REU copy length bytes (1-65536) from C64 RAM into REU memory"""
+    return _dma(fpga, REU_EXECUTE_STASH, reu_address, c64_address, length, timeout)
+
+def copy_to_c64(fpga, c64_address, data, reu_size=DEFAULT_REU_SIZE):
+    """
+    Put data into C64 RAM: one heavy-bridge write into the REU staging area,
+    then one REU DMA. Returns True once the DMA completed.
+
+    The staging bytes and the REU registers belong to whatever is running
+    on the C64 (a GEOS RAM disk, a game using the REU), so both are saved
+    before and restored after the copy.
+    """
+    if not data or c64_address + len(data) > 0x10000:
+        raise ValueError(f"{len(data)} bytes do not fit at ${c64_address:04X}")
+    staging = reu_size - STAGING_SIZE
+    saved = _save_reu(fpga, staging, len(data))
+    try:
+        fpga.write_block(staging, data)
+        return dma_to_c64(fpga, staging, c64_address, len(data))
+    finally:
+        _restore_reu(fpga, staging, saved)
+
+def copy_from_c64(fpga, c64_address, length, reu_size=DEFAULT_REU_SIZE):
+    """
+    Read C64 RAM through the REU staging area; returns None if the DMA did
+    not complete. Staging bytes and REU registers are restored as in copy_to_c64.
+    """
+    if not 0 < length <= 0x10000 - c64_address:
+        raise ValueError(f"{length} bytes at ${c64_address:04X} are outside C64 RAM")
+    staging = reu_size - STAGING_SIZE
+    saved = _save_reu(fpga, staging, length)
+    try:
+        if not dma_from_c64(fpga, c64_address, staging, length):
+            return None
+        return bytes(fpga.read_block(staging, length))
+    finally:
+        _restore_reu(fpga, staging, saved)
+
+def _save_reu(fpga, staging, length):
+    registers = [fpga.peek(REU_IO + reg) for reg in SAVED_REGISTERS]
+    return registers, bytes(fpga.read_block(staging, length))
+
+def _restore_reu(fpga, staging, saved):
+    registers, memory = saved
+    fpga.write_block(staging, memory)
+    for reg, value in zip(SAVED_REGISTERS, registers):
+        fpga.poke(REU_IO + reg, value)
+
+def _dma(fpga, command, reu_address, c64_address, length, timeout):
+    count = length & 0xFFFF # 0 means 64 KB
+    for reg, value in ((0x02, c64_address & 0xFF), (0x03, c64_address >> 8),
+                       (0x04, reu_address & 0xFF), (0x05, (reu_address >> 8) & 0xFF),
+                       (0x06, (reu_address >> 16) & 0xFF),
+                       (0x07, count & 0xFF), (0x08, count >> 8), (0x0A, 0x00)):
+        fpga.poke(REU_IO + reg, value)
+    fpga.poke(REU_IO + REU_COMMAND, command)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if fpga.peek(REU_IO + REU_STATUS) & REU_END_OF_BLOCK:
+            return True
+    return False
+
 class ReuManager:
     def __init__(self):
         self.config = ConfigManager()
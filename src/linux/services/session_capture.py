@@ -0,0 +1,73 @@
+import os
+import struct
+import time
+
+# Session capture format (.zcap), little-endian:
+#   header: b"ZCAP", version u8, flags u8, start time f64 (Unix seconds, informational)
+#   record: delta u32 (microseconds since the previous record), direction u8, length u16, data
+# Timestamps come from time.monotonic(), so they never run backwards.
+MAGIC = b"ZCAP"
+VERSION = 1
+HEADER = struct.Struct('<4sBBd')
+RECORD = struct.Struct('<IBH')
+
+TO_C64 = 0      # Bytes as received from the remote end (before telnet decoding)
+FROM_C64 = 1    # Bytes typed on the C64 while connected
+
+FLAG_TELNET = 0x01  # The session negotiated telnet from the start
+
+MAX_DELTA = 0xFFFFFFFF
+MAX_RECORD = 0xFFFF
+
+class CaptureWriter:
+    """Records both directions of one session with monotonic timestamps"""
+    def __init__(self, path, flags=0):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, flags, time.time()))
+        self.last = time.monotonic()
+        self.bytes = [0, 0]
+
+    def write(self, direction, data):
+        now = time.monotonic()
+        delta = min(MAX_DELTA, int((now - self.last) * 1_000_000))
+        self.last = now
+        self.bytes[direction] += len(data)
+        for i in range(0, len(data), MAX_RECORD):
+            part = data[i:i + MAX_RECORD]
+            self.file.write(RECORD.pack(delta, direction, len(part)))
+            self.file.write(part)
+            delta = 0
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+def open_capture(directory, peer, flags=0):
+    """A CaptureWriter for a new session in directory, or None if it cannot be created"""
+    try:
+        os.makedirs(directory, exist_ok=True)
+        name = time.strftime('session-%Y%m%d-%H%M%S') + f"-{peer}.zcap"
+        return CaptureWriter(os.path.join(directory, name.replace(':', '_')), flags)
+    except OSError as e:
+        print(f"[Capture] Could not start capture: {e}")
+        return None
+
+def read_capture(path):
+    """Returns (flags, records) where records is a list of (seconds since start, direction, data)"""
+    with open(path, 'rb') as f:
+        blob = f.read()
+    magic, version, flags, _ = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a version {VERSION} session capture")
+    records = []
+    offset = HEADER.size
+    elapsed = 0
+    while offset + RECORD.size <= len(blob):
+        delta, direction, length = RECORD.unpack_from(blob, offset)
+        offset += RECORD.size
+        elapsed += delta
+        records.append((elapsed / 1_000_000, direction, blob[offset:offset + length]))
+        offset += length
+    return flags, records
@@ -0,0 +1,140 @@
+# Telnet commands (RFC 854) and the options the modem bridge negotiates
+IAC, DONT, DO, WONT, WILL, SB, GA, NOP, SE = 255, 254, 253, 252, 251, 250, 249, 241, 240
+BINARY, ECHO, SGA = 0, 1, 3   # RFC 856, 857, 858
+
+IAC_B = bytes([IAC])
+IAC_IAC = bytes([IAC, IAC])
+IAC_SE = bytes([IAC, SE])
+MAX_PENDING = 4096 # Longest incomplete command (e.g. subnegotiation) kept between chunks
+
+# Options wanted (remote side, local side): binary both ways, nobody sends GA, and
+# whoever is the server echoes. When dialling out the C64 is the terminal; when
+# answering an inbound caller it is the BBS and echoes itself.
+CLIENT_OPTIONS = (frozenset((ECHO, SGA, BINARY)), frozenset((SGA, BINARY)))
+SERVER_OPTIONS = (frozenset((SGA, BINARY)), frozenset((ECHO, SGA, BINARY)))
+
+class TelnetProtocol:
+    """
+    Telnet layer for one connection (server=True when the C64 answered an
+    inbound call). decode() turns network data into the
+    bytes for the C64: commands are removed, negotiation is answered and IAC
+    IAC becomes a single $FF. encode() escapes $FF in data from the C64.
+
+    Both work on whole chunks: decode() returns the chunk itself when it has
+    no IAC (the common case) and otherwise slices between bytes.find() hits;
+    encode() is a single bytes.replace(). Negotiation replies are collected
+    in `replies` for the caller to send unencoded.
+    """
+    def __init__(self, server=False):
+        self.want_remote, self.want_local = SERVER_OPTIONS if server else CLIENT_OPTIONS
+        self.local = set()    # Options enabled on our side
+        self.remote = set()   # Options enabled on the remote side
+        self.requested = set() # (command, option) we sent and await an answer for
+        self.replies = []
+        self.pending = b""
+
+    def offer(self):
+        """Start negotiating (for connections where we speak first)"""
+        for option in sorted(self.want_remote):
+            self._send(DO, option)
+        for option in sorted(self.want_local):
+            self._send(WILL, option)
+
+    def take_replies(self):
+        data = b"".join(self.replies)
+        self.replies.clear()
+        return data
+
+    @property
+    def binary_in(self):
+        return BINARY in self.remote
+
+    @property
+    def binary_out(self):
+        return BINARY in self.local
+
+    def _send(self, command, option):
+        self.requested.add((command, option))
+        self.replies.append(bytes([IAC, command, option]))
+
+    def _negotiate(self, command, option):
+        """Answer a WILL/WONT/DO/DONT, replying only when the state changes (no loops)"""
+        request = (DO if command in (WILL, WONT) else WILL, option)
+        asked = request in self.requested
+        self.requested.discard(request)
+        if command == WILL:
+            if option in self.want_remote:
+                if option not in self.remote:
+                    self.remote.add(option)
+                    if not asked:
+                        self.replies.append(bytes([IAC, DO, option]))
+            elif not asked:
+                self.replies.append(bytes([IAC, DONT, option]))
+        elif command == WONT:
+            if option in self.remote:
+                self.remote.discard(option)
+                if not asked:
+                    self.replies.append(bytes([IAC, DONT, option]))
+        elif command == DO:
+            if option in self.want_local:
+                if option not in self.local:
+                    self.local.add(option)
+                    if not asked:
+                        self.replies.append(bytes([IAC, WILL, option]))
+            elif not asked:
+                self.replies.append(bytes([IAC, WONT, option]))
+        elif command == DONT:
+            if option in self.local:
+                self.local.discard(option)
+                if not asked:
+                    self.replies.append(bytes([IAC, WONT, option]))
+
+    def decode(self, data):
+        """Network -> C64"""
+        if self.pending:
+            data = self.pending + data
+            self.pending = b""
+        i = data.find(IAC_B)
+        if i < 0:
+            return data if self.binary_in else data.replace(b"\r\0", b"\r")
+        out = []
+        start = 0
+        end = len(data)
+        while i >= 0:
+            out.append(data[start:i])
+            if i + 1 >= end:
+                break # Command continues in the next chunk
+            command = data[i + 1]
+            if command == IAC:
+                out.append(IAC_B)
+                start = i + 2
+            elif command in (WILL, WONT, DO, DONT):
+                if i + 2 >= end:
+                    break
+                self._negotiate(command, data[i + 2])
+                start = i + 3
+            elif command == SB:
+                stop = data.find(IAC_SE, i + 2)
+                if stop < 0:
+                    break
+                start = stop + 2 # Subnegotiations we did not ask for are ignored
+            else:
+                start = i + 2 # NOP, GA, AYT, ...
+            i = data.find(IAC_B, start)
+        else:
+            out.append(data[start:])
+            i = end
+        if i < end:
+            self.pending = data[i:]
+            if len(self.pending) > MAX_PENDING:
+                self.pending = b"" # Runaway subnegotiation: drop it
+        result = b"".join(out)
+        return result if self.binary_in else result.replace(b"\r\0", b"\r")
+
+    def encode(self, data):
+        """C64 -> network"""
+        if IAC_B in data:
+            data = data.replace(IAC_B, IAC_IAC)
+        if not self.binary_out and b"\r" in data:
+            data = data.replace(b"\r", b"\r\0") # NVT: a bare CR is CR NUL
+        return data
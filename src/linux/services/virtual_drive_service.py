@@ -2,19 +2,93 @@ import os
 import time
 import struct
 import subprocess
-from fpga_interface import FpgaInterface
+from fpga_interface import (FpgaInterface, DRV_OPEN, DRV_CLOSE, DRV_LOAD, DRV_SAVE, DRV_READ, DRV_WRITE,
+                            DRV_BUFFER_SIZE)
 from config_manager import ConfigManager
-from library_manager import LibraryManager
+from disk_image import IMAGE_TYPES, MountedImage, petscii_to_ascii
+from reu_manager import copy_to_c64, copy_from_c64, DEFAULT_REU_SIZE
+from directory_cache import DirectoryCache
+from name_index import name_matches
 
 # Virtual Drive Configuration
 # Maps a Linux directory to a C64 Device ID (e.g., 10)
 
+POLL_MIN = 0.0005          # Mailbox poll interval right after a command...
+POLL_IDLE = 0.010          # ...backing off to this while the C64 is not using the drives
+COMMAND_CHANNEL = 15
+DIRECTORY_ADDRESS = 0x0401 # Load address of a LOAD"$" listing
+CBM_EXTENSIONS = ('.PRG', '.SEQ', '.USR', '.REL')
+MOUNTABLE_EXTENSIONS = ('.D64', '.D71', '.D81')
+
+# KERNAL error numbers (DRV_REPLY_ERROR) and status bits (ST)
+ERR_FILE_OPEN = 2
+ERR_FILE_NOT_OPEN = 3
+ERR_FILE_NOT_FOUND = 4
+ERR_DEVICE_NOT_PRESENT = 5
+ERR_NOT_INPUT_FILE = 6
+ERR_NOT_OUTPUT_FILE = 7
+ERR_MISSING_FILE_NAME = 8
+ST_EOI = 0x40
+
+def listing_to_prg(listing, load_address=DIRECTORY_ADDRESS):
+    """
+    Turn a text listing (lines of "BLOCKS TEXT", as list_directory returns)
+    into the BASIC program LOAD"$" produces: the block count is the line number.
+    """
+    out = bytearray(struct.pack('<H', load_address))
+    address = load_address
+    for index, line in enumerate(listing.split('\r')):
+        number, _, text = line.partition(' ')
+        try:
+            blocks = int(number)
+        except ValueError:
+            blocks, text = 0, line
+        body = text.upper().encode('ascii', errors='replace')
+        if index == 0:
+            body = b'\x12' + body # Header line is shown reversed
+        address += 5 + len(body)
+        out += struct.pack('<HH', address, blocks) + body + b'\0'
+    out += b'\0\0'
+    return bytes(out)
+
+def c64_name(filename):
+    """How a host file is named on the C64: upper case, without a .PRG/.SEQ/.USR/.REL extension"""
+    name = filename.upper()
+    return name[:-4] if name.endswith(CBM_EXTENSIONS) else name
+
+def split_drive_prefix(name):
+    """Strip "0:"/":" and a leading "@" (replace). Returns (name, replace)."""
+    replace = name.startswith('@')
+    if replace:
+        name = name[1:]
+    if ':' in name[:2]:
+        name = name.split(':', 1)[1]
+    return name, replace
+
 class VirtualDriveService:
-    def __init__(self):
-        self.config = ConfigManager()
-        self.fpga = FpgaInterface()
-        self.library = LibraryManager()
+    """
+    Serves the C64's virtual drives through the FPGA drive mailbox. The
+    C64-side KERNAL hook posts OPEN/CLOSE/LOAD/SAVE/READ/WRITE for a device
+    and waits; run() dispatches each command and answers it.
+
+    LOAD does not stream the file over the bus: the payload is written into
+    the REU staging area over the heavy bridge and copied into C64 RAM at
+    its load address by one REU DMA, so a program loads in milliseconds.
+
+    A D64/D71/D81 can be mounted on a device (drive type 'image', or CD into
+    an image file on a local/SMB drive); drive['image'] then holds the
+    MountedImage and all file commands go to it.
+    """
+    def __init__(self, fpga=None, config=None, library=None):
+        self.config = config if config is not None else ConfigManager()
+        self.fpga = fpga if fpga is not None else FpgaInterface()
+        self.library = library # LibraryManager, created when a library drive is configured
         self.drives = {} # Map device_id -> path or object
+        self.channels = {} # (device_id, secondary) -> open file state
+        self.dos_status = {} # device_id -> (code, message, track, sector) for channel 15
+        self.dir_cache = DirectoryCache()
+        self.reu_size = int(self.config.get('reu', {}).get('size_mb', DEFAULT_REU_SIZE / (1024 * 1024)) * 1024 * 1024)
+        self.running = False
         
         self.setup_drives()
         print(f"[Drive] Service Started. Active Drives: {list(self.drives.keys())}")
@@ -36,10 +110,15 @@ class VirtualDriveService:
                     except:
                         print(f"[Drive] Failed to create local path {path}")
                         continue
-                self.drives[dev_id] = {'type': 'local', 'path': path}
+                self.drives[dev_id] = {'type': 'local', 'path': path, 'root': path}
                 
             elif dtype == 'library':
                 # Special Library Drive
+                if self.library is None:
+                    from library_manager import LibraryManager
+                    self.library = LibraryManager()
+                    # Resume enrichment jobs queued by a previous run
+                    self.library.ai.start()
                 self.drives[dev_id] = {'type': 'library', 'path': '//LIB'}
 
             elif dtype == 'smb':
@@ -63,10 +142,43 @@ class VirtualDriveService:
                     if not os.path.ismount(mount_point):
                         print(f"[Drive] Mounting SMB: //{host}/{share} -> {mount_point}")
                         subprocess.check_call(cmd)
-                    self.drives[dev_id] = mount_point
+                    self.drives[dev_id] = {'type': 'smb', 'path': mount_point, 'root': mount_point}
+                    if d.get('refresh_interval'):
+                        self.dir_cache.refresh_interval = d['refresh_interval']
+                    self.dir_cache.add_remote(mount_point)
                 except Exception as e:
                     print(f"[Drive] Failed to mount SMB {dev_id}: {e}")
 
+            elif dtype == 'image':
+                # A disk image as the whole drive
+                self.drives[dev_id] = {'type': 'image', 'path': d['path']}
+                if not self.mount_image(dev_id, d['path'], d.get('read_only', False)):
+                    del self.drives[dev_id]
+
+    def mount_image(self, device_id, path, read_only=False):
+        """Mount a D64/D71/D81 on a drive (replacing any mounted image). Returns True on success."""
+        try:
+            image = MountedImage(path, read_only)
+        except (OSError, ValueError) as e:
+            print(f"[Drive] Cannot mount {path} on {device_id}: {e}")
+            return False
+        self.unmount_image(device_id)
+        self.drives[device_id]['image'] = image
+        print(f"[Drive] Mounted {image.geometry.fmt} {path} on {device_id}: "
+              f"{len(image.entries)} files, {image.blocks_free()} blocks free")
+        return True
+
+    def unmount_image(self, device_id):
+        image = self.drives[device_id].pop('image', None)
+        if image is not None:
+            image.close()
+
+    def write_back(self):
+        """Write back mounted images whose batch of changes is due"""
+        for drive in self.drives.values():
+            if 'image' in drive:
+                drive['image'].write_back()
+
     def list_directory(self, device_id):
         """Generates a C64-style directory listing"""
         if device_id not in self.drives:
@@ -79,28 +191,38 @@ class VirtualDriveService:
             return self._list_library(drive_obj['path'])
             
         # Handle Local/SMB Drive
-        current_dir = drive_obj['path']
         try:
-            files = os.listdir(current_dir)
+            return self._rendered_listing(device_id)[0]
+        except Exception as e:
+            return f"ERROR: {e}"
+
+    def _rendered_listing(self, device_id):
+        """(text, PRG) of the current directory, built once per directory change"""
+        image = self.drives[device_id].get('image')
+        if image is not None:
+            rendered = image.rendered.get(device_id)
+            if rendered is None:
+                text = image.listing()
+                rendered = image.rendered[device_id] = (text, listing_to_prg(text))
+            return rendered
+        listing = self.dir_cache.get(self.drives[device_id]['path'])
+        rendered = listing.rendered.get(device_id)
+        if rendered is None:
             # Format: 0 "DISK NAME" ID 2A
             # Then lines: BLOCKS "FILENAME" TYPE
-            listing = []
-            listing.append(f'0 "NETWORK DRIVE" {device_id} 2A')
-            
-            for f in files:
-                path = os.path.join(current_dir, f)
-                size_blocks = os.path.getsize(path) // 254 # Approx blocks
-                if os.path.isdir(path):
+            lines = [f'0 "NETWORK DRIVE" {device_id} 2A']
+            for name, is_dir, size in listing.entries:
+                if is_dir:
                     file_type = "DIR"
+                elif name.upper().endswith(CBM_EXTENSIONS):
+                    file_type = name[-3:].upper()
                 else:
                     file_type = "PRG" # Default
-                
-                listing.append(f'{size_blocks:<4} "{f}" {file_type}')
-            
-            listing.append("0 BLOCKS FREE.")
-            return "\r".join(listing)
-        except Exception as e:
-            return f"ERROR: {e}"
+                lines.append(f'{(size + 253) // 254:<4} "{name}" {file_type}')
+            lines.append("0 BLOCKS FREE.")
+            text = "\r".join(lines)
+            rendered = listing.rendered[device_id] = (text, listing_to_prg(text))
+        return rendered
 
     def _list_library(self, vfs_path):
         """Generate listing from Library Manager"""
@@ -113,21 +235,337 @@ class VirtualDriveService:
         if vfs_path != "//LIB":
              listing.append(f'0    ".." DIR')
 
-        for type_str, name, id_or_val in items:
-            # If it's a file (PRG), we might want to show ID or something
-            # But C64 directory is just Name + Type.
-            # We need a way to map "LOAD name" back to the ID.
-            # For now, just list them.
+        for type_str, name, *_ in items:
+            # Files are listed under their name index names, so what is shown can be LOADed
             listing.append(f'1    "{name}" {type_str}')
             
         listing.append("0 BLOCKS FREE.")
         return "\r".join(listing)
 
+    # --------------------------------------------------------------------------
+    # Files
+    # --------------------------------------------------------------------------
+    def set_status(self, device_id, code, message, track=0, sector=0):
+        self.dos_status[device_id] = (code, message, track, sector)
+
+    def find_file(self, device_id, pattern):
+        """
+        First file on the drive matching a CBM DOS name pattern: a host path
+        (local/SMB), an item ID (library) or a directory entry (mounted
+        image). None if nothing matches.
+        """
+        drive = self.drives[device_id]
+        if 'image' in drive:
+            return drive['image'].find(pattern)
+        if drive['type'] == 'library':
+            return self.library.resolve_name(drive['path'], pattern)
+        for name, is_dir, _ in self.dir_cache.get(drive['path']).entries:
+            if not is_dir and (name_matches(pattern, c64_name(name)) or name_matches(pattern, name.upper())):
+                return os.path.join(drive['path'], name)
+        return None
+
+    def read_file(self, device_id, name):
+        """Contents of a file as the drive would send them (PRG: load address first), or None"""
+        if name.startswith('$'):
+            if self.drives[device_id]['type'] == 'library':
+                return listing_to_prg(self.list_directory(device_id))
+            return self._rendered_listing(device_id)[1]
+        found = self.find_file(device_id, name)
+        if found is None:
+            return None
+        if 'image' in self.drives[device_id]:
+            return self.drives[device_id]['image'].read_file(found)
+        if self.drives[device_id]['type'] != 'library':
+            with open(found, 'rb') as f:
+                return f.read()
+        item = self.library.db.get_item(found)
+        if item is None:
+            return None # Deleted since it was indexed
+        if (item.get('file_type') or '').upper() in IMAGE_TYPES:
+            # A disk/tape image item loads its first program
+            for entry in self.library.db.list_entries(found):
+                if entry['file_type'] == "PRG":
+                    return self.library.extract_entry(entry['id'])
+            return None
+        with open(self.library.db.get_item_path(item), 'rb') as f:
+            return f.read()
+
+    def host_path(self, device_id, name, file_type="PRG"):
+        """Where a file written from the C64 goes on a local/SMB drive"""
+        filename = name.replace('/', '_').lower()
+        if '.' not in filename:
+            filename += '.' + file_type.lower()
+        return os.path.join(self.drives[device_id]['path'], filename)
+
+    def write_file(self, device_id, name, data, replace=False, file_type="PRG"):
+        """Store a file from the C64. Returns True, or False with the DOS status set."""
+        drive = self.drives[device_id]
+        if drive['type'] == 'library':
+            self.set_status(device_id, 26, "WRITE PROTECT ON")
+            return False
+        image = drive.get('image')
+        if image is not None and image.read_only:
+            self.set_status(device_id, 26, "WRITE PROTECT ON")
+            return False
+        existing = self.find_file(device_id, name)
+        if existing is not None and not replace:
+            self.set_status(device_id, 63, "FILE EXISTS")
+            return False
+        if image is not None:
+            try:
+                # The old file is only freed once the new one is written
+                image.write_file(name, data, file_type, replace=existing)
+            except OSError:
+                self.set_status(device_id, 72, "DISK FULL")
+                return False
+            self.set_status(device_id, 0, "OK")
+            return True
+        path = existing or self.host_path(device_id, name, file_type)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.dir_cache.invalidate(drive['path'])
+        self.set_status(device_id, 0, "OK")
+        return True
+
+    def disk_command(self, device_id, text):
+        """Channel 15 commands: I(nitialize), S(cratch):pattern, CD:dir or CD:image.d64 / CD.. / CD//"""
+        drive = self.drives[device_id]
+        command = text.strip().rstrip('\r')
+        if command.startswith('I'):
+            self.set_status(device_id, 0, "OK")
+        elif command.startswith('S') and ':' in command:
+            if drive['type'] == 'library' or ('image' in drive and drive['image'].read_only):
+                self.set_status(device_id, 26, "WRITE PROTECT ON")
+                return
+            pattern = command.split(':', 1)[1]
+            count = 0
+            path = self.find_file(device_id, pattern)
+            while path is not None:
+                if 'image' in drive:
+                    drive['image'].scratch(path)
+                else:
+                    os.remove(path)
+                    self.dir_cache.invalidate(drive['path'])
+                count += 1
+                path = self.find_file(device_id, pattern)
+            self.set_status(device_id, 1, "FILES SCRATCHED", count)
+        elif command.startswith('CD'):
+            target = command[2:].lstrip(':')
+            if drive['type'] == 'image':
+                # The image is the whole drive: it has no parent to leave to
+                self.set_status(device_id, *((0, "OK") if target in ('..', '_', '//') else (62, "FILE NOT FOUND")))
+                return
+            if 'image' in drive and target in ('..', '_', '//'):
+                # Leave the mounted image, back to the directory it was in
+                self.unmount_image(device_id)
+                self.set_status(device_id, 0, "OK")
+                return
+            if drive['type'] == 'library':
+                parts = [p for p in drive['path'].split('/') if p]
+                if target in ('..', '_'): # '_' is PETSCII left arrow
+                    parts = parts[:-1] or parts
+                elif target == '//':
+                    parts = parts[:1]
+                else:
+                    parts.append(target)
+                drive['path'] = '//' + '/'.join(parts)
+            else:
+                if target in ('..', '_'): # '_' is PETSCII left arrow
+                    path = os.path.dirname(drive['path'])
+                elif target == '//':
+                    path = drive['root']
+                else:
+                    entries = self.dir_cache.get(drive['path']).entries
+                    path = next((os.path.join(drive['path'], name) for name, is_dir, _ in entries
+                                 if is_dir and name.upper() == target), None)
+                    image = next((os.path.join(drive['path'], name) for name, is_dir, _ in entries
+                                  if not is_dir and name.upper().endswith(MOUNTABLE_EXTENSIONS)
+                                  and target in (name.upper(), name[:-4].upper())), None)
+                    if path is None and image is not None:
+                        # CD into a disk image mounts it, as on an SD2IEC
+                        if self.mount_image(device_id, image):
+                            self.set_status(device_id, 0, "OK")
+                        else:
+                            self.set_status(device_id, 74, "DRIVE NOT READY")
+                        return
+                if path is None or not os.path.realpath(path).startswith(os.path.realpath(drive['root'])):
+                    self.set_status(device_id, 62, "FILE NOT FOUND")
+                    return
+                drive['path'] = path
+            self.set_status(device_id, 0, "OK")
+        else:
+            self.set_status(device_id, 31, "SYNTAX ERROR")
+
+    # --------------------------------------------------------------------------
+    # Mailbox commands
+    # --------------------------------------------------------------------------
+    def dispatch(self, cmd):
+        """Answer one drive mailbox command"""
+        device = cmd['device']
+        if device not in self.drives:
+            self.fpga.complete_drive_command(error=ERR_DEVICE_NOT_PRESENT)
+            return
+        handler = {DRV_OPEN: self.open, DRV_CLOSE: self.close, DRV_LOAD: self.load,
+                   DRV_SAVE: self.save, DRV_READ: self.read, DRV_WRITE: self.write}.get(cmd['code'])
+        if handler is None:
+            self.set_status(device, 31, "SYNTAX ERROR")
+            self.fpga.complete_drive_command(error=ERR_DEVICE_NOT_PRESENT)
+            return
+        try:
+            handler(cmd)
+        except Exception as e:
+            print(f"[Drive] Command {cmd['code']} on device {device} failed: {e}")
+            self.set_status(device, 74, "DRIVE NOT READY")
+            self.fpga.complete_drive_command(error=ERR_DEVICE_NOT_PRESENT)
+
+    def load(self, cmd):
+        device = cmd['device']
+        name, _ = split_drive_prefix(petscii_to_ascii(cmd['data']))
+        if not name:
+            self.fpga.complete_drive_command(error=ERR_MISSING_FILE_NAME)
+            return
+        start = time.monotonic()
+        data = self.read_file(device, name)
+        if data is None or len(data) < 3:
+            self.set_status(device, 62, "FILE NOT FOUND")
+            self.fpga.complete_drive_command(error=ERR_FILE_NOT_FOUND)
+            return
+        # Secondary address 0 relocates to the address the C64 passed (BASIC start)
+        address = cmd['address'] if cmd['secondary'] == 0 else data[0] | (data[1] << 8)
+        payload = data[2:]
+        if not copy_to_c64(self.fpga, address, payload, self.reu_size):
+            raise IOError("REU DMA did not complete")
+        end = address + len(payload)
+        elapsed = (time.monotonic() - start) * 1000
+        print(f'[Drive] LOAD "{name}",{device}: {len(payload)} bytes ({(len(data) + 253) // 254} blocks) '
+              f'to ${address:04X}-${end - 1:04X} in {elapsed:.1f} ms')
+        self.set_status(device, 0, "OK")
+        self.fpga.complete_drive_command(status=ST_EOI, end_address=end)
+
+    def save(self, cmd):
+        device = cmd['device']
+        name, replace = split_drive_prefix(petscii_to_ascii(cmd['data']))
+        if not name:
+            self.fpga.complete_drive_command(error=ERR_MISSING_FILE_NAME)
+            return
+        start, end = cmd['address'], cmd['end']
+        if end <= start:
+            self.set_status(device, 0, "OK")
+            self.fpga.complete_drive_command()
+            return
+        ram = copy_from_c64(self.fpga, start, end - start, self.reu_size)
+        if ram is None:
+            raise IOError("REU DMA did not complete")
+        if self.write_file(device, name, struct.pack('<H', start) + ram, replace):
+            print(f'[Drive] SAVE "{name}",{device}: ${start:04X}-${end - 1:04X}')
+        # Like a real drive, a refused SAVE only shows in the channel 15 status
+        self.fpga.complete_drive_command()
+
+    def open(self, cmd):
+        device, secondary = cmd['device'], cmd['secondary']
+        text = petscii_to_ascii(cmd['data'])
+        if secondary == COMMAND_CHANNEL:
+            if text:
+                self.disk_command(device, text)
+            self.fpga.complete_drive_command()
+            return
+        if (device, secondary) in self.channels:
+            self.fpga.complete_drive_command(error=ERR_FILE_OPEN)
+            return
+        # NAME[,TYPE[,MODE]] - secondary 1 is SAVE-like (write), 0 LOAD-like (read)
+        name, *options = text.split(',')
+        name, replace = split_drive_prefix(name)
+        writing = 'W' in options[1:2] or 'A' in options[1:2] or secondary == 1
+        if not name:
+            self.fpga.complete_drive_command(error=ERR_MISSING_FILE_NAME)
+            return
+        if writing:
+            if self.drives[device]['type'] == 'library':
+                self.set_status(device, 26, "WRITE PROTECT ON")
+                self.fpga.complete_drive_command(error=ERR_NOT_OUTPUT_FILE)
+                return
+            data = bytearray()
+            if 'A' in options[1:2]:
+                data += self.read_file(device, name) or b""
+                replace = True
+            file_type = {'S': "SEQ", 'U': "USR"}.get(options[0][:1] if options else 'P', "PRG")
+            self.channels[(device, secondary)] = {'name': name, 'replace': replace, 'buffer': data,
+                                                  'file_type': file_type}
+        else:
+            data = self.read_file(device, name)
+            if data is None:
+                self.set_status(device, 62, "FILE NOT FOUND")
+                self.fpga.complete_drive_command(error=ERR_FILE_NOT_FOUND)
+                return
+            self.channels[(device, secondary)] = {'name': name, 'data': data, 'position': 0}
+        self.set_status(device, 0, "OK")
+        self.fpga.complete_drive_command()
+
+    def read(self, cmd):
+        device, secondary = cmd['device'], cmd['secondary']
+        if secondary == COMMAND_CHANNEL:
+            code, message, track, sector = self.dos_status.get(device, (0, "OK", 0, 0))
+            self.set_status(device, 0, "OK")
+            text = f"{code:02d},{message},{track:02d},{sector:02d}\r"
+            self.fpga.complete_drive_command(status=ST_EOI, data=text.encode('ascii'))
+            return
+        channel = self.channels.get((device, secondary))
+        if channel is None:
+            self.fpga.complete_drive_command(error=ERR_FILE_NOT_OPEN)
+            return
+        if 'data' not in channel:
+            self.fpga.complete_drive_command(error=ERR_NOT_INPUT_FILE)
+            return
+        position = channel['position']
+        chunk = channel['data'][position:position + DRV_BUFFER_SIZE]
+        channel['position'] = position + len(chunk)
+        eoi = channel['position'] >= len(channel['data'])
+        self.fpga.complete_drive_command(status=ST_EOI if eoi else 0, data=chunk)
+
+    def write(self, cmd):
+        device, secondary = cmd['device'], cmd['secondary']
+        if secondary == COMMAND_CHANNEL:
+            self.disk_command(device, petscii_to_ascii(cmd['data']))
+            self.fpga.complete_drive_command()
+            return
+        channel = self.channels.get((device, secondary))
+        if channel is None:
+            self.fpga.complete_drive_command(error=ERR_FILE_NOT_OPEN)
+            return
+        if 'buffer' not in channel:
+            self.fpga.complete_drive_command(error=ERR_NOT_OUTPUT_FILE)
+            return
+        channel['buffer'] += cmd['data']
+        self.fpga.complete_drive_command()
+
+    def close(self, cmd):
+        device, secondary = cmd['device'], cmd['secondary']
+        channel = self.channels.pop((device, secondary), None)
+        if channel is not None and 'buffer' in channel:
+            self.write_file(device, channel['name'], bytes(channel['buffer']), channel['replace'],
+                            channel['file_type'])
+        self.fpga.complete_drive_command()
+
+    def stop(self):
+        self.running = False
+
     def run(self):
-        # Placeholder loop. 
-        while True:
-            # TODO: Check FPGA for Drive Commands (OPEN, LOAD, SAVE, CLOSE)
-            time.sleep(1)
+        self.running = True
+        poll = POLL_MIN
+        while self.running:
+            cmd = self.fpga.read_drive_command()
+            if cmd is None:
+                self.write_back()
+                time.sleep(poll)
+                poll = min(poll * 2, POLL_IDLE)
+                continue
+            poll = POLL_MIN
+            self.dispatch(cmd)
+        for device_id in list(self.drives):
+            self.unmount_image(device_id)
+        self.dir_cache.close()
 
 if __name__ == "__main__":
     drive = VirtualDriveService()
@@ -1,55 +1,243 @@
+import errno
 import socket
 import time
-import select
+import selectors
 import sys
 import os
-import pty
-import subprocess
+import threading
+from collections import deque
 from fpga_interface import FpgaInterface
 from config_manager import ConfigManager
+from pty_pool import LocalProcessConnection, PtyPool, MEMORY_BUDGET_MB
+from reu_manager import copy_to_c64, DEFAULT_REU_SIZE
+from telnet import TelnetProtocol, IAC, WILL, DONT
+from session_capture import open_capture, TO_C64, FROM_C64, FLAG_TELNET
 
-class LocalProcessConnection:
-    """Wraps a local subprocess (PTY) to look like a socket"""
-    def __init__(self, command):
-        self.master_fd, self.slave_fd = pty.openpty()
-        self.process = subprocess.Popen(
-            command,
-            stdin=self.slave_fd,
-            stdout=self.slave_fd,
-            stderr=self.slave_fd,
-            shell=True,
-            preexec_fn=os.setsid,
-            close_fds=True
-        )
-        os.close(self.slave_fd) # Close slave in parent
-
-    def send(self, data):
-        try:
-            os.write(self.master_fd, data)
-        except OSError:
-            pass
+AI_SERVICE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'software', 'ai_service')
+PDP11_SCRIPT = os.path.join(os.path.dirname(__file__), '../../../data/pdp11/run_pdp11.sh')
+DOWNLOAD_DIR = "/home/root/c64_files" # AT&GET paths are relative to this (zimodem.download_dir)
+GET_TIMEOUT = 10
+GET_MAX_BYTES = 16 * 1024 * 1024  # Largest AT&GET download (a full 16 MB REU)
+GET_STREAM_TIMEOUT = 60           # Seconds a tcp:// download may take in total
 
-    def recv(self, bufsize):
-        try:
-            return os.read(self.master_fd, bufsize)
-        except OSError:
-            return b""
+FIFO_BURST = 256           # Max bytes moved per FIFO service pass
+POLL_MIN = 0.0005          # FIFO poll interval right after activity...
+POLL_IDLE = 0.010          # ...backing off to this when idle (zimodem.poll_idle_ms)
+RING_INTERVAL = 3.0
+MAX_CALLERS = 32           # Inbound callers held (1 ringing/connected + queue), zimodem.max_callers
+RX_HIGH_WATER = 16384      # Stop reading the network while this much waits for the C64
+RX_LOW_WATER = 4096
+NET_HIGH_WATER = 65536     # Stop taking C64 output while this much waits for a slow peer
+DIAL_TIMEOUT = 5.0
+BITS_PER_CHAR = 10         # 8N1: start + 8 data + stop
+PACE_BURST = 0.005         # Seconds of line time released to the FIFO at once
+PACE_HOLD = 0.005          # RX FIFO full (C64 not ready, like CTS dropping): pause this long
+BAUD = 57600               # Pacing rate and CONNECT speed (zimodem.baud, ATB<rate>; 0 = unpaced)
+TELNET_PORTS = (23,)       # Outbound dials that negotiate telnet from the start (zimodem.telnet = "auto")
+
+# Outbound (C64 -> connection) coalescing per connection type, overridable in
+# zimodem.coalesce. max_bytes=1 sends every burst as it arrives.
+COALESCE_DEFAULTS = {
+    'telnet': {'max_bytes': 1024, 'delay_ms': 20, 'flush_on_cr': True, 'nodelay': True},
+    'pty': {'max_bytes': 256, 'delay_ms': 2, 'flush_on_cr': True},
+}
+
+def fetch_source(source, base_dir=DOWNLOAD_DIR, timeout=GET_TIMEOUT, max_bytes=None):
+    """
+    Contents of a path inside base_dir, an http(s):// URL or a
+    tcp://host:port stream (read until closed). Anything larger than
+    max_bytes is refused; a tcp:// stream must also end within
+    GET_STREAM_TIMEOUT seconds.
+    """
+    max_bytes = max_bytes or GET_MAX_BYTES
+    if source.lower().startswith(('http://', 'https://')):
+        import requests
+        with requests.get(source, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            data = bytearray()
+            for chunk in response.iter_content(65536):
+                data += chunk
+                if len(data) > max_bytes:
+                    raise ValueError(f"Larger than {max_bytes} bytes")
+        return bytes(data)
+    if source.lower().startswith('tcp://'):
+        host, port = source[6:].rsplit(':', 1)
+        data = bytearray()
+        deadline = time.monotonic() + GET_STREAM_TIMEOUT
+        with socket.create_connection((host, int(port)), timeout=timeout) as sock:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Stream not finished after {GET_STREAM_TIMEOUT}s")
+                sock.settimeout(min(timeout, remaining))
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+                if len(data) > max_bytes:
+                    raise ValueError(f"Larger than {max_bytes} bytes")
+        return bytes(data)
+    # Local files only from below base_dir: no absolute paths, ~ or .. out of it
+    root = os.path.realpath(base_dir)
+    path = os.path.realpath(os.path.join(root, source))
+    if os.path.commonpath([root, path]) != root:
+        raise PermissionError(f"{source} is outside {base_dir}")
+    if os.path.getsize(path) > max_bytes:
+        raise ValueError(f"Larger than {max_bytes} bytes")
+    with open(path, 'rb') as f:
+        return f.read()
+
+def parse_destination(text):
+    """
+    AT&GET destination: "0801"/"$C000" is C64 RAM, "R:10000"/"REU:10000" an
+    REU offset. Returns (space, address) or None if text is not an address.
+    """
+    text = text.strip().upper()
+    space = 'c64'
+    for prefix in ('REU:', 'R:'):
+        if text.startswith(prefix):
+            space, text = 'reu', text[len(prefix):]
+            break
+    try:
+        return space, int(text.lstrip('$'), 16)
+    except ValueError:
+        return None
+
+class OutboundBuffer:
+    """
+    Coalesces bytes typed on the C64 into fewer, larger writes. A flush happens
+    when max_bytes are buffered, at CR (flush_on_cr), or delay_ms after the
+    first buffered byte. A byte arriving after an idle gap of at least delay_ms
+    goes out at once, so interactive typing is not delayed while uploads
+    (XMODEM/Punter blocks) leave in full-sized writes.
+    """
+    def __init__(self, write, max_bytes=1024, delay_ms=20, flush_on_cr=True, **_):
+        self.write = write
+        self.max_bytes = max_bytes
+        self.delay = delay_ms / 1000
+        self.flush_on_cr = flush_on_cr
+        self.data = bytearray()
+        self.deadline = None
+        self.last_flush = 0.0
+        self.writes = 0
+        self.bytes = 0
+
+    def add(self, data):
+        now = time.monotonic()
+        idle = not self.data and now - self.last_flush >= self.delay
+        self.data += data
+        if idle or len(self.data) >= self.max_bytes or (self.flush_on_cr and 13 in data):
+            self.flush()
+        elif self.deadline is None:
+            self.deadline = now + self.delay
+
+    def due(self, now):
+        return self.deadline is not None and now >= self.deadline
+
+    def take(self):
+        """Remove and return everything buffered"""
+        data = bytes(self.data)
+        self.data.clear()
+        self.deadline = None
+        return data
+
+    def flush(self):
+        data = self.take()
+        if data:
+            self.last_flush = time.monotonic()
+            self.writes += 1
+            self.bytes += len(data)
+            self.write(data)
 
-    def close(self):
+class BaudPacer:
+    """
+    Token bucket releasing bytes to the C64 at the rate of a serial line, so
+    data arrives evenly at the speed the terminal program expects instead of
+    in FIFO-sized bursts. A full RX FIFO acts like CTS dropping: the pacer
+    empties the bucket and pauses for PACE_HOLD before sending on at line
+    rate. baud 0 disables pacing (bytes go as fast as the FIFO takes them).
+    """
+    def __init__(self, baud=BAUD):
+        self.set_rate(baud)
+        self.stalls = 0
+
+    def set_rate(self, baud):
+        self.baud = baud
+        self.rate = baud / BITS_PER_CHAR
+        self.burst = max(2.0, self.rate * PACE_BURST)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.held_until = 0.0
+
+    def available(self, now):
+        """Bytes that may be sent now"""
+        if not self.rate:
+            return sys.maxsize
+        if now < self.held_until:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return int(self.tokens)
+
+    def consume(self, count):
+        if self.rate:
+            self.tokens -= count
+
+    def hold(self, now):
+        """The FIFO was full: stop until the C64 has had time to catch up"""
+        self.stalls += 1
+        if self.rate:
+            self.tokens = 0.0
+            self.updated = self.held_until = now + PACE_HOLD
+
+    def wait(self, now, count):
+        """Seconds until count bytes (at most half a burst) may be sent"""
+        if not self.rate:
+            return 0.0
+        if now < self.held_until:
+            return self.held_until - now
+        # Half a burst leaves headroom in the bucket for select() waking up late
+        needed = min(count, self.burst / 2) - self.tokens - (now - self.updated) * self.rate
+        return max(0.0, needed / self.rate)
+
+class Caller:
+    """An inbound TCP caller waiting for the C64 to answer"""
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.since = time.monotonic()
+        self.position = None # Last position announced to the caller
+
+    def tell(self, text):
+        """Best-effort message to a waiting caller (non-blocking, never raises)"""
         try:
-            os.close(self.master_fd)
-            self.process.terminate()
-            self.process.wait()
-        except:
+            self.sock.send(text.encode('ascii'))
+        except OSError:
             pass
-        
-    def fileno(self):
-        return self.master_fd
 
 class ZiModemBridge:
-    def __init__(self):
-        self.config = ConfigManager()
-        self.fpga = FpgaInterface()
+    """
+    Bridges the C64's virtual UART (FPGA FIFOs) to TCP and local PTY sessions.
+
+    Any number of inbound callers can connect. The first one rings the C64;
+    the rest wait in a queue, are told their position whenever it changes and
+    ring in turn as soon as the current session ends. With auto-answer set
+    (ATS0=n or zimodem.auto_answer) the bridge answers after n rings.
+
+    run() is a selectors loop: the listen socket, the active connection and
+    (when configured) the FIFO interrupt are registered for readiness. The
+    FIFOs are serviced in bursts on every pass. Without a FIFO interrupt the
+    loop polls them, backing off from POLL_MIN to poll_idle while the C64 is
+    quiet, so an idle bridge sleeps in select() instead of spinning.
+
+    Nothing in the loop blocks on a peer. Connection sockets are non-blocking:
+    what a slow peer does not take waits in net_out and is sent on EVENT_WRITE,
+    and past NET_HIGH_WATER the C64's output stays in the TX FIFO. Outbound
+    dials complete on EVENT_WRITE too.
+    """
+    def __init__(self, fpga=None, config=None):
+        self.config = config if config is not None else ConfigManager()
+        self.fpga = fpga if fpga is not None else FpgaInterface()
         self.connected = False
         self.sock = None
         self.server_sock = None
@@ -60,10 +248,59 @@ class ZiModemBridge:
         self.verbose = True
         
         # Load config
-        self.listen_port = self.config.get('zimodem', {}).get('port', 6400)
-        self.enabled = self.config.get('zimodem', {}).get('enabled', True)
+        zimodem = self.config.get('zimodem', {})
+        self.listen_port = zimodem.get('port', 6400)
+        self.enabled = zimodem.get('enabled', True)
+        self.poll_idle = zimodem.get('poll_idle_ms', POLL_IDLE * 1000) / 1000
+        self.max_callers = zimodem.get('max_callers', MAX_CALLERS)
+        self.auto_answer = zimodem.get('auto_answer', 0)
+        self.telnet_mode = str(zimodem.get('telnet', 'auto')).lower() # auto, on or off
+        self.baud = zimodem.get('baud', BAUD)
+        self.rates = {str(target).upper(): rate for target, rate in zimodem.get('rates', {}).items()}
+        self.pacer = BaudPacer(self.baud)
+        self.capture_dir = zimodem.get('capture_dir', '') # Record every session here (replay with bridge_harness.py --replay)
+        coalesce = zimodem.get('coalesce', {})
+        self.coalesce = {kind: dict(policy, **coalesce.get(kind, {})) for kind, policy in COALESCE_DEFAULTS.items()}
         
         self.is_ringing = False
+        self.last_ring_time = 0
+        self.rings = 0
+        self.callers = deque() # Inbound callers; callers[0] rings while no session is active
+        self.ai = None # AIService, created on first AT&AI
+        self.ai_thread = None   # Worker streaming the current AT&AI answer
+        self.getting = False    # An AT&GET is in progress (fetch, then store_fetched)
+        self.fetched = deque()  # Finished AT&GET fetches for the loop to put into memory
+        self.posted = deque()   # Bytes for the C64 from other threads, see post_to_c64
+
+        self.input_buffer = ""
+        self.rx_pending = bytearray() # Host data waiting for room in the C64's RX FIFO
+        self.outbound = None          # OutboundBuffer of the active connection
+        self.telnet = None            # TelnetProtocol of the active connection, None when raw
+        self.telnet_detect = False    # Switch to telnet if the remote opens with negotiation
+        self.capture = None           # CaptureWriter of the active connection
+        self.reading = False          # Reading the active connection (EVENT_READ)
+        self.net_out = bytearray()    # Bytes the peer has not accepted yet (EVENT_WRITE)
+        self.events = 0               # Events the active connection is registered for
+        self.dialing = None           # Outbound connect in progress (non-blocking)
+        self.running = False
+        self.poll = POLL_MIN
+        self.tx_more = False
+
+        self.selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+        self.pool = None
+        pool = zimodem.get('pool')
+        if pool and pool.get('enabled', True):
+            targets = {name: dict(target, command=self.local_command(name))
+                       for name, target in pool.get('targets', {}).items() if target.get('size', 1)}
+            if targets:
+                self.pool = PtyPool(targets, pool.get('memory_budget_mb', MEMORY_BUDGET_MB))
+        self.irq_fd = self.fpga.open_fifo_irq(zimodem.get('fifo_irq'))
+        if self.irq_fd is not None:
+            self.selector.register(self.irq_fd, selectors.EVENT_READ, 'irq')
         
         if self.enabled:
             self.start_server()
@@ -74,52 +311,207 @@ class ZiModemBridge:
             self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_sock.bind(('0.0.0.0', self.listen_port))
-            self.server_sock.listen(1)
+            self.server_sock.listen(self.max_callers)
             self.server_sock.setblocking(False)
+            self.listen_port = self.server_sock.getsockname()[1]
+            self.selector.register(self.server_sock, selectors.EVENT_READ, 'accept')
             print(f"[Network] Listening on port {self.listen_port}")
         except Exception as e:
             print(f"[Network] Server Start Failed: {e}")
 
     def check_incoming_connection(self):
-        if self.server_sock and not self.connected and not self.is_ringing:
+        """Accept every pending caller into the queue"""
+        while True:
             try:
-                ready, _, _ = select.select([self.server_sock], [], [], 0)
-                if ready:
-                    client, addr = self.server_sock.accept()
-                    print(f"[Network] Incoming connection from {addr}")
-                    self.client_sock = client
-                    self.client_sock.setblocking(False)
-                    self.is_ringing = True
+                client, addr = self.server_sock.accept()
+            except BlockingIOError:
+                break
             except Exception as e:
                 print(f"[Network] Accept Error: {e}")
+                break
+            print(f"[Network] Incoming connection from {addr}")
+            client.setblocking(False)
+            if len(self.callers) + self.connected >= self.max_callers:
+                try:
+                    client.send(b"\r\nBUSY\r\n")
+                except OSError:
+                    pass
+                client.close()
+                continue
+            caller = Caller(client, addr)
+            self.callers.append(caller)
+            self.selector.register(client, selectors.EVENT_READ, caller)
+        self.update_queue()
+
+    def update_queue(self):
+        """Ring for the first caller when the line is free and tell the others where they are"""
+        if not self.connected and not self.dialing and not self.is_ringing and self.callers:
+            self.client_sock = self.callers[0].sock
+            self.is_ringing = True
+            self.rings = 0
+            self.last_ring_time = 0 # Ring on the next pass
+        for index, caller in enumerate(self.callers):
+            position = index if self.is_ringing else index + 1
+            if position == caller.position:
+                continue
+            caller.position = position
+            if position == 0:
+                caller.tell("\r\nRINGING...\r\n")
+            else:
+                caller.tell(f"\r\nLINE BUSY. YOU ARE NUMBER {position} IN LINE.\r\n")
+
+    def caller_event(self, caller):
+        """A waiting caller sent data (ignored) or hung up (dropped from the queue)"""
+        try:
+            data = caller.sock.recv(256)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if data:
+            return
+        print(f"[Network] {caller.addr} hung up while waiting")
+        self.selector.unregister(caller.sock)
+        caller.sock.close()
+        if self.is_ringing and self.callers[0] is caller:
+            self.is_ringing = False
+            self.client_sock = None
+        self.callers.remove(caller)
+        self.update_queue()
 
     def send_ring(self):
-        if self.is_ringing:
+        if self.is_ringing and time.monotonic() - self.last_ring_time >= RING_INTERVAL:
             self.send_to_c64("RING\r\n")
+            self.last_ring_time = time.monotonic()
+            self.rings += 1
+            if self.auto_answer and self.rings >= self.auto_answer:
+                self.answer_call()
 
     def answer_call(self):
         if self.is_ringing and self.client_sock:
-            self.sock = self.client_sock
-            self.connected = True
-            self.command_mode = False
-            self.is_ringing = False
-            self.send_to_c64("CONNECT 57600\r\n")
-            print("[Network] Call Answered")
+            caller = self.callers.popleft()
+            self.selector.unregister(caller.sock)
+            self.attach(caller.sock, telnet='server' if self.telnet_mode != 'off' else None,
+                        rate=self.rates.get('ANSWER'))
+            self.send_connect()
+            print(f"[Network] Call Answered after {time.monotonic() - caller.since:.1f}s, {len(self.callers)} waiting")
         else:
             self.send_to_c64("NO CARRIER\r\n")
 
+    def attach(self, sock, telnet=None, rate=None):
+        """
+        Make sock the active connection and switch to passthrough. telnet is
+        'client' or 'server' to negotiate telnet options from the start; rate
+        is the session's baud rate (default: the current ATB/zimodem.baud).
+        """
+        kind = 'pty' if isinstance(sock, LocalProcessConnection) else 'telnet'
+        policy = self.coalesce[kind]
+        # Never block the loop on one peer: unsent bytes wait in net_out for EVENT_WRITE
+        sock.setblocking(False)
+        if kind == 'telnet':
+            # Our own coalescing replaces Nagle, which would hold back keystrokes waiting for ACKs
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if policy.get('nodelay', True) else 0)
+        self.outbound = OutboundBuffer(self.send_to_network, **policy)
+        self.sock = sock
+        self.net_out = bytearray()
+        self.connected = True
+        self.command_mode = False
+        self.pacer.set_rate(self.baud if rate is None else rate)
+        self.telnet = None
+        self.telnet_detect = False
+        if telnet:
+            self.telnet = TelnetProtocol(server=telnet == 'server')
+            self.telnet.offer()
+            self.write_network(self.telnet.take_replies())
+        if self.capture_dir:
+            try:
+                peer = "%s_%s" % sock.getpeername()[:2]
+            except (AttributeError, OSError):
+                peer = "local"
+            self.capture = open_capture(self.capture_dir, peer, FLAG_TELNET if self.telnet else 0)
+        self.set_reading(True)
+        # The line is busy now: any ringing caller goes back to waiting
+        self.is_ringing = False
+        self.client_sock = None
+        self.update_queue()
+
+    def set_reading(self, enable):
+        """Start/stop reading the active connection (stopping applies TCP flow control to the peer)"""
+        if enable == self.reading or self.sock is None:
+            return
+        self.reading = enable
+        self.update_events()
+
+    def update_events(self):
+        """Register the active connection for reading (unless paused) and for writing while net_out holds data"""
+        events = (selectors.EVENT_READ if self.reading else 0) | (selectors.EVENT_WRITE if self.net_out else 0)
+        if self.sock is None or events == self.events:
+            return
+        if not self.events:
+            self.selector.register(self.sock, events, 'sock')
+        elif not events:
+            self.selector.unregister(self.sock)
+        else:
+            self.selector.modify(self.sock, events, 'sock')
+        self.events = events
+
+    def send_connect(self):
+        """Result code for a new session, with the rate it is paced at"""
+        # Unpaced sessions keep reporting the bridge's historical 57600
+        self.send_to_c64(f"CONNECT {self.pacer.baud or BAUD}\r\n")
+
     def send_to_c64(self, data):
-        """Writes bytes to the FPGA RX FIFO"""
+        """
+        Queue bytes for the C64 behind any network data already waiting, so
+        result codes stay in order. Nothing blocks here: what the RX FIFO and
+        the pacer allow goes at once, the rest is drained by the loop (flush_rx).
+        """
         if isinstance(data, str):
             data = data.encode('ascii', errors='ignore')
-        
-        for byte in data:
-            # Spin wait or retry if FIFO is full (simple implementation)
-            while not self.fpga.write_rx_fifo(byte):
-                time.sleep(0.001)
+        self.rx_pending += data
+        self.flush_rx()
+
+    def post_to_c64(self, data):
+        """send_to_c64 for other threads: the loop moves the bytes into rx_pending"""
+        if isinstance(data, str):
+            data = data.encode('ascii', errors='ignore')
+        self.posted.append(data)
+        self.wake()
+
+    def wake(self):
+        """Make the loop's select() return (safe from other threads)"""
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass # Already woken
+
+    def take_posted(self):
+        while self.fetched:
+            self.store_fetched(*self.fetched.popleft())
+        while self.posted:
+            self.rx_pending += self.posted.popleft()
+        self.flush_rx()
+
+    def flush_rx(self):
+        """Move queued bytes into the RX FIFO without waiting. Returns the number written."""
+        now = time.monotonic()
+        allowed = self.pacer.available(now)
+        if not allowed:
+            return 0
+        chunk = self.rx_pending if allowed >= len(self.rx_pending) else self.rx_pending[:allowed]
+        written = self.fpga.write_rx_burst(chunk)
+        self.pacer.consume(written)
+        if written < len(chunk):
+            self.pacer.hold(now)
+        if written:
+            del self.rx_pending[:written]
+            if not self.reading and not self.command_mode and len(self.rx_pending) < RX_LOW_WATER:
+                self.set_reading(True)
+        return written
 
     def process_at_command(self, cmd):
-        cmd = cmd.strip().upper()
+        raw = cmd.strip() # Paths and URLs keep their case
+        cmd = raw.upper()
         print(f"[Command] {cmd}")
         
         if cmd == "AT":
@@ -131,38 +523,146 @@ class ZiModemBridge:
         elif cmd == "ATH":
             self.disconnect()
             self.send_to_c64("OK\r\n")
+            self.update_queue()
         elif cmd == "ATA":
             self.answer_call()
+        elif cmd.startswith("ATS0="):
+            # Auto-answer after n rings (0 = off)
+            try:
+                self.auto_answer = int(cmd[5:])
+                self.send_to_c64("OK\r\n")
+            except ValueError:
+                self.send_to_c64("ERROR\r\n")
+        elif cmd.startswith("ATB"):
+            # Line rate for this and following sessions: ATB2400 .. ATB115200, ATB0 = unpaced
+            try:
+                baud = int(cmd[3:])
+                if baud and not 300 <= baud <= 115200:
+                    raise ValueError(baud)
+                self.baud = baud
+                self.pacer.set_rate(baud)
+                self.send_to_c64("OK\r\n")
+            except ValueError:
+                self.send_to_c64("ERROR\r\n")
         elif cmd == "ATI":
             self.send_to_c64("SuperCPU ZiModem Bridge V1.0\r\nOK\r\n")
+        elif cmd.startswith("AT&GET"):
+            # Host-side download into C64 RAM or the REU: AT&GET url-or-path[,addr]
+            self.get_file(raw[6:].strip())
+        elif cmd.startswith("AT&AI"):
+            # Ask the AI service: AT&AI prompt (as typed, not upper-cased)
+            self.ask_ai(raw[5:].strip())
         else:
             self.send_to_c64("ERROR\r\n")
 
+    def ask_ai(self, prompt):
+        """
+        Stream an AI answer to the C64 screen as it is generated. The request
+        runs on a worker thread, so the loop keeps serving the FIFOs, callers
+        and the network while the model thinks; one question at a time.
+        """
+        if not prompt or (self.ai_thread is not None and self.ai_thread.is_alive()):
+            self.send_to_c64("ERROR\r\n")
+            return
+        self.ai_thread = threading.Thread(target=self.answer_ai, args=(prompt,), name="ZiModem-AI", daemon=True)
+        self.ai_thread.start()
+
+    def answer_ai(self, prompt):
+        try:
+            if AI_SERVICE_DIR not in sys.path:
+                sys.path.append(AI_SERVICE_DIR)
+            if self.ai is None:
+                from ai_manager import AIService
+                self.ai = AIService(os.path.join(AI_SERVICE_DIR, 'config.json'))
+            from c64_stream import C64StreamSink
+        except Exception as e:
+            print(f"[AI] Service unavailable: {e}")
+            self.post_to_c64("ERROR\r\n")
+            return
+
+        sink = C64StreamSink(self.post_to_c64, petscii=False)
+        sink.consume(self.ai.stream_completion(prompt))
+        self.post_to_c64("\r\nOK\r\n")
+        if sink.first_char_latency is not None:
+            print(f"[AI] First character after {sink.first_char_latency:.2f}s, "
+                  f"{sink.bytes_sent} bytes in {sink.total_time:.2f}s")
+
+    def reu_size(self):
+        return int(self.config.get('reu', {}).get('size_mb', DEFAULT_REU_SIZE / (1024 * 1024)) * 1024 * 1024)
+
+    def get_file(self, args):
+        """
+        Fetch a file on the Linux side and put it straight into memory instead
+        of sending it through the UART. C64 RAM targets are staged in the top
+        64 KB of the REU and copied in by an REU DMA; without an address the
+        file is a PRG and goes to its load address.
+
+        The fetch runs on a worker thread (one at a time) so a slow server
+        does not stall the loop; the loop does the memory write, as the
+        FPGA is only driven from the loop's thread.
+        """
+        source, _, destination = args.rpartition(',')
+        target = parse_destination(destination) if source else None
+        if target is None:
+            source, target = args, ('c64', None)
+        if not source or self.getting:
+            self.send_to_c64("ERROR\r\n")
+            return
+        self.getting = True
+        threading.Thread(target=self.fetch_file, args=(source, target, time.monotonic()),
+                         name="ZiModem-GET", daemon=True).start()
+
+    def fetch_file(self, source, target, start):
+        try:
+            data = fetch_source(source, self.config.get('zimodem', {}).get('download_dir', DOWNLOAD_DIR))
+        except Exception as e:
+            print(f"[GET] {source}: {e}")
+            self.getting = False
+            self.post_to_c64("ERROR\r\n")
+            return
+        self.fetched.append((source, target, data, start))
+        self.wake()
+
+    def store_fetched(self, source, target, data, start):
+        """Put a fetched file into C64 RAM or the REU and report it (loop thread)"""
+        self.getting = False
+        space, address = target
+        try:
+            if space == 'reu':
+                if address + len(data) > self.reu_size():
+                    raise ValueError(f"{len(data)} bytes do not fit in the REU at ${address:06X}")
+                self.fpga.write_block(address, data)
+            else:
+                if address is None or source.lower().endswith('.prg'):
+                    if len(data) < 2:
+                        raise ValueError("Not a PRG file")
+                    load_address = data[0] | (data[1] << 8)
+                    data = data[2:]
+                    if address is None:
+                        address = load_address
+                if not copy_to_c64(self.fpga, address, data, self.reu_size()):
+                    raise IOError("REU DMA did not complete")
+        except Exception as e:
+            print(f"[GET] {source}: {e}")
+            self.send_to_c64("ERROR\r\n")
+            return
+        elapsed = (time.monotonic() - start) * 1000
+        digits = 6 if space == 'reu' else 4
+        end = address + len(data) - 1
+        print(f"[GET] {source}: {len(data)} bytes to {space} ${address:0{digits}X} in {elapsed:.1f} ms")
+        self.send_to_c64(f"LOADED {len(data)} BYTES ${address:0{digits}X}-${end:0{digits}X} IN {elapsed:.0f} MS\r\nOK\r\n")
+
     def connect(self, addr_str):
+        self.cancel_dial() # A new ATD replaces a dial still in progress
         try:
             # Check for Special Local Connections
+            rate = self.rates.get(addr_str.upper())
             if addr_str.upper() == "SIMH":
-                print(f"[Network] Starting Local SIMH PDP-11...")
-                self.send_to_c64(f"BOOTING PDP-11...\r\n")
-                # Assuming simh is installed and a boot script exists
-                # We use a wrapper script to handle the specific simh configuration
-                pdp_script = os.path.join(os.path.dirname(__file__), '../../../data/pdp11/run_pdp11.sh')
-                if os.path.exists(pdp_script):
-                    self.sock = LocalProcessConnection(pdp_script)
-                else:
-                    # Fallback if script missing
-                    self.sock = LocalProcessConnection("pdp11")
-                
-                self.connected = True
-                self.command_mode = False
+                self.dial_local("SIMH", "BOOTING PDP-11...", rate)
                 return
 
             if addr_str.upper() == "SHELL":
-                print(f"[Network] Starting Local Shell...")
-                self.send_to_c64(f"STARTING LINUX SHELL...\r\n")
-                self.sock = LocalProcessConnection("/bin/bash -i")
-                self.connected = True
-                self.command_mode = False
+                self.dial_local("SHELL", "STARTING LINUX SHELL...", rate)
                 return
 
             if ":" in addr_str:
@@ -175,99 +675,321 @@ class ZiModemBridge:
             print(f"[Network] Connecting to {host}:{port}...")
             self.send_to_c64(f"DIALING {host}:{port}...\r\n")
             
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.settimeout(5)
-            self.sock.connect((host, port))
-            self.sock.setblocking(False)
-            
-            self.connected = True
-            self.command_mode = False
-            self.send_to_c64("CONNECT 57600\r\n")
-            print("[Network] Connected")
+            # Connect without blocking: the loop finishes the dial when the socket turns writable
+            family, kind, proto, _, address = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_STREAM)[0]
+            sock = socket.socket(family, kind, proto)
+            sock.setblocking(False)
+            error = sock.connect_ex(address)
+            if error not in (0, errno.EINPROGRESS):
+                sock.close()
+                raise OSError(error, os.strerror(error))
+            self.dialing = {'sock': sock, 'port': port, 'rate': rate, 'deadline': time.monotonic() + DIAL_TIMEOUT}
+            self.selector.register(sock, selectors.EVENT_WRITE, 'dial')
             
         except Exception as e:
             print(f"[Network] Connection Failed: {e}")
             self.send_to_c64(f"NO CARRIER\r\n")
             self.connected = False
 
+    def finish_dial(self, timed_out=False):
+        """The outbound connect completed (or DIAL_TIMEOUT passed): go online or report NO CARRIER"""
+        dial, self.dialing = self.dialing, None
+        sock = dial['sock']
+        self.selector.unregister(sock)
+        error = errno.ETIMEDOUT if timed_out else sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            print(f"[Network] Connection Failed: {os.strerror(error)}")
+            sock.close()
+            self.send_to_c64("NO CARRIER\r\n")
+            self.update_queue()
+            return
+        port = dial['port']
+        telnet = self.telnet_mode == 'on' or (self.telnet_mode == 'auto' and port in TELNET_PORTS)
+        self.attach(sock, telnet='client' if telnet else None, rate=dial['rate'])
+        self.telnet_detect = self.telnet_mode == 'auto' and not telnet
+        self.send_connect()
+        print("[Network] Connected")
+
+    def cancel_dial(self):
+        if self.dialing:
+            self.selector.unregister(self.dialing['sock'])
+            self.dialing['sock'].close()
+            self.dialing = None
+
+    def local_command(self, target):
+        if target == "SIMH":
+            # Assuming simh is installed and a boot script exists
+            # We use a wrapper script to handle the specific simh configuration
+            if os.path.exists(PDP11_SCRIPT):
+                return PDP11_SCRIPT
+            return "pdp11" # Fallback if script missing
+        return "/bin/bash -i"
+
+    def dial_local(self, target, banner, rate=None):
+        """Connect to a local session, pre-booted from the pool when one is warm"""
+        conn = self.pool.acquire(target) if self.pool else None
+        if conn is None:
+            print(f"[Network] Starting Local {target}...")
+            self.send_to_c64(f"{banner}\r\n")
+            conn = LocalProcessConnection(self.local_command(target))
+        else:
+            print(f"[Network] Warm {target} session from the pool")
+        self.attach(conn, rate=rate)
+        # What the warm session printed while booting (banner, prompt)
+        self.rx_pending += conn.greeting
+        if self.capture and conn.greeting:
+            self.capture.write(TO_C64, conn.greeting)
+
     def disconnect(self):
+        self.cancel_dial()
         if self.sock:
+            self.reading = False
+            self.net_out = bytearray()
+            self.update_events()
+            pending = self.outbound.take()
+            if pending and self.telnet:
+                pending = self.telnet.encode(pending)
+            if pending:
+                try:
+                    self.sock.send(pending) # Best effort: the line is being dropped
+                except OSError:
+                    pass
             self.sock.close()
+        if self.capture:
+            self.capture.close()
+            print(f"[Capture] {self.capture.path}: {self.capture.bytes[TO_C64]} bytes in, "
+                  f"{self.capture.bytes[FROM_C64]} bytes out")
+            self.capture = None
+        if self.pacer.stalls:
+            print(f"[Pacing] {self.pacer.stalls} RX FIFO stalls at {self.pacer.baud or 'unpaced'} baud")
+        self.pacer.stalls = 0
+        self.pacer.set_rate(self.baud)
+        # What the dropped session still had queued must not delay the result codes.
+        # In command mode rx_pending only holds echoes and result codes (the escape dropped the rest).
+        if not self.command_mode:
+            self.rx_pending = bytearray()
+        self.posted.clear()
         self.sock = None
+        self.outbound = None
+        self.telnet = None
         self.connected = False
         self.command_mode = True
         print("[Network] Disconnected")
 
+    def hang_up(self):
+        """Remote side went away: drop the call, tell the C64 and ring for the next caller"""
+        # Data that arrived before the remote closed is still shown (unless the C64 escaped to command mode)
+        received = self.rx_pending if not self.command_mode else b""
+        self.disconnect()
+        self.send_to_c64(received + b"\r\nNO CARRIER\r\n")
+        self.update_queue()
+
+    def send_to_network(self, data):
+        if self.telnet:
+            data = self.telnet.encode(data)
+        self.write_network(data)
+
+    def write_network(self, data):
+        """Send bytes to the active connection as they are (no telnet escaping)"""
+        if not data or self.sock is None:
+            return
+        if self.net_out:
+            self.net_out += data # Behind what is already waiting
+            return
+        try:
+            sent = self.sock.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError as e:
+            print(f"Socket Error: {e}")
+            self.hang_up()
+            return
+        if sent < len(data):
+            self.net_out += data[sent:]
+            self.update_events()
+
+    def flush_network(self):
+        """The peer can take more (EVENT_WRITE): send what is waiting in net_out"""
+        try:
+            sent = self.sock.send(self.net_out)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Socket Error: {e}")
+            self.hang_up()
+            return
+        del self.net_out[:sent]
+        if not self.net_out:
+            self.update_events()
+
+    def read_network(self):
+        if self.command_mode:
+            self.set_reading(False) # Escaped since the select: leave the data in the socket
+            return
+        try:
+            net_data = self.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"Socket Error: {e}")
+            net_data = b""
+        if not net_data:
+            self.hang_up()
+            return
+        if self.capture:
+            self.capture.write(TO_C64, net_data)
+        if self.telnet_detect:
+            # A server on a non-telnet port that opens with WILL/WONT/DO/DONT speaks telnet
+            self.telnet_detect = False
+            if len(net_data) > 1 and net_data[0] == IAC and DONT <= net_data[1] <= WILL:
+                print("[Network] Remote negotiates telnet, enabling it")
+                self.telnet = TelnetProtocol()
+        if self.telnet:
+            net_data = self.telnet.decode(net_data)
+            if self.telnet.replies:
+                self.write_network(self.telnet.take_replies())
+                if self.sock is None:
+                    return # Hung up while replying
+        self.rx_pending += net_data
+        if len(self.rx_pending) >= RX_HIGH_WATER:
+            self.set_reading(False)
+
+    def handle_c64_input(self, data):
+        """Bytes typed on the C64: AT commands in command mode, passthrough otherwise"""
+        i = 0
+        while i < len(data):
+            if self.command_mode:
+                self.command_byte(data[i])
+                i += 1
+            else:
+                i = self.passthrough(data, i)
+
+    def command_byte(self, byte):
+        char = chr(byte)
+        if self.echo:
+            self.send_to_c64(char)
+        if byte == 13: # CR
+            self.send_to_c64("\n") # Add LF
+            self.process_at_command(self.input_buffer)
+            self.input_buffer = ""
+        else:
+            self.input_buffer += char
+
+    def passthrough(self, data, start):
+        """Send data[start:] to the connection up to an escape (+++). Returns where it stopped."""
+        end = len(data)
+        escaped = False
+        if b'+' not in data[start:]:
+            self.input_buffer = ""
+        else:
+            # Check for escape sequence (+++) - Simplified
+            # In a real implementation, we need timing guards
+            for i in range(start, end):
+                if data[i] == 0x2B: # '+'
+                    if self.input_buffer == "++":
+                        end = i + 1
+                        escaped = True
+                        break
+                    self.input_buffer += "+"
+                else:
+                    self.input_buffer = ""
+        if self.sock:
+            if self.capture:
+                self.capture.write(FROM_C64, data[start:end])
+            self.outbound.add(data[start:end])
+        if escaped:
+            if self.outbound:
+                self.outbound.flush()
+            self.command_mode = True
+            # Remote data waits in the socket while in command mode; what was queued is dropped
+            self.set_reading(False)
+            self.rx_pending = bytearray()
+            self.send_to_c64("\r\nOK\r\n")
+            self.input_buffer = ""
+        return end
+
+    def service_fifo(self):
+        """One burst each way between the FIFOs and the host. Returns the bytes moved."""
+        moved = self.flush_rx() if self.rx_pending else 0
+        if len(self.net_out) >= NET_HIGH_WATER:
+            # The peer is slow: leave C64 output in the TX FIFO until it catches up
+            self.tx_more = False
+            return moved
+        data = self.fpga.read_tx_burst(FIFO_BURST)
+        self.tx_more = len(data) == FIFO_BURST # FIFO may still hold more
+        if data:
+            self.handle_c64_input(data)
+            moved += len(data)
+        return moved
+
+    def next_timeout(self):
+        if self.tx_more:
+            timeout = 0
+        elif self.rx_pending:
+            # C64 is draining the RX FIFO, or the pacer releases the next burst
+            timeout = max(POLL_MIN, self.pacer.wait(time.monotonic(), len(self.rx_pending)))
+        elif self.irq_fd is not None:
+            timeout = None
+        else:
+            timeout = self.poll
+        deadlines = []
+        if self.is_ringing:
+            deadlines.append(self.last_ring_time + RING_INTERVAL)
+        if self.outbound is not None and self.outbound.deadline is not None:
+            deadlines.append(self.outbound.deadline)
+        if self.dialing:
+            deadlines.append(self.dialing['deadline'])
+        if deadlines:
+            due = max(0.0, min(deadlines) - time.monotonic())
+            timeout = due if timeout is None else min(timeout, due)
+        return timeout
+
+    def stop(self):
+        """Make run() return (safe from other threads)"""
+        self.running = False
+        if self.pool:
+            self.pool.close()
+        self.wake()
+
     def run(self):
-        input_buffer = ""
-        last_ring_time = 0
-        
+        self.running = True
         try:
-            while True:
-                # 0. Check for Incoming Calls
-                self.check_incoming_connection()
-                
-                # Ring every 3 seconds if ringing
-                if self.is_ringing:
-                    if time.time() - last_ring_time > 3:
-                        self.send_ring()
-                        last_ring_time = time.time()
-
-                # 1. Read from C64 (FPGA TX FIFO)
-                byte = self.fpga.read_tx_fifo()
-                if byte is not None:
-                    char = chr(byte)
-                    
-                    if self.command_mode:
-                        if self.echo:
-                            self.send_to_c64(char)
-                            
-                        if byte == 13: # CR
-                            self.send_to_c64("\n") # Add LF
-                            self.process_at_command(input_buffer)
-                            input_buffer = ""
-                        else:
-                            input_buffer += char
-                    else:
-                        # Passthrough mode (send to socket)
-                        if self.sock:
-                            try:
-                                self.sock.send(bytes([byte]))
-                            except BrokenPipeError:
-                                self.disconnect()
-                                self.send_to_c64("\r\nNO CARRIER\r\n")
-
-                        # Check for escape sequence (+++) - Simplified
-                        # In a real implementation, we need timing guards
-                        if char == '+':
-                            if input_buffer == "++":
-                                self.command_mode = True
-                                self.send_to_c64("\r\nOK\r\n")
-                                input_buffer = ""
-                            else:
-                                input_buffer += "+"
-                        else:
-                            input_buffer = ""
-
-                # 2. Read from Network (Socket)
-                if self.connected and self.sock:
-                    try:
-                        ready_to_read, _, _ = select.select([self.sock], [], [], 0)
-                        if ready_to_read:
-                            net_data = self.sock.recv(1024)
-                            if not net_data:
-                                self.disconnect()
-                                self.send_to_c64("\r\nNO CARRIER\r\n")
-                            else:
-                                self.send_to_c64(net_data)
-                    except Exception as e:
-                        print(f"Socket Error: {e}")
-                        self.disconnect()
-
-                time.sleep(0.0001) # Prevent 100% CPU usage
+            while self.running:
+                for key, mask in self.selector.select(self.next_timeout()):
+                    if key.data == 'accept':
+                        self.check_incoming_connection()
+                    elif key.data == 'sock' and self.sock:
+                        if mask & selectors.EVENT_WRITE:
+                            self.flush_network()
+                        if mask & selectors.EVENT_READ and self.sock:
+                            self.read_network()
+                    elif key.data == 'dial' and self.dialing:
+                        self.finish_dial()
+                    elif isinstance(key.data, Caller):
+                        self.caller_event(key.data)
+                    elif key.data == 'irq':
+                        self.fpga.ack_fifo_irq(self.irq_fd)
+                    elif key.data == 'wake':
+                        try:
+                            self._wake_r.recv(64)
+                        except BlockingIOError:
+                            pass
+                self.send_ring()
+                if self.posted or self.fetched:
+                    self.take_posted()
+                if self.dialing and time.monotonic() >= self.dialing['deadline']:
+                    self.finish_dial(timed_out=True)
+                if self.outbound is not None and self.outbound.due(time.monotonic()):
+                    self.outbound.flush()
+                if self.service_fifo():
+                    self.poll = POLL_MIN
+                else:
+                    self.poll = min(self.poll * 2, self.poll_idle)
 
         except KeyboardInterrupt:
             print("Stopping Bridge...")
+            if self.pool:
+                self.pool.close()
             self.fpga.close()
 
 if __name__ == "__main__":
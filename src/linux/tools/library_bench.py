@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Library export/import throughput benchmark.
+
+Builds a throwaway library with N synthetic items (metadata only, no
+files) and times JSON Lines export, JSON array export and bulk import
+into a fresh database, then the //LIB name index: building it, LOAD by
+name and by pattern, and against a DB query per LOAD.
+
+    python3 src/linux/tools/library_bench.py --items 100000
+"""
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Add services path
+sys.path.append(os.path.join(os.path.dirname(__file__), '../services'))
+
+from library_db import LibraryDatabase
+from library_manager import LibraryManager
+
+GENRES = ["Platformer", "Shoot 'em up", "Puzzle", "Adventure", "Sports", "Demo"]
+
+def synthetic_items(count):
+    for i in range(count):
+        yield {
+            'title': f"Test Title {i}",
+            'filename': f"TEST{i}",
+            'file_size': 16384 + i % 4096,
+            'file_type': 'PRG',
+            'year': 1982 + i % 12,
+            'publisher': f"Publisher {i % 500}",
+            'genre': GENRES[i % len(GENRES)],
+            'description': "Synthetic benchmark record " * 4,
+            'ai_tags': '["bench", "synthetic"]',
+            'content_hash': hashlib.sha1(str(i).encode()).hexdigest(),
+        }
+
+def timed(label, count, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed:8.2f} s  {count / elapsed:10.0f} items/s")
+
+def name_lookups(lib, count, lookups=1000):
+    """Time the //LIB name index against querying the database for every LOAD"""
+    timed("name index build", count, lib.name_index)
+    names = [lib.names.name_of(i) for i in range(1, count + 1, max(1, count // lookups))]
+    timed("LOAD by name", len(names), lambda: [lib.resolve_name("//LIB", n) for n in names])
+    patterns = [n[:12] + "*" for n in names]
+    timed("LOAD by NAME*", len(patterns), lambda: [lib.resolve_name("//LIB", p) for p in patterns])
+    patterns = [n[:5] + "?" + n[6:] for n in names]
+    timed("LOAD by NA?E", len(patterns), lambda: [lib.resolve_name("//LIB", p) for p in patterns])
+    timed("LOAD in BY GENRE/DEMO", len(names),
+          lambda: [lib.resolve_name("//LIB/BY GENRE/DEMO", n) for n in names])
+    few = names[:20]
+    timed("LOAD by DB query", len(few), lambda: [
+        next(i['id'] for i in lib.db.search() if lib.c64_name(i) == n) for n in few])
+
+def main():
+    parser = argparse.ArgumentParser(description="Library export/import benchmark")
+    parser.add_argument('--items', type=int, default=100000, help='Number of synthetic items')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    work = tempfile.mkdtemp(prefix="libbench_")
+    try:
+        src = LibraryManager(LibraryDatabase(os.path.join(work, 'src.db'), os.path.join(work, 'src_storage')))
+        timed("seed (bulk upsert)", args.items, lambda: src.db.bulk_upsert_items(synthetic_items(args.items)))
+
+        jsonl_path = os.path.join(work, 'export.jsonl')
+        json_path = os.path.join(work, 'export.json')
+        timed("export JSONL", args.items, lambda: src.export_library_to_json(jsonl_path))
+        timed("export JSON", args.items, lambda: src.export_library_to_json(json_path))
+
+        dst = LibraryManager(LibraryDatabase(os.path.join(work, 'dst.db'), os.path.join(work, 'dst_storage')))
+        timed("import JSONL (new)", args.items, lambda: dst.import_library_from_json(jsonl_path))
+        timed("import JSONL (re-run)", args.items, lambda: dst.import_library_from_json(jsonl_path))
+
+        name_lookups(dst, args.items)
+    finally:
+        shutil.rmtree(work)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,51 @@
 import json
 import os
 import sys
+import time
+import logging
+import threading
 import requests
 import argparse
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, Optional
+from requests.adapters import HTTPAdapter
+from response_cache import ResponseCache, CACHE_PATH
+from router import ProviderRouter
 
 # Configuration Paths
 CONFIG_FILE = 'config.json'
 
+# Defaults for the optional keys in config['system']
+CONNECT_TIMEOUT = 5      # Seconds to establish a connection
+READ_TIMEOUT = 30        # Seconds between bytes of the answer (request_timeout)
+GENERATE_TIMEOUT = 600   # A non-streamed answer arrives only once it is complete (generate_timeout)
+PREWARM_TIMEOUT = 120    # Loading a model from disk can take a while
+MODELS_TTL = 300         # Seconds a fetched model list is reused
+POOL_SIZE = 4            # Keep-alive connections per provider
+
 class AIService:
     def __init__(self, config_path: str):
         self.config = self.load_config(config_path)
         self.active_provider = self.config['system']['active_provider']
-        
+        cache_config = self.config['system'].get('cache', {})
+        self.cache = ResponseCache(
+            path=cache_config.get('path', CACHE_PATH),
+            max_mb=cache_config.get('max_mb', 64),
+            enabled=cache_config.get('enabled', True)
+        )
+        self.logger = logging.getLogger("AIService")
+        system = self.config['system']
+        self.timeout = (system.get('connect_timeout', CONNECT_TIMEOUT), system.get('request_timeout', READ_TIMEOUT))
+        self.generate_timeout = (self.timeout[0], system.get('generate_timeout', GENERATE_TIMEOUT))
+        self.models_ttl = system.get('models_ttl', MODELS_TTL)
+        self.pool_size = system.get('pool_size', POOL_SIZE)
+        self.sessions = {}   # provider -> requests.Session
+        self._models = {}    # provider -> (expires, model list)
+        self.latency = {}    # (provider, model, operation) -> stats, see _record
+        self._lock = threading.Lock()
+        self.router = ProviderRouter(self)
+        if system.get('prewarm', False):
+            threading.Thread(target=self.prewarm, daemon=True).start()
+
     def load_config(self, path: str) -> Dict[str, Any]:
         if not os.path.exists(path):
             raise FileNotFoundError(f"Config file not found at {path}")
@@ -25,51 +58,149 @@ class AIService:
             raise ValueError(f"Provider '{name}' not configured")
         return self.config['providers'][name]
 
-    def get_available_models(self, provider: Optional[str] = None) -> list:
+    # --------------------------------------------------------------------------
+    # HTTP plumbing
+    # --------------------------------------------------------------------------
+    def session(self, provider_name: str) -> requests.Session:
+        """One pooled keep-alive session per provider, created on first use"""
+        with self._lock:
+            session = self.sessions.get(provider_name)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[provider_name] = session
+        return session
+
+    def _request(self, provider_name: str, model: str, operation: str, method: str, url: str, **kwargs):
+        """
+        Send a request on the provider's session and record its latency.
+        For stream=True the time is measured to the response headers.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.monotonic()
+        try:
+            response = self.session(provider_name).request(method, url, **kwargs)
+            response.raise_for_status()
+        except Exception:
+            self._record(provider_name, model, operation, time.monotonic() - start, ok=False)
+            raise
+        self._record(provider_name, model, operation, time.monotonic() - start, ok=True)
+        return response
+
+    def _record(self, provider_name: str, model: str, operation: str, elapsed: float, ok: bool):
+        with self._lock:
+            stats = self.latency.setdefault((provider_name, model, operation),
+                                            {'count': 0, 'errors': 0, 'total': 0.0, 'last': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['last'] = elapsed
+            if ok:
+                stats['total'] += elapsed
+                stats['max'] = max(stats['max'], elapsed)
+            else:
+                stats['errors'] += 1
+        self.logger.info(f"{provider_name}/{model} {operation}: {elapsed * 1000:.0f} ms{'' if ok else ' (failed)'}")
+
+    def latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per provider/model/operation request counts, errors and latency in seconds"""
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self.latency.items()]
+        report = {}
+        for (provider_name, model, operation), stats in items:
+            ok = stats['count'] - stats['errors']
+            stats['avg'] = stats['total'] / ok if ok else None
+            report[f"{provider_name}/{model}/{operation}"] = stats
+        return report
+
+    def close(self):
+        with self._lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+    def prewarm(self, provider: Optional[str] = None, model: Optional[str] = None) -> bool:
+        """
+        Open the provider's connection and fill the model-list cache so the
+        first real request skips the TCP/TLS handshake. For Ollama also load
+        the model into memory (an empty prompt only loads it).
+        """
+        provider_name = provider or self.active_provider
+        provider_config = self.get_provider_config(provider_name)
+        if not provider_config['enabled']:
+            return False
+        model_name = model or provider_config['default_model']
+        try:
+            self._models_cached(provider_name, provider_config, refresh=True)
+            if provider_name == 'ollama':
+                self._request(provider_name, model_name, 'prewarm', 'POST',
+                              f"{provider_config['base_url']}/api/generate",
+                              json={"model": model_name, "prompt": ""},
+                              timeout=(self.timeout[0], PREWARM_TIMEOUT))
+            self.logger.info(f"Prewarmed {provider_name}/{model_name}")
+            return True
+        except Exception as e:
+            self.logger.warning(f"Prewarm of {provider_name} failed: {e}")
+            return False
+
+    # --------------------------------------------------------------------------
+    # Models
+    # --------------------------------------------------------------------------
+    def get_available_models(self, provider: Optional[str] = None, refresh: bool = False) -> list:
+        """Model names offered by the provider; lists are reused for models_ttl seconds"""
         provider_name = provider or self.active_provider
         provider_config = self.get_provider_config(provider_name)
         
         if not provider_config['enabled']:
             return [f"Error: Provider '{provider_name}' is disabled."]
 
-        api_key = provider_config.get('api_key', '')
-        base_url = provider_config['base_url']
-
         try:
-            if provider_name == 'ollama':
-                return self._fetch_ollama_models(base_url)
-            elif provider_name == 'openai':
-                return self._fetch_openai_models(base_url, api_key)
-            elif provider_name == 'google':
-                return self._fetch_google_models(base_url, api_key)
-            elif provider_name == 'copilot':
-                return ["copilot-chat"] # Copilot API doesn't easily list models via standard endpoints
-            else:
-                return [f"Error: Unknown provider '{provider_name}'"]
+            return self._models_cached(provider_name, provider_config, refresh)
         except Exception as e:
             return [f"Error fetching models: {str(e)}"]
 
-    def _fetch_ollama_models(self, base_url: str) -> list:
+    def _models_cached(self, provider_name: str, provider_config: Dict[str, Any], refresh: bool = False) -> list:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._models.get(provider_name)
+        if cached and not refresh and cached[0] > now:
+            return list(cached[1])
+
+        api_key = provider_config.get('api_key', '')
+        base_url = provider_config['base_url']
+        if provider_name == 'ollama':
+            models = self._fetch_ollama_models(provider_name, base_url)
+        elif provider_name == 'openai':
+            models = self._fetch_openai_models(provider_name, base_url, api_key)
+        elif provider_name == 'google':
+            models = self._fetch_google_models(provider_name, base_url, api_key)
+        elif provider_name == 'copilot':
+            models = ["copilot-chat"] # Copilot API doesn't easily list models via standard endpoints
+        else:
+            return [f"Error: Unknown provider '{provider_name}'"]
+
+        with self._lock:
+            self._models[provider_name] = (now + self.models_ttl, models)
+        return list(models)
+
+    def _fetch_ollama_models(self, provider_name: str, base_url: str) -> list:
         url = f"{base_url}/api/tags"
-        response = requests.get(url)
-        response.raise_for_status()
+        response = self._request(provider_name, '-', 'models', 'GET', url)
         data = response.json()
         return [model['name'] for model in data.get('models', [])]
 
-    def _fetch_openai_models(self, base_url: str, api_key: str) -> list:
+    def _fetch_openai_models(self, provider_name: str, base_url: str, api_key: str) -> list:
         url = f"{base_url}/models"
         headers = {"Authorization": f"Bearer {api_key}"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
+        response = self._request(provider_name, '-', 'models', 'GET', url, headers=headers)
         data = response.json()
         return [model['id'] for model in data.get('data', [])]
 
-    def _fetch_google_models(self, base_url: str, api_key: str) -> list:
+    def _fetch_google_models(self, provider_name: str, base_url: str, api_key: str) -> list:
         # base_url is usually .../v1beta/models
         # We need to GET that URL directly
         url = f"{base_url}?key={api_key}"
-        response = requests.get(url)
-        response.raise_for_status()
+        response = self._request(provider_name, '-', 'models', 'GET', url)
         data = response.json()
         # Filter for 'generateContent' supported models
         models = []
@@ -78,7 +209,21 @@ class AIService:
                 models.append(m['name'].split('/')[-1]) # remove 'models/' prefix
         return models
 
-    def generate_completion(self, prompt: str, provider: Optional[str] = None, model: Optional[str] = None) -> str:
+    # --------------------------------------------------------------------------
+    # Completions
+    # --------------------------------------------------------------------------
+    def generate_completion(self, prompt: str, provider: Optional[str] = None, model: Optional[str] = None,
+                            use_cache: bool = True, lane: Optional[str] = None) -> str:
+        """
+        Returns the model's answer. Identical requests (same provider, model,
+        normalized prompt and temperature) are served from the response cache
+        unless use_cache is False; a bypassed call still refreshes the entry.
+        With a lane ('interactive' or 'background') and no explicit provider
+        the router picks the provider, see router.py.
+        """
+        if lane is not None and provider is None:
+            return self.router.complete(prompt, lane, use_cache=use_cache)
+
         provider_name = provider or self.active_provider
         provider_config = self.get_provider_config(provider_name)
         
@@ -88,33 +233,171 @@ class AIService:
         model_name = model or provider_config['default_model']
         api_key = provider_config.get('api_key', '')
         base_url = provider_config['base_url']
+        temperature = self.config['system'].get('temperature', 0.7)
+
+        if use_cache:
+            cached = self.cache.get(provider_name, model_name, prompt, temperature)
+            if cached is not None:
+                return cached
         
         try:
             if provider_name == 'ollama':
-                return self._call_ollama(base_url, model_name, prompt)
+                result = self._call_ollama(provider_name, base_url, model_name, prompt)
             elif provider_name == 'openai':
-                return self._call_openai(base_url, api_key, model_name, prompt)
+                result = self._call_openai(provider_name, base_url, api_key, model_name, prompt)
             elif provider_name == 'google':
-                return self._call_google(base_url, api_key, model_name, prompt)
+                result = self._call_google(provider_name, base_url, api_key, model_name, prompt)
             elif provider_name == 'copilot':
-                return self._call_openai(base_url, api_key, model_name, prompt) # Copilot often uses OpenAI-like schema
+                result = self._call_openai(provider_name, base_url, api_key, model_name, prompt) # Copilot often uses OpenAI-like schema
             else:
                 return f"Error: Unknown provider '{provider_name}'"
         except Exception as e:
             return f"Error calling AI API: {str(e)}"
 
-    def _call_ollama(self, base_url: str, model: str, prompt: str) -> str:
+        self.cache.put(provider_name, model_name, prompt, temperature, result)
+        return result
+
+    def stream_completion(self, prompt: str, provider: Optional[str] = None, model: Optional[str] = None,
+                          use_cache: bool = True) -> Iterator[str]:
+        """
+        Same as generate_completion, but yields the answer in chunks as the
+        provider produces them, so the first characters can be shown after the
+        model's first-token latency instead of the full generation time.
+        A cached answer is yielded as a single chunk; a completed stream is
+        written to the cache. Errors are yielded as an "Error: ..." chunk.
+        """
+        provider_name = provider or self.active_provider
+        provider_config = self.get_provider_config(provider_name)
+
+        if not provider_config['enabled']:
+            yield f"Error: Provider '{provider_name}' is disabled."
+            return
+
+        model_name = model or provider_config['default_model']
+        temperature = self.config['system'].get('temperature', 0.7)
+
+        if use_cache:
+            cached = self.cache.get(provider_name, model_name, prompt, temperature)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        try:
+            for chunk in self.open_stream(provider_name, model_name, prompt):
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            # Whatever already reached the caller stays on screen; don't cache a partial answer
+            yield f"Error calling AI API: {str(e)}"
+            return
+
+        self.cache.put(provider_name, model_name, prompt, temperature, "".join(parts))
+
+    def open_stream(self, provider_name: str, model_name: str, prompt: str,
+                    on_response: Optional[Callable] = None) -> Iterator[str]:
+        """
+        Raw chunk stream from one provider: no cache, errors are raised.
+        Closing the generator early closes the HTTP response. on_response is
+        called with the requests.Response once the headers are in, so another
+        thread can abort a stream that is blocked waiting for its next chunk.
+        """
+        provider_config = self.get_provider_config(provider_name)
+        api_key = provider_config.get('api_key', '')
+        base_url = provider_config['base_url']
+        if provider_name == 'ollama':
+            chunks = self._stream_ollama(provider_name, base_url, model_name, prompt, on_response)
+        elif provider_name in ('openai', 'copilot'):
+            chunks = self._stream_openai(provider_name, base_url, api_key, model_name, prompt, on_response)
+        elif provider_name == 'google':
+            chunks = self._stream_google(provider_name, base_url, api_key, model_name, prompt, on_response)
+        else:
+            raise ValueError(f"Unknown provider '{provider_name}'")
+        try:
+            for chunk in chunks:
+                if chunk:
+                    yield chunk
+        finally:
+            chunks.close()
+
+    def _iter_sse(self, response) -> Iterator[Dict[str, Any]]:
+        """Decode the JSON payloads of a Server-Sent Events stream"""
+        with response:
+            for line in response.iter_lines():
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    return
+                yield json.loads(data)
+
+    def _stream_ollama(self, provider_name: str, base_url: str, model: str, prompt: str,
+                       on_response: Optional[Callable] = None) -> Iterator[str]:
+        # Ollama streams one JSON object per line
+        response = self._request(provider_name, model, 'stream', 'POST', f"{base_url}/api/generate",
+                                 json={"model": model, "prompt": prompt, "stream": True}, stream=True)
+        if on_response:
+            on_response(response)
+        with response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get('error'):
+                    raise ValueError(event['error'])
+                yield event.get('response', '')
+                if event.get('done'):
+                    return
+
+    def _stream_openai(self, provider_name: str, base_url: str, api_key: str, model: str, prompt: str,
+                       on_response: Optional[Callable] = None) -> Iterator[str]:
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.config['system'].get('temperature', 0.7),
+            "stream": True
+        }
+        response = self._request(provider_name, model, 'stream', 'POST', f"{base_url}/chat/completions",
+                                 headers=headers, json=payload, stream=True)
+        if on_response:
+            on_response(response)
+        for event in self._iter_sse(response):
+            for choice in event.get('choices', []):
+                yield choice.get('delta', {}).get('content') or ''
+
+    def _stream_google(self, provider_name: str, base_url: str, api_key: str, model: str, prompt: str,
+                       on_response: Optional[Callable] = None) -> Iterator[str]:
+        url = f"{base_url}/{model}:streamGenerateContent?alt=sse&key={api_key}"
+        payload = {
+            "contents": [{
+                "parts": [{"text": prompt}]
+            }]
+        }
+        response = self._request(provider_name, model, 'stream', 'POST', url,
+                                 headers={"Content-Type": "application/json"}, json=payload, stream=True)
+        if on_response:
+            on_response(response)
+        for event in self._iter_sse(response):
+            for candidate in event.get('candidates', []):
+                for part in candidate.get('content', {}).get('parts', []):
+                    yield part.get('text', '')
+
+    def _call_ollama(self, provider_name: str, base_url: str, model: str, prompt: str) -> str:
         url = f"{base_url}/api/generate"
         payload = {
             "model": model,
             "prompt": prompt,
             "stream": False
         }
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
+        response = self._request(provider_name, model, 'generate', 'POST', url, json=payload,
+                                 timeout=self.generate_timeout)
         return response.json().get('response', '')
 
-    def _call_openai(self, base_url: str, api_key: str, model: str, prompt: str) -> str:
+    def _call_openai(self, provider_name: str, base_url: str, api_key: str, model: str, prompt: str) -> str:
         url = f"{base_url}/chat/completions"
         headers = {
             "Authorization": f"Bearer {api_key}",
@@ -125,11 +408,11 @@ class AIService:
             "messages": [{"role": "user", "content": prompt}],
             "temperature": self.config['system'].get('temperature', 0.7)
         }
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
+        response = self._request(provider_name, model, 'generate', 'POST', url, headers=headers, json=payload,
+                                 timeout=self.generate_timeout)
         return response.json()['choices'][0]['message']['content']
 
-    def _call_google(self, base_url: str, api_key: str, model: str, prompt: str) -> str:
+    def _call_google(self, provider_name: str, base_url: str, api_key: str, model: str, prompt: str) -> str:
         # Google AI Studio / Gemini API
         url = f"{base_url}/{model}:generateContent?key={api_key}"
         headers = {"Content-Type": "application/json"}
@@ -138,13 +421,13 @@ class AIService:
                 "parts": [{"text": prompt}]
             }]
         }
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
+        response = self._request(provider_name, model, 'generate', 'POST', url, headers=headers, json=payload,
+                                 timeout=self.generate_timeout)
         result = response.json()
         try:
             return result['candidates'][0]['content']['parts'][0]['text']
         except (KeyError, IndexError):
-            return f"Error parsing Google response: {result}"
+            raise ValueError(f"Error parsing Google response: {result}")
 
 def main():
     parser = argparse.ArgumentParser(description='SuperCPU AI Service Manager')
@@ -153,11 +436,31 @@ def main():
     parser.add_argument('--model', type=str, help='Override default model')
     parser.add_argument('--list-models', action='store_true', help='Fetch available models from provider')
     parser.add_argument('--config', type=str, default='config.json', help='Path to config file')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the response cache')
+    parser.add_argument('--cache-stats', action='store_true', help='Show response cache statistics')
+    parser.add_argument('--stream', action='store_true', help='Print the answer as it is generated')
+    parser.add_argument('--prewarm', action='store_true', help='Connect and load the model before the request')
+    parser.add_argument('--verbose', action='store_true', help='Log request latencies')
+    parser.add_argument('--lane', choices=['interactive', 'background'], help='Let the router pick the provider')
     
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
     
     service = AIService(args.config)
 
+    if args.prewarm:
+        service.prewarm(args.provider, args.model)
+
+    if args.cache_stats:
+        stats = service.cache.stats()
+        if not stats['enabled']:
+            print("Response cache disabled")
+            return
+        print(f"Entries: {stats['entries']}  Size: {stats['bytes'] / 1024:.1f} KB / {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+        print(f"Hits: {stats['total_hits']}  Misses: {stats['total_misses']}  "
+              f"Hit ratio: {stats['total_hit_rate'] * 100:.1f}%")
+        return
+
     if args.list_models:
         models = service.get_available_models(args.provider)
         print("Available Models:")
@@ -169,7 +472,14 @@ def main():
         print("Usage: python ai_manager.py --prompt 'Your question here'")
         return
 
-    response = service.generate_completion(args.prompt, args.provider, args.model)
+    if args.stream:
+        for chunk in service.stream_completion(args.prompt, args.provider, args.model, use_cache=not args.no_cache):
+            print(chunk, end='', flush=True)
+        print()
+        return
+
+    response = service.generate_completion(args.prompt, args.provider, args.model, use_cache=not args.no_cache,
+                                           lane=args.lane)
     print(response)
 
 if __name__ == "__main__":
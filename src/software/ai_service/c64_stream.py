@@ -0,0 +1,73 @@
+import time
+from typing import Callable, Iterable, Optional
+
+# ASCII -> PETSCII for the C64's upper/lowercase character set: lowercase
+# letters live at $41-$5A, uppercase at $C1-$DA, and a line ends with CR.
+_PETSCII = bytearray(range(256))
+for _c in range(ord('a'), ord('z') + 1):
+    _PETSCII[_c] = _c - 0x20
+for _c in range(ord('A'), ord('Z') + 1):
+    _PETSCII[_c] = _c + 0x80
+_PETSCII[ord('\n')] = 0x0D
+_PETSCII[ord('\t')] = ord(' ')
+# No PETSCII glyphs for these; pick the closest printable character
+for _src, _dst in (('`', "'"), ('{', '('), ('}', ')'), ('|', '!'), ('~', '-'), ('_', '-'), ('\\', '/')):
+    _PETSCII[ord(_src)] = ord(_dst)
+PETSCII_TABLE = bytes(_PETSCII)
+# Control characters other than CR would move the cursor or change colours
+_DROP = bytes(c for c in range(0x20) if c not in (0x09, 0x0A)) + bytes(range(0x7F, 0x100))
+
+def ascii_to_petscii(text: str) -> bytes:
+    """Convert model output to bytes the C64 screen editor prints as-is"""
+    data = text.replace('\r\n', '\n').encode('ascii', errors='replace')
+    return data.translate(PETSCII_TABLE, _DROP)
+
+def ascii_to_terminal(text: str) -> bytes:
+    """Plain ASCII with CR/LF line endings, for terminal programs in ASCII mode"""
+    data = text.replace('\r\n', '\n').encode('ascii', errors='replace')
+    return data.replace(b'\n', b'\r\n')
+
+class C64StreamSink:
+    """
+    Forwards text chunks to the C64 as they arrive. `write` takes bytes,
+    e.g. ZiModemBridge.send_to_c64 or anything else that feeds the RX FIFO.
+    Records time-to-first-character so streaming latency can be checked.
+    """
+    def __init__(self, write: Callable[[bytes], None], petscii: bool = True):
+        self.write = write
+        self.encode = ascii_to_petscii if petscii else ascii_to_terminal
+        self.started: Optional[float] = None
+        self.first_char: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.bytes_sent = 0
+
+    def feed(self, chunk: str):
+        if self.started is None:
+            self.started = time.monotonic()
+        data = self.encode(chunk)
+        if not data:
+            return
+        if self.first_char is None:
+            self.first_char = time.monotonic()
+        self.write(data)
+        self.bytes_sent += len(data)
+
+    def consume(self, chunks: Iterable[str]) -> int:
+        """Drain a stream_completion() generator into the C64. Returns bytes sent."""
+        self.started = time.monotonic()
+        for chunk in chunks:
+            self.feed(chunk)
+        self.finished = time.monotonic()
+        return self.bytes_sent
+
+    @property
+    def first_char_latency(self) -> Optional[float]:
+        if self.started is None or self.first_char is None:
+            return None
+        return self.first_char - self.started
+
+    @property
+    def total_time(self) -> Optional[float]:
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
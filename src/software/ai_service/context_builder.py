@@ -1,47 +1,175 @@
 import json
+import os
+import re
+from bisect import bisect_right
+from itertools import accumulate
 
-# Commodore 64 Hardware Register Map
-# Used to inject context into AI prompts
-HARDWARE_MAP = {
-    0xD000: "VIC-II Sprite 0 X",
-    0xD001: "VIC-II Sprite 0 Y",
-    0xD011: "VIC-II Control Register 1 (Screen Height, RASTER8)",
-    0xD012: "VIC-II Raster Line",
-    0xD020: "VIC-II Border Color",
-    0xD021: "VIC-II Background Color 0",
-    0xD400: "SID Voice 1 Freq Low",
-    0xD404: "SID Voice 1 Control",
-    0xDC00: "CIA1 Data Port A (Keyboard/Joystick)",
-    0xDC01: "CIA1 Data Port B (Keyboard/Joystick)",
-    0xDD00: "CIA2 Data Port A (VIC Bank Select)",
-}
-
-def enrich_disassembly(disassembly_lines):
+KB_PATH = os.path.join(os.path.dirname(__file__), '..', 'knowledge_base')
+
+# Register map per target, as <name>_registers.json in the knowledge base
+MACHINES = {"C64": "c64", "C128": "c128", "SCPU": "scpu", "SUPERCPU": "scpu"}
+
+# Absolute operands: $D020, $D000,X, ($0314), $01 and 65816 long $00D020.
+# Immediates (#$20) are not addresses. Comments match too (group 1 is None)
+# so operands mentioned in them are skipped. Starting with the literal "$"
+# lets the regex engine scan ahead quickly.
+OPERAND_RE = re.compile(r';[^\n]*|\$(?<![#\w$]\$)([0-9A-Fa-f]{6}|[0-9A-Fa-f]{4}|[0-9A-Fa-f]{2})(?![0-9A-Fa-f])')
+
+def _addr(text):
+    return int(text.lstrip('$'), 16)
+
+class RegisterMap:
+    """
+    Address-range index of a machine's I/O registers and system vectors,
+    loaded from the knowledge base. Mirrored chips (VIC-II every $40, SID
+    every $20, ...) are described once with a stride; lookups bisect over
+    the sorted range starts, so the cost does not depend on the map size.
+    """
+    def __init__(self, machine="C64", kb_path=KB_PATH):
+        self.machine = machine.upper()
+        self.kb_path = kb_path
+        blocks = {}
+        for block in self._load(MACHINES.get(self.machine, self.machine.lower()), set()):
+            # Same name and start refines an included block (C128 adds VIC-II registers)
+            key = (block['name'], block['start'])
+            if key in blocks:
+                base = blocks[key]
+                block = dict(base, end=block['end'], stride=block['stride'] or base['stride'],
+                             registers={**base['registers'], **block['registers']})
+            blocks[key] = block
+        self.ranges = []
+        for block in blocks.values():
+            self._insert(block)
+        self.ranges.sort()
+        self.starts = [r[0] for r in self.ranges]
+        self._cache = {}
+
+    def _load(self, name, seen):
+        """Blocks of a register file, included files first so later ones take precedence"""
+        if name in seen:
+            return []
+        seen.add(name)
+        with open(os.path.join(self.kb_path, f"{name}_registers.json"), 'r') as f:
+            data = json.load(f)
+        blocks = []
+        for include in data.get('includes', []):
+            blocks += self._load(include, seen)
+        for block in data.get('blocks', []):
+            blocks.append({
+                'name': block['name'],
+                'start': _addr(block['start']),
+                'end': _addr(block['end']),
+                'stride': block.get('stride'),
+                'registers': {_addr(k): v for k, v in block.get('registers', {}).items()},
+            })
+        for address, name in data.get('symbols', {}).items():
+            addr = _addr(address)
+            blocks.append({'name': name, 'start': addr, 'end': addr, 'stride': None, 'registers': {}, 'symbol': True})
+        return blocks
+
+    def _insert(self, block):
+        """Add a block's range, carving it out of any earlier range it overlaps"""
+        start, end = block['start'], block['end']
+        kept = []
+        for r_start, r_end, r_block in self.ranges:
+            if r_end < start or r_start > end:
+                kept.append((r_start, r_end, r_block))
+                continue
+            if r_start < start:
+                kept.append((r_start, start - 1, r_block))
+            if r_end > end:
+                kept.append((end + 1, r_end, r_block))
+        kept.append((start, end, block))
+        self.ranges = kept
+
+    def lookup(self, address):
+        """Description of an address, or None if it is plain memory"""
+        if address in self._cache:
+            return self._cache[address]
+        name = None
+        i = bisect_right(self.starts, address) - 1
+        if i >= 0 and address <= self.ranges[i][1]:
+            block = self.ranges[i][2]
+            if block.get('symbol'):
+                name = block['name']
+            elif not block['registers']:
+                name = block['name']
+            else:
+                offset = address - block['start']
+                if block['stride']:
+                    offset %= block['stride']
+                register = block['registers'].get(offset)
+                if register is None:
+                    name = f"{block['name']} (unused)"
+                else:
+                    name = f"{block['name']} {register}"
+                    canonical = block['start'] + offset
+                    if canonical != address:
+                        name += f" (mirror of ${canonical:04X})"
+        self._cache[address] = name
+        return name
+
+_MAPS = {}
+
+def register_map(machine="C64"):
+    machine = machine.upper()
+    if machine not in _MAPS:
+        _MAPS[machine] = RegisterMap(machine)
+    return _MAPS[machine]
+
+def operand_name(operand, regmap):
+    """Register name for an operand's hex digits ("D020", "01", "00D020")"""
+    value = int(operand, 16)
+    if len(operand) == 6:
+        if value >> 16:
+            return None # Outside bank 0, not the C64 I/O space
+        value &= 0xFFFF
+    return regmap.lookup(value)
+
+def annotate_line(line, regmap):
+    """Register named by the first operand in the code part of a line"""
+    for operand in OPERAND_RE.findall(line):
+        if not operand:
+            break # Rest of the line is a comment
+        name = operand_name(operand, regmap)
+        if name:
+            return name
+    return None
+
+def enrich_disassembly(disassembly_lines, machine="C64"):
     """
     Takes raw disassembly and appends hardware context.
     Input: ["LDA $D020", "STA $D021"]
     Output: ["LDA $D020 ; [VIC-II Border Color]", "STA $D021 ; [VIC-II Background Color 0]"]
     """
-    enriched = []
-    for line in disassembly_lines:
-        # Simple heuristic to find hex addresses (e.g., $D020)
-        # In a real implementation, use regex or the disassembler's symbol table
-        comment = ""
-        for addr, name in HARDWARE_MAP.items():
-            hex_addr = f"${addr:04X}"
-            if hex_addr in line:
-                comment = f" ; [{name}]"
-                break
-        enriched.append(line + comment)
-    return enriched
-
-def build_analysis_prompt(code_block, user_intent="explain"):
+    regmap = register_map(machine)
+    lines = list(disassembly_lines)
+    # One regex pass over the whole listing; match offsets map back to lines by bisect
+    text = "\n".join(lines)
+    line_starts = [0, *accumulate(len(line) + 1 for line in lines)]
+    suffixes = [""] * len(lines)
+    names = {} # operand text -> comment suffix ("" when it is plain memory)
+    for m in OPERAND_RE.finditer(text):
+        operand = m.group(1)
+        if operand is None:
+            continue # Comment
+        i = bisect_right(line_starts, m.start()) - 1
+        if suffixes[i]:
+            continue # Line already annotated by an earlier operand
+        suffix = names.get(operand)
+        if suffix is None:
+            name = operand_name(operand, regmap)
+            suffix = names[operand] = f" ; [{name}]" if name else ""
+        suffixes[i] = suffix
+    return [line + suffix for line, suffix in zip(lines, suffixes)]
+
+def build_analysis_prompt(code_block, user_intent="explain", machine="C64"):
     """
     Constructs the prompt for the AI Provider.
     """
-    enriched_code = enrich_disassembly(code_block)
+    enriched_code = enrich_disassembly(code_block, machine)
     code_text = "\n".join(enriched_code)
-    
+
     if user_intent == "explain":
         return (
             "You are an expert Commodore 64/128 assembly programmer.\n"
@@ -60,5 +188,5 @@ def build_analysis_prompt(code_block, user_intent="explain"):
             "CODE:\n"
             f"{code_text}"
         )
-    
+
     return code_text
@@ -0,0 +1,221 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+KB_PATH = os.path.join(os.path.dirname(__file__), '..', 'knowledge_base')
+INDEX_PATH = os.path.join(os.path.dirname(__file__), '../../data/kb_index.json')
+INDEX_VERSION = 3
+
+# BM25 parameters (the usual defaults)
+K1 = 1.5
+B = 0.75
+# Chunks scoring below this fraction of the best match are noise (a shared "mode")
+MIN_RELATIVE_SCORE = 0.25
+# Machine definition keys sent with every request besides the scalar header
+PINNED_KEYS = ('memory_map',)
+
+_TOKEN_RE = re.compile(r'\$[0-9a-z]+|[a-z0-9]+')
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*)')
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can for from has have i if in into is it its "
+    "me my of on or so that the this to use using want we with you your".split())
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token for English/JSON)"""
+    return (len(text) + 3) // 4
+
+def render(chunks: List[Dict[str, Any]]) -> str:
+    """Join selected chunks, writing each markdown heading once"""
+    lines = []
+    heading = None
+    for chunk in chunks:
+        if chunk['heading']:
+            if chunk['heading'] != heading:
+                lines.append(chunk['heading'])
+                heading = chunk['heading']
+            lines.append(chunk['body'])
+        else:
+            lines.append(chunk['text'])
+    return "\n".join(lines)
+
+def normalize(term: str) -> str:
+    """
+    Light suffix folding so "sprites"/"sprite" and "scrolling"/"scroll" match.
+    Only plain words are touched (not "$d020" or "6502") and at least three
+    letters must remain.
+    """
+    if not term.isalpha():
+        return term
+    if term.endswith('ing') and len(term) > 5:
+        return term[:-3]
+    if term.endswith('ed') and len(term) > 4:
+        return term[:-2]
+    if term.endswith(('sses', 'xes', 'zes', 'ches', 'shes')) and len(term) > 4:
+        return term[:-2]
+    if term.endswith('s') and not term.endswith(('ss', 'us', 'is')) and len(term) > 3:
+        return term[:-1]
+    return term
+
+def tokenize(text: str) -> List[str]:
+    """Index and query terms; both sides go through the same normalize()"""
+    return [normalize(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+def chunk_markdown(text: str) -> List[Dict[str, Any]]:
+    """One chunk per top-level bullet (with its sub-bullets), prefixed by the section heading"""
+    chunks = []
+    heading = ""
+    current: List[str] = []
+
+    def flush():
+        body = "\n".join(current).strip()
+        if body:
+            chunks.append({'heading': heading, 'body': body, 'text': f"{heading}\n{body}" if heading else body})
+        current.clear()
+
+    for line in text.splitlines():
+        m = _HEADING_RE.match(line)
+        if m:
+            flush()
+            heading = line.strip()
+        elif line.startswith(('-', '*')) and not line.startswith('**'):
+            flush()
+            current.append(line.rstrip())
+        elif line.strip():
+            current.append(line.rstrip())
+    flush()
+    return chunks
+
+def chunk_machine_def(definition: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Scalar fields become one header chunk; lists are split per item and
+    objects are kept whole as "key: {...}". The header and PINNED_KEYS are
+    pinned (always sent).
+    """
+    header = {k: v for k, v in definition.items() if not isinstance(v, (dict, list))}
+    chunks = [{'text': json.dumps(header), 'pinned': True}] if header else []
+    for key, value in definition.items():
+        if isinstance(value, list):
+            for item in value:
+                chunks.append({'text': f"{key}: {json.dumps(item)}", 'pinned': key in PINNED_KEYS})
+        elif isinstance(value, dict):
+            chunks.append({'text': f"{key}: {json.dumps(value)}", 'pinned': key in PINNED_KEYS})
+    return chunks
+
+class KnowledgeIndex:
+    """
+    BM25 index over the knowledge base (machine definitions and guideline
+    markdown). Built once and stored in INDEX_PATH; rebuilt automatically when
+    a knowledge base file changes.
+    """
+    def __init__(self, kb_path: str = KB_PATH, index_path: Optional[str] = INDEX_PATH):
+        self.kb_path = kb_path
+        self.index_path = index_path
+        self.chunks: List[Dict[str, Any]] = []
+        self.df: Dict[str, int] = {}
+        self.avgdl = 0.0
+        self._load_or_build()
+
+    def _sources(self) -> List[str]:
+        if not os.path.isdir(self.kb_path):
+            return []
+        # Register maps (*_registers.json) are context_builder's, not prose for prompts
+        return sorted(f for f in os.listdir(self.kb_path)
+                      if f.endswith(('.json', '.md')) and not f.endswith('_registers.json'))
+
+    def _signature(self) -> List[List[Any]]:
+        sig = []
+        for name in self._sources():
+            st = os.stat(os.path.join(self.kb_path, name))
+            sig.append([name, st.st_size, st.st_mtime_ns])
+        return sig
+
+    def _load_or_build(self):
+        signature = self._signature()
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    cached = json.load(f)
+                if cached.get('version') == INDEX_VERSION and cached.get('signature') == signature:
+                    self.chunks, self.df, self.avgdl = cached['chunks'], cached['df'], cached['avgdl']
+                    return
+            except (OSError, ValueError, KeyError):
+                pass # Corrupt cache: rebuild
+        self.build(signature)
+
+    def build(self, signature: Optional[List[List[Any]]] = None):
+        chunks = []
+        for name in self._sources():
+            path = os.path.join(self.kb_path, name)
+            with open(path, 'r') as f:
+                if name.endswith('.json'):
+                    parts = chunk_machine_def(json.load(f))
+                else:
+                    parts = chunk_markdown(f.read())
+            for part in parts:
+                terms = tokenize(part['text'])
+                part.update(source=name, tf=dict(Counter(terms)), length=len(terms),
+                            tokens=estimate_tokens(part['text']))
+                part.setdefault('pinned', False)
+                part.setdefault('heading', '')
+                chunks.append(part)
+
+        df = Counter()
+        for chunk in chunks:
+            df.update(chunk['tf'].keys())
+        self.chunks = chunks
+        self.df = dict(df)
+        self.avgdl = sum(c['length'] for c in chunks) / len(chunks) if chunks else 0.0
+
+        if self.index_path:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'signature': signature or self._signature(),
+                           'chunks': chunks, 'df': self.df, 'avgdl': self.avgdl}, f)
+            os.replace(tmp, self.index_path)
+
+    def score(self, query_terms: Iterable[str], chunk: Dict[str, Any]) -> float:
+        n = len(self.chunks)
+        tf = chunk['tf']
+        norm = K1 * (1 - B + B * chunk['length'] / (self.avgdl or 1))
+        total = 0.0
+        for term in query_terms:
+            f = tf.get(term)
+            if not f:
+                continue
+            df = self.df.get(term, 0)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            total += idf * f * (K1 + 1) / (f + norm)
+        return total
+
+    def select(self, query: str, sources: Iterable[str], budget: int) -> List[Dict[str, Any]]:
+        """
+        Chunks from the given source files that are relevant to the query,
+        picked best first until the token budget is used. Pinned chunks are
+        always included and count against the budget. Returned in
+        knowledge-base order.
+        """
+        sources = set(sources)
+        terms = set(tokenize(query))
+        pool = [c for c in self.chunks if c['source'] in sources]
+
+        chosen = [c for c in pool if c['pinned']]
+        used = sum(c['tokens'] for c in chosen)
+        ranked = sorted(((self.score(terms, c), i) for i, c in enumerate(pool) if not c['pinned']), reverse=True)
+        cutoff = ranked[0][0] * MIN_RELATIVE_SCORE if ranked else 0.0
+        for score, i in ranked:
+            if score <= 0 or score < cutoff:
+                break
+            chunk = pool[i]
+            if used + chunk['tokens'] > budget:
+                continue
+            chosen.append(chunk)
+            used += chunk['tokens']
+
+        order = {id(c): i for i, c in enumerate(pool)}
+        return sorted(chosen, key=lambda c: order[id(c)])
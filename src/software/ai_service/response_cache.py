@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Shared with the Linux services (library.db lives in the same directory)
+CACHE_PATH = os.path.join(os.path.dirname(__file__), '../../data/ai_cache.db')
+DEFAULT_MAX_MB = 64
+
+_WS_RE = re.compile(r'[ \t]+')
+
+def normalize_prompt(prompt: str) -> str:
+    """Whitespace-only differences should not defeat the cache"""
+    lines = [_WS_RE.sub(' ', line).strip() for line in prompt.strip().splitlines()]
+    return "\n".join(lines)
+
+def cache_key(provider: str, model: str, prompt: str, temperature: Optional[float]) -> str:
+    material = json.dumps([provider, model, normalize_prompt(prompt), temperature])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    LLM response cache keyed by (provider, model, normalized prompt, temperature).
+    Stored in SQLite; least recently used entries are evicted once the
+    cache grows past max_bytes. hits/misses count this instance's lookups;
+    the file keeps running totals over every process that shares it.
+    """
+    def __init__(self, path: str = CACHE_PATH, max_mb: float = DEFAULT_MAX_MB, enabled: bool = True):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _init_db(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            provider TEXT,
+            model TEXT,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL,
+            last_used REAL
+        )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses(last_used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.executemany("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", [('hits',), ('misses',)])
+        conn.commit()
+        self._total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        conn.close()
+
+    def get(self, provider: str, model: str, prompt: str, temperature: Optional[float] = None) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = cache_key(provider, model, prompt, temperature)
+        conn = self._connect()
+        row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row:
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", ('hits' if row else 'misses',))
+        conn.commit()
+        conn.close()
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, provider: str, model: str, prompt: str, temperature: Optional[float], response: str):
+        if not self.enabled or not response:
+            return
+        key = cache_key(provider, model, prompt, temperature)
+        size = len(response.encode('utf-8')) + len(key)
+        now = time.time()
+        conn = self._connect()
+        old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        conn.execute('''INSERT OR REPLACE INTO responses (key, provider, model, response, size, created, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)''', (key, provider, model, response, size, now, now))
+        conn.commit()
+        with self._lock:
+            self._total += size - (old[0] if old else 0)
+            over = self._total > self.max_bytes
+        if over:
+            self._evict(conn)
+        conn.close()
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least recently used entries until the cache is back under 90% of its limit"""
+        target = int(self.max_bytes * 0.9)
+        # Another process may share the file, so start from the real total
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        freed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if total <= target:
+                break
+            freed.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", freed)
+        conn.commit()
+        with self._lock:
+            self._total = total
+
+    def clear(self):
+        if not self.enabled:
+            return
+        conn = self._connect()
+        conn.execute("DELETE FROM responses")
+        conn.execute("UPDATE counters SET value = 0")
+        conn.commit()
+        conn.close()
+        with self._lock:
+            self._total = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        entries, size = 0, 0
+        totals = {}
+        if self.enabled:
+            conn = self._connect()
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            totals = dict(conn.execute("SELECT name, value FROM counters"))
+            conn.close()
+        lookups = hits + misses
+        total_hits, total_misses = totals.get('hits', 0), totals.get('misses', 0)
+        total_lookups = total_hits + total_misses
+        return {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'total_hits': total_hits,       # Since the cache file was created or cleared, all processes
+            'total_misses': total_misses,
+            'total_hit_rate': total_hits / total_lookups if total_lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+        }
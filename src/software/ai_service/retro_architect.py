@@ -1,27 +1,42 @@
 import json
 import os
+import sys
 from typing import Dict, Any, List
 
+sys.path.append(os.path.dirname(__file__))
+from knowledge_index import KnowledgeIndex, estimate_tokens, render
+
+# Tokens of knowledge-base context sent with a request (machine header included)
+CONTEXT_BUDGET = 400
+
 class RetroArchitect:
-    def __init__(self, project_path: str):
+    def __init__(self, project_path: str, context_budget: int = CONTEXT_BUDGET):
         self.project_path = project_path
         self.manifest_file = os.path.join(project_path, 'project.json')
         self.kb_path = os.path.join(os.path.dirname(__file__), '..', 'knowledge_base')
+        self.context_budget = context_budget
         self.manifest = self._load_manifest()
+        self.def_file = self._machine_def_file()
         self.machine_def = self._load_machine_def()
+        self._index = None
+        self.last_stats = {}
 
-    def _load_machine_def(self) -> Dict[str, Any]:
+    @property
+    def index(self) -> KnowledgeIndex:
+        if self._index is None:
+            self._index = KnowledgeIndex(self.kb_path)
+        return self._index
+
+    def _machine_def_file(self) -> str:
         target = self.manifest.get('target_hardware', 'C64').lower()
-        def_file = ""
-        
         if "supercpu" in target:
-            def_file = "scpu_def.json"
+            return "scpu_def.json"
         elif "c128" in target:
-            def_file = "c128_def.json"
-        else:
-            def_file = "c64_def.json"
-            
-        path = os.path.join(self.kb_path, def_file)
+            return "c128_def.json"
+        return "c64_def.json"
+
+    def _load_machine_def(self) -> Dict[str, Any]:
+        path = os.path.join(self.kb_path, self.def_file)
         if os.path.exists(path):
             with open(path, 'r') as f:
                 return json.load(f)
@@ -48,10 +63,36 @@ class RetroArchitect:
             }
         }
 
-    def analyze_request(self, user_request: str) -> str:
+    def _guideline_files(self) -> List[str]:
+        if not os.path.isdir(self.kb_path):
+            return []
+        return sorted(f for f in os.listdir(self.kb_path) if f.endswith('.md'))
+
+    def _full_context(self) -> str:
+        guidelines = ""
+        for name in self._guideline_files():
+            with open(os.path.join(self.kb_path, name), 'r') as f:
+                guidelines += f.read()
+        return (f"Machine Definition: {json.dumps(self.machine_def, indent=2)}\n"
+                f"Coding Guidelines:\n{guidelines}\n")
+
+    def _relevant_context(self, user_request: str) -> str:
+        """Only the machine definition and guideline chunks that match the request"""
+        chunks = self.index.select(user_request, [self.def_file] + self._guideline_files(), self.context_budget)
+        machine = render([c for c in chunks if c['source'] == self.def_file])
+        guidelines = render([c for c in chunks if c['source'] != self.def_file])
+        context = f"Machine Definition:\n{machine}\n"
+        if guidelines:
+            context += f"Coding Guidelines:\n{guidelines}\n"
+        return context
+
+    def analyze_request(self, user_request: str, full_context: bool = False) -> str:
         """
         Analyzes a user request against the current project constraints.
         Returns a prompt for the LLM to generate the response.
+        Only knowledge-base sections relevant to the request are included
+        (see knowledge_index.py) unless full_context is set; the token
+        counts are left in self.last_stats.
         """
         # 1. Get current state
         free_mem = self.manifest['memory_map']['free_bytes']
@@ -66,19 +107,22 @@ class RetroArchitect:
         if "music" in user_request.lower():
             estimated_cost = 4096 # 4KB for a SID tune
 
-        # 3. Load Coding Guidelines
-        guidelines = ""
-        guide_path = os.path.join(self.kb_path, "coding_guidelines.md")
-        if os.path.exists(guide_path):
-            with open(guide_path, 'r') as f:
-                guidelines = f.read()
+        # 3. Machine definition and coding guidelines
+        full = self._full_context()
+        knowledge = full if full_context else self._relevant_context(user_request)
+        full_tokens = estimate_tokens(full)
+        knowledge_tokens = estimate_tokens(knowledge)
+        self.last_stats = {
+            'full_tokens': full_tokens,
+            'context_tokens': knowledge_tokens,
+            'tokens_saved': full_tokens - knowledge_tokens,
+        }
 
         # 4. Construct the Context
         context = (
             f"SYSTEM CONTEXT:\n"
             f"Target Machine: {target}\n"
-            f"Machine Definition: {json.dumps(self.machine_def, indent=2)}\n"
-            f"Coding Guidelines:\n{guidelines}\n\n"
+            f"{knowledge}\n"
             f"CURRENT PROJECT STATE:\n"
             f"- Free Memory: {free_mem} bytes ({free_mem/1024:.1f} KB)\n"
             f"- Estimated Cost of Request: {estimated_cost} bytes\n\n"
@@ -101,3 +145,5 @@ if __name__ == "__main__":
     architect = RetroArchitect(".")
     prompt = architect.analyze_request("I want to add 5 new levels to the game.")
     print(prompt)
+    print(f"Context tokens: {architect.last_stats['context_tokens']} "
+          f"(saved {architect.last_stats['tokens_saved']} of {architect.last_stats['full_tokens']})")
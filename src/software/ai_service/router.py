@@ -0,0 +1,263 @@
+import queue
+import socket
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+# Defaults for config['routing']
+WINDOW = 20            # Completions remembered per provider/model
+MAX_ERROR_RATE = 0.5   # Above this a provider/model is skipped...
+COOLDOWN = 30.0        # ...until this many seconds after its last error
+LANES = ('interactive', 'background')
+
+class Cancelled(Exception):
+    """Raised inside a racer that lost a hedged request"""
+
+def abort(response):
+    """
+    Make a thread blocked reading a streamed response return now. close()
+    would wait for that read; shutting the socket down ends it at once.
+    """
+    connection = getattr(response.raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class RollingStats:
+    """Latency and error rate over the last `window` completions of one provider/model"""
+    def __init__(self, window: int = WINDOW):
+        self.samples = deque(maxlen=window)   # (seconds, ok)
+        self.last_error = 0.0
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((latency, ok))
+        if not ok:
+            self.last_error = time.monotonic()
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Median latency of the successful completions, None before the first one"""
+        values = sorted(latency for latency, ok in self.samples if ok)
+        if not values:
+            return None
+        return values[len(values) // 2]
+
+class ProviderRouter:
+    """
+    Picks the provider/model for a request from its lane's candidate list.
+
+    config['routing'] example:
+        {"interactive": ["openai", "ollama/llama3"], "background": ["ollama"],
+         "hedge_after": 3.0}
+
+    Interactive requests go to the healthy candidate with the lowest rolling
+    median latency, scaled by the requests already in flight on that provider
+    (so a local Ollama busy with background work looks slower than it is
+    idle). With hedge_after set, a second candidate is started if the first
+    has not answered by then; whichever finishes first wins and the other
+    stream is aborted at once. A loser's time says nothing about the
+    provider, so it is not recorded in the stats. Background requests never hedge and never fall back
+    onto providers that are only listed for the interactive lane.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.logger = logging.getLogger("ProviderRouter")
+        routing = service.config.get('routing', {})
+        active = service.active_provider
+        self.lanes = {lane: [self._parse(entry) for entry in routing.get(lane, [active])] for lane in LANES}
+        self.hedge_after = routing.get('hedge_after')
+        self.window = routing.get('window', WINDOW)
+        self.max_error_rate = routing.get('max_error_rate', MAX_ERROR_RATE)
+        self.cooldown = routing.get('cooldown', COOLDOWN)
+        self.stats: Dict[Tuple[str, str], RollingStats] = {}
+        self.inflight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _parse(self, entry: str) -> Tuple[str, Optional[str]]:
+        provider, _, model = entry.partition('/')
+        return provider, model or None
+
+    def _stats(self, provider: str, model: str) -> RollingStats:
+        key = (provider, model)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = RollingStats(self.window)
+        return stats
+
+    def healthy(self, provider: str, model: str) -> bool:
+        with self._lock:
+            stats = self._stats(provider, model)
+            return (stats.error_rate <= self.max_error_rate
+                    or time.monotonic() - stats.last_error > self.cooldown)
+
+    def candidates(self, lane: str = 'interactive') -> List[Tuple[str, str]]:
+        """Enabled, healthy (provider, model) pairs of the lane, best first"""
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown lane '{lane}'")
+        ranked = []
+        for order, (provider, model) in enumerate(self.lanes[lane]):
+            config = self.service.config['providers'].get(provider)
+            if not config or not config['enabled']:
+                continue
+            model = model or config['default_model']
+            if not self.healthy(provider, model):
+                continue
+            with self._lock:
+                latency = self._stats(provider, model).latency
+                busy = self.inflight.get(provider, 0)
+            # Untried candidates rank first so every provider gets measured
+            score = 0.0 if latency is None else latency * (1 + busy)
+            ranked.append((score, order, provider, model))
+        ranked.sort()
+        return [(provider, model) for _, _, provider, model in ranked]
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {f"{provider}/{model}": {
+                        'latency': stats.latency,
+                        'error_rate': stats.error_rate,
+                        'samples': len(stats.samples),
+                        'inflight': self.inflight.get(provider, 0),
+                    } for (provider, model), stats in self.stats.items()}
+
+    # --------------------------------------------------------------------------
+    # Requests
+    # --------------------------------------------------------------------------
+    def complete(self, prompt: str, lane: str = 'interactive', use_cache: bool = True) -> str:
+        order = self.candidates(lane)
+        if not order:
+            return f"Error: No healthy provider for the {lane} lane"
+
+        temperature = self.service.config['system'].get('temperature', 0.7)
+        if use_cache:
+            for provider, model in order:
+                cached = self.service.cache.get(provider, model, prompt, temperature)
+                if cached is not None:
+                    return cached
+
+        if lane == 'interactive' and self.hedge_after is not None and len(order) > 1:
+            provider, model, result = self._race(prompt, order)
+        else:
+            provider, model, result = self._failover(prompt, order)
+        if isinstance(result, Exception):
+            return f"Error calling AI API: {str(result)}"
+
+        self.service.cache.put(provider, model, prompt, temperature, result)
+        return result
+
+    def _run(self, provider: str, model: str, prompt: str, cancel: Optional[threading.Event] = None,
+             on_response=None) -> str:
+        """One streamed completion; closing the stream early drops the provider connection"""
+        with self._lock:
+            self.inflight[provider] = self.inflight.get(provider, 0) + 1
+        start = time.monotonic()
+        ok = False
+        record = True
+        try:
+            parts = []
+            chunks = self.service.open_stream(provider, model, prompt, on_response)
+            try:
+                for chunk in chunks:
+                    if cancel is not None and cancel.is_set():
+                        raise Cancelled(f"{provider}/{model}")
+                    parts.append(chunk)
+            finally:
+                chunks.close()
+            ok = True
+            return "".join(parts)
+        except Cancelled:
+            record = False
+            raise
+        except Exception:
+            if cancel is not None and cancel.is_set():
+                # Aborted after losing the race, not a provider failure
+                record = False
+                raise Cancelled(f"{provider}/{model}") from None
+            raise
+        finally:
+            with self._lock:
+                self.inflight[provider] -= 1
+                if record:
+                    self._stats(provider, model).record(time.monotonic() - start, ok)
+
+    def _failover(self, prompt: str, order: List[Tuple[str, str]]):
+        error = None
+        for provider, model in order:
+            try:
+                return provider, model, self._run(provider, model, prompt)
+            except Exception as e:
+                self.logger.warning(f"{provider}/{model} failed: {e}")
+                error = e
+        return None, None, error
+
+    def _race(self, prompt: str, order: List[Tuple[str, str]]):
+        """Start the best candidate; add the next one after hedge_after or on failure"""
+        results = queue.Queue()
+        cancels = []
+        responses = {}   # cancel event -> the racer's open response
+        lock = threading.Lock()
+
+        def racer(provider, model, cancel):
+            def opened(response):
+                with lock:
+                    responses[cancel] = response
+                    lost = cancel.is_set()
+                if lost:
+                    abort(response) # The race ended while this one waited for its headers
+            try:
+                result = self._run(provider, model, prompt, cancel, opened)
+            except Exception as e:
+                result = e
+            with lock:
+                responses.pop(cancel, None)
+            results.put((provider, model, result))
+
+        def launch(provider, model):
+            cancel = threading.Event()
+            cancels.append(cancel)
+            threading.Thread(target=racer, args=(provider, model, cancel), daemon=True).start()
+
+        pending = list(order)
+        launch(*pending.pop(0))
+        running = 1
+        error = None
+        wait = self.hedge_after
+        while running:
+            try:
+                provider, model, result = results.get(timeout=wait)
+            except queue.Empty:
+                # Deadline passed with no answer: hedge with the next candidate
+                if pending:
+                    next_provider, next_model = pending.pop(0)
+                    self.logger.info(f"Hedging with {next_provider}/{next_model}")
+                    launch(next_provider, next_model)
+                    running += 1
+                wait = None if not pending else self.hedge_after
+                continue
+            running -= 1
+            if not isinstance(result, Exception):
+                # The losers may be blocked waiting for a chunk: abort their responses from here
+                with lock:
+                    for cancel in cancels:
+                        cancel.set()
+                    losers = list(responses.values())
+                for response in losers:
+                    abort(response)
+                return provider, model, result
+            self.logger.warning(f"{provider}/{model} failed: {result}")
+            error = result
+            if pending:
+                launch(*pending.pop(0))
+                running += 1
+        return None, None, error
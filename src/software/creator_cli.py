@@ -7,6 +7,7 @@ from tools.sprite_studio import SpriteStudio
 from tools.sid_lab import SIDLab
 from tools.build_manager import BuildManager
 from tools.debugger_interface import DebuggerInterface
+from tools.symbol_manager import SymbolManager
 from ai_service.retro_architect import RetroArchitect
 
 def main():
@@ -18,15 +19,18 @@ def main():
     parser_sprite.add_argument('--generate', type=str, help='Description of sprite to generate')
     parser_sprite.add_argument('--output', type=str, default='sprite.bin', help='Output filename')
     parser_sprite.add_argument('--format', type=str, choices=['bin', 'asm'], default='bin', help='Output format')
+    parser_sprite.add_argument('--no-cache', action='store_true', help='Ignore cached AI responses')
 
     # SID Command
     parser_sid = subparsers.add_parser('sid', help='SID Lab Tools')
     parser_sid.add_argument('--compose', type=str, help='Description of sound to compose')
     parser_sid.add_argument('--output', type=str, default='sound.asm', help='Output filename')
+    parser_sid.add_argument('--no-cache', action='store_true', help='Ignore cached AI responses')
 
     # Project Command
     parser_proj = subparsers.add_parser('project', help='Project Management')
     parser_proj.add_argument('--analyze', type=str, help='Analyze a user request against project constraints')
+    parser_proj.add_argument('--full-context', action='store_true', help='Send the whole knowledge base instead of the relevant sections')
     parser_proj.add_argument('--path', type=str, default='.', help='Project path')
 
     # Build Command
@@ -46,7 +50,7 @@ def main():
         if args.generate:
             print(f"Generating sprite: '{args.generate}'...")
             studio = SpriteStudio()
-            data = studio.generate_sprite(args.generate)
+            data = studio.generate_sprite(args.generate, use_cache=not args.no_cache)
             studio.save_sprite(data, args.output, args.format)
             print(f"Saved to {args.output}")
         else:
@@ -56,7 +60,7 @@ def main():
         if args.compose:
             print(f"Composing sound: '{args.compose}'...")
             lab = SIDLab()
-            asm = lab.compose_sfx(args.compose)
+            asm = lab.compose_sfx(args.compose, use_cache=not args.no_cache)
             lab.save_sfx(asm, args.output)
             print(f"Saved to {args.output}")
         else:
@@ -65,17 +69,16 @@ def main():
     elif args.command == 'project':
         if args.analyze:
             architect = RetroArchitect(args.path)
-            prompt = architect.analyze_request(args.analyze)
+            prompt = architect.analyze_request(args.analyze, full_context=args.full_context)
+            stats = architect.last_stats
             print("--- AI Context Prompt ---")
             print(prompt)
             print("-------------------------")
+            print(f"Knowledge context: {stats['context_tokens']} tokens "
+                  f"(saved {stats['tokens_saved']} of {stats['full_tokens']})")
         else:
             print("Error: --analyze request required")
 
-from tools.symbol_manager import SymbolManager
-
-# ... (inside main)
-
     elif args.command == 'build':
         builder = BuildManager()
         print(f"Building {args.source}...")
@@ -0,0 +1,328 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+# Table-driven 6502/65816 disassembler.
+# Every opcode is looked up in a precomputed 256-entry table holding the
+# mnemonic, instruction length and operand template, so decoding costs one
+# list index per instruction. The 65816 tables exist once per M/X register
+# width combination and REP/SEP/XCE switch between them while decoding.
+
+# Addressing modes: (operand bytes, operand template)
+IMP, ACC, IMM8, IMM_M, IMM_X, DP, DPX, DPY, DPI, DPIX, DPIY, DPIL, DPILY, \
+    ABS, ABSX, ABSY, IND, INDX, INDL, LONG, LONGX, SR, SRIY, REL, RELL, BM = range(26)
+
+MODES = {
+    IMP: (0, ""), ACC: (0, "A"), IMM8: (1, "#{}"), IMM_M: (1, "#{}"), IMM_X: (1, "#{}"),
+    DP: (1, "{}"), DPX: (1, "{},X"), DPY: (1, "{},Y"), DPI: (1, "({})"), DPIX: (1, "({},X)"),
+    DPIY: (1, "({}),Y"), DPIL: (1, "[{}]"), DPILY: (1, "[{}],Y"),
+    ABS: (2, "{}"), ABSX: (2, "{},X"), ABSY: (2, "{},Y"), IND: (2, "({})"), INDX: (2, "({},X)"),
+    INDL: (2, "[{}]"), LONG: (3, "{}"), LONGX: (3, "{},X"), SR: (1, "{},S"), SRIY: (1, "({},S),Y"),
+    REL: (1, "{}"), RELL: (2, "{}"), BM: (2, "{},{}"),
+}
+
+# 65816, row by row ($00-$0F, $10-$1F, ...)
+OPCODES_65816 = [
+    ("BRK", IMM8), ("ORA", DPIX), ("COP", IMM8), ("ORA", SR), ("TSB", DP), ("ORA", DP), ("ASL", DP), ("ORA", DPIL),
+    ("PHP", IMP), ("ORA", IMM_M), ("ASL", ACC), ("PHD", IMP), ("TSB", ABS), ("ORA", ABS), ("ASL", ABS), ("ORA", LONG),
+    ("BPL", REL), ("ORA", DPIY), ("ORA", DPI), ("ORA", SRIY), ("TRB", DP), ("ORA", DPX), ("ASL", DPX), ("ORA", DPILY),
+    ("CLC", IMP), ("ORA", ABSY), ("INC", ACC), ("TCS", IMP), ("TRB", ABS), ("ORA", ABSX), ("ASL", ABSX), ("ORA", LONGX),
+    ("JSR", ABS), ("AND", DPIX), ("JSL", LONG), ("AND", SR), ("BIT", DP), ("AND", DP), ("ROL", DP), ("AND", DPIL),
+    ("PLP", IMP), ("AND", IMM_M), ("ROL", ACC), ("PLD", IMP), ("BIT", ABS), ("AND", ABS), ("ROL", ABS), ("AND", LONG),
+    ("BMI", REL), ("AND", DPIY), ("AND", DPI), ("AND", SRIY), ("BIT", DPX), ("AND", DPX), ("ROL", DPX), ("AND", DPILY),
+    ("SEC", IMP), ("AND", ABSY), ("DEC", ACC), ("TSC", IMP), ("BIT", ABSX), ("AND", ABSX), ("ROL", ABSX), ("AND", LONGX),
+    ("RTI", IMP), ("EOR", DPIX), ("WDM", IMM8), ("EOR", SR), ("MVP", BM), ("EOR", DP), ("LSR", DP), ("EOR", DPIL),
+    ("PHA", IMP), ("EOR", IMM_M), ("LSR", ACC), ("PHK", IMP), ("JMP", ABS), ("EOR", ABS), ("LSR", ABS), ("EOR", LONG),
+    ("BVC", REL), ("EOR", DPIY), ("EOR", DPI), ("EOR", SRIY), ("MVN", BM), ("EOR", DPX), ("LSR", DPX), ("EOR", DPILY),
+    ("CLI", IMP), ("EOR", ABSY), ("PHY", IMP), ("TCD", IMP), ("JML", LONG), ("EOR", ABSX), ("LSR", ABSX), ("EOR", LONGX),
+    ("RTS", IMP), ("ADC", DPIX), ("PER", RELL), ("ADC", SR), ("STZ", DP), ("ADC", DP), ("ROR", DP), ("ADC", DPIL),
+    ("PLA", IMP), ("ADC", IMM_M), ("ROR", ACC), ("RTL", IMP), ("JMP", IND), ("ADC", ABS), ("ROR", ABS), ("ADC", LONG),
+    ("BVS", REL), ("ADC", DPIY), ("ADC", DPI), ("ADC", SRIY), ("STZ", DPX), ("ADC", DPX), ("ROR", DPX), ("ADC", DPILY),
+    ("SEI", IMP), ("ADC", ABSY), ("PLY", IMP), ("TDC", IMP), ("JMP", INDX), ("ADC", ABSX), ("ROR", ABSX), ("ADC", LONGX),
+    ("BRA", REL), ("STA", DPIX), ("BRL", RELL), ("STA", SR), ("STY", DP), ("STA", DP), ("STX", DP), ("STA", DPIL),
+    ("DEY", IMP), ("BIT", IMM_M), ("TXA", IMP), ("PHB", IMP), ("STY", ABS), ("STA", ABS), ("STX", ABS), ("STA", LONG),
+    ("BCC", REL), ("STA", DPIY), ("STA", DPI), ("STA", SRIY), ("STY", DPX), ("STA", DPX), ("STX", DPY), ("STA", DPILY),
+    ("TYA", IMP), ("STA", ABSY), ("TXS", IMP), ("TXY", IMP), ("STZ", ABS), ("STA", ABSX), ("STZ", ABSX), ("STA", LONGX),
+    ("LDY", IMM_X), ("LDA", DPIX), ("LDX", IMM_X), ("LDA", SR), ("LDY", DP), ("LDA", DP), ("LDX", DP), ("LDA", DPIL),
+    ("TAY", IMP), ("LDA", IMM_M), ("TAX", IMP), ("PLB", IMP), ("LDY", ABS), ("LDA", ABS), ("LDX", ABS), ("LDA", LONG),
+    ("BCS", REL), ("LDA", DPIY), ("LDA", DPI), ("LDA", SRIY), ("LDY", DPX), ("LDA", DPX), ("LDX", DPY), ("LDA", DPILY),
+    ("CLV", IMP), ("LDA", ABSY), ("TSX", IMP), ("TYX", IMP), ("LDY", ABSX), ("LDA", ABSX), ("LDX", ABSY), ("LDA", LONGX),
+    ("CPY", IMM_X), ("CMP", DPIX), ("REP", IMM8), ("CMP", SR), ("CPY", DP), ("CMP", DP), ("DEC", DP), ("CMP", DPIL),
+    ("INY", IMP), ("CMP", IMM_M), ("DEX", IMP), ("WAI", IMP), ("CPY", ABS), ("CMP", ABS), ("DEC", ABS), ("CMP", LONG),
+    ("BNE", REL), ("CMP", DPIY), ("CMP", DPI), ("CMP", SRIY), ("PEI", DPI), ("CMP", DPX), ("DEC", DPX), ("CMP", DPILY),
+    ("CLD", IMP), ("CMP", ABSY), ("PHX", IMP), ("STP", IMP), ("JML", INDL), ("CMP", ABSX), ("DEC", ABSX), ("CMP", LONGX),
+    ("CPX", IMM_X), ("SBC", DPIX), ("SEP", IMM8), ("SBC", SR), ("CPX", DP), ("SBC", DP), ("INC", DP), ("SBC", DPIL),
+    ("INX", IMP), ("SBC", IMM_M), ("NOP", IMP), ("XBA", IMP), ("CPX", ABS), ("SBC", ABS), ("INC", ABS), ("SBC", LONG),
+    ("BEQ", REL), ("SBC", DPIY), ("SBC", DPI), ("SBC", SRIY), ("PEA", ABS), ("SBC", DPX), ("INC", DPX), ("SBC", DPILY),
+    ("SED", IMP), ("SBC", ABSY), ("PLX", IMP), ("XCE", IMP), ("JSR", INDX), ("SBC", ABSX), ("INC", ABSX), ("SBC", LONGX),
+]
+
+# Undocumented NMOS opcodes, as used by C64 demos and games. The other 151
+# (documented) opcodes share mnemonic and mode with the 65816.
+ILLEGAL_6502 = {}
+for _name, _ops in (("SLO", 0x03), ("RLA", 0x23), ("SRE", 0x43), ("RRA", 0x63), ("DCP", 0xC3), ("ISC", 0xE3)):
+    for _offset, _mode in ((0x00, DPIX), (0x04, DP), (0x0C, ABS), (0x10, DPIY), (0x14, DPX), (0x18, ABSY), (0x1C, ABSX)):
+        ILLEGAL_6502[_ops + _offset] = (_name, _mode)
+ILLEGAL_6502.update({
+    0x83: ("SAX", DPIX), 0x87: ("SAX", DP), 0x8F: ("SAX", ABS), 0x97: ("SAX", DPY),
+    0xA3: ("LAX", DPIX), 0xA7: ("LAX", DP), 0xAF: ("LAX", ABS), 0xB3: ("LAX", DPIY), 0xB7: ("LAX", DPY),
+    0xBF: ("LAX", ABSY), 0xAB: ("LXA", IMM8), 0x0B: ("ANC", IMM8), 0x2B: ("ANC", IMM8), 0x4B: ("ALR", IMM8),
+    0x6B: ("ARR", IMM8), 0xCB: ("SBX", IMM8), 0xEB: ("SBC", IMM8), 0x8B: ("ANE", IMM8), 0x93: ("SHA", DPIY),
+    0x9F: ("SHA", ABSY), 0x9B: ("TAS", ABSY), 0x9C: ("SHY", ABSX), 0x9E: ("SHX", ABSY), 0xBB: ("LAS", ABSY),
+})
+for _op in (0x1A, 0x3A, 0x5A, 0x7A, 0xDA, 0xFA):
+    ILLEGAL_6502[_op] = ("NOP", IMP)
+for _op in (0x80, 0x82, 0x89, 0xC2, 0xE2):
+    ILLEGAL_6502[_op] = ("NOP", IMM8)
+for _op in (0x04, 0x44, 0x64):
+    ILLEGAL_6502[_op] = ("NOP", DP)
+for _op in (0x14, 0x34, 0x54, 0x74, 0xD4, 0xF4):
+    ILLEGAL_6502[_op] = ("NOP", DPX)
+ILLEGAL_6502[0x0C] = ("NOP", ABS)
+for _op in (0x1C, 0x3C, 0x5C, 0x7C, 0xDC, 0xFC):
+    ILLEGAL_6502[_op] = ("NOP", ABSX)
+for _op in (0x02, 0x12, 0x22, 0x32, 0x42, 0x52, 0x62, 0x72, 0x92, 0xB2, 0xD2, 0xF2):
+    ILLEGAL_6502[_op] = ("JAM", IMP)
+
+def _opcodes_6502():
+    table = []
+    for op in range(256):
+        if op in ILLEGAL_6502:
+            table.append(ILLEGAL_6502[op])
+            continue
+        name, mode = OPCODES_65816[op]
+        if mode == IMM_M or mode == IMM_X:
+            mode = IMM8
+        table.append((name, IMP if op == 0x00 else mode))
+    return table
+
+OPCODES_6502 = _opcodes_6502()
+
+def _compile(opcodes, m16=False, x16=False):
+    """256 entries of (mnemonic, length, mode, template) for one register width"""
+    table = []
+    for name, mode in opcodes:
+        size, template = MODES[mode]
+        if (mode == IMM_M and m16) or (mode == IMM_X and x16):
+            size = 2
+        table.append((name, size + 1, mode, f"{name} {template}" if template else name))
+    return table
+
+TABLES = {
+    '6502': {(False, False): _compile(OPCODES_6502)},
+    '65816': {(m, x): _compile(OPCODES_65816, m, x) for m in (False, True) for x in (False, True)},
+}
+MAX_LENGTH = 4
+
+class Disassembler:
+    """
+    Decodes 6502 or 65816 machine code. For the 65816 the accumulator (M)
+    and index (X) widths and the emulation flag are tracked through REP,
+    SEP and CLC/SEC+XCE, so 16-bit immediates decode with the right length.
+    `symbols` is a SymbolManager or a dict of address -> label; matching
+    operand addresses and branch targets are printed as labels.
+    """
+    def __init__(self, cpu='6502', symbols=None, m16=False, x16=False, emulation=True):
+        if cpu not in TABLES:
+            raise ValueError(f"Unknown CPU '{cpu}' (expected 6502 or 65816)")
+        self.cpu = cpu
+        self.symbols = getattr(symbols, 'address_to_symbol', symbols) or {}
+        self.emulation = emulation or cpu == '6502'
+        self.m16 = m16 and not self.emulation
+        self.x16 = x16 and not self.emulation
+        self.carry = None # Last CLC/SEC seen, for XCE
+
+    def _table(self):
+        return TABLES[self.cpu][(self.m16, self.x16)] if self.cpu == '65816' else TABLES['6502'][(False, False)]
+
+    def _address(self, value, digits):
+        label = self.symbols.get(value)
+        return label if label is not None else f"${value:0{digits}X}"
+
+    def _track(self, name, operand):
+        """Follow the flag changes that alter instruction lengths"""
+        if name == 'REP' or name == 'SEP':
+            if self.emulation:
+                return
+            on = name == 'REP'
+            if operand & 0x20:
+                self.m16 = on
+            if operand & 0x10:
+                self.x16 = on
+        elif name == 'CLC':
+            self.carry = False
+        elif name == 'SEC':
+            self.carry = True
+        elif name == 'XCE' and self.carry is not None:
+            self.emulation = self.carry
+            self.carry = None
+            if self.emulation:
+                self.m16 = self.x16 = False
+
+    def decode(self, data, origin=0, offset=0, end=None):
+        """
+        Yield (address, raw bytes, text) per instruction from data[offset:end].
+        A trailing partial instruction is returned as a .BYTE line.
+        """
+        end = len(data) if end is None else end
+        digits = 6 if origin + end > 0x10000 else 4
+        table = self._table()
+        is_65816 = self.cpu == '65816'
+        symbols = self.symbols
+        i = offset
+        while i < end:
+            op = data[i]
+            name, size, mode, template = table[op]
+            pc = origin + i
+            if i + size > end:
+                yield pc, bytes(data[i:end]), ".BYTE " + ",".join(f"${b:02X}" for b in data[i:end])
+                return
+            if size == 1:
+                text = template
+            elif size == 2:
+                value = data[i + 1]
+                if mode == REL:
+                    # Branches wrap within the bank the instruction is in
+                    target = (pc & 0xFF0000) | ((pc + 2 + (value - 256 if value & 0x80 else value)) & 0xFFFF)
+                    text = template.format(self._address(target, digits))
+                elif mode <= IMM_X:
+                    text = template.format(f"${value:02X}")
+                else:
+                    label = symbols.get(value)
+                    text = template.format(label if label is not None else f"${value:02X}")
+            elif size == 3:
+                value = data[i + 1] | (data[i + 2] << 8)
+                if mode == RELL:
+                    target = (pc & 0xFF0000) | ((pc + 3 + (value - 0x10000 if value & 0x8000 else value)) & 0xFFFF)
+                    text = template.format(self._address(target, digits))
+                elif mode == BM:
+                    # Operand bytes are destination bank, source bank; syntax is src,dst
+                    text = template.format(f"${data[i + 2]:02X}", f"${data[i + 1]:02X}")
+                elif mode <= IMM_X:
+                    text = template.format(f"${value:04X}")
+                else:
+                    label = symbols.get(value)
+                    text = template.format(label if label is not None else f"${value:04X}")
+            else:
+                value = data[i + 1] | (data[i + 2] << 8) | (data[i + 3] << 16)
+                label = symbols.get(value)
+                if label is None and not value >> 16:
+                    label = symbols.get(value & 0xFFFF)
+                text = template.format(label if label is not None else f"${value:06X}")
+
+            if is_65816 and (mode == IMM8 or mode == IMP):
+                before = (self.m16, self.x16)
+                self._track(name, data[i + 1] if size == 2 else 0)
+                if (self.m16, self.x16) != before:
+                    table = self._table()
+            yield pc, bytes(data[i:i + size]), text
+            i += size
+
+    def disassemble(self, data, origin=0, labels=True):
+        """
+        Listing lines like "C000  8D 20 D0     STA $D020". The address column
+        has no "$" so context_builder only annotates operands.
+        Instructions that carry a label get a "label:" line first.
+        """
+        digits = 6 if origin + len(data) > 0x10000 else 4
+        lines = []
+        symbols = self.symbols if labels else {}
+        for pc, raw, text in self.decode(data, origin):
+            label = symbols.get(pc)
+            if label is not None:
+                lines.append(f"{label}:")
+            lines.append(f"{pc:0{digits}X}  {raw.hex(' ').upper():<11}  {text}")
+        return lines
+
+def read_memory(fpga, start, length, reu_size=None):
+    """
+    Read CPU memory from the FPGA. C64 RAM (bank 0) has no host mapping:
+    it is copied out by REU DMA (reu_manager.copy_from_c64). Higher banks
+    (SuperRAM) are read through the debug bridge with FpgaInterface.peek.
+    """
+    from reu_manager import copy_from_c64, DEFAULT_REU_SIZE
+    data = bytearray()
+    end = start + length
+    if start < 0x10000:
+        part = copy_from_c64(fpga, start, min(end, 0x10000) - start, reu_size or DEFAULT_REU_SIZE)
+        if part is None:
+            raise IOError("REU DMA did not complete")
+        data += part
+    for address in range(max(start, 0x10000), end):
+        data.append(fpga.peek(address))
+    return data
+
+def disassemble_memory(fpga, start, length, cpu='6502', symbols=None, reu_size=None, **flags):
+    """Disassemble live C64 RAM or SuperRAM read from the FPGA"""
+    return Disassembler(cpu, symbols, **flags).disassemble(read_memory(fpga, start, length, reu_size), start)
+
+def benchmark(cpu='6502', size=0x10000, rounds=3):
+    """Instructions per second decoding `size` bytes of random code"""
+    rng = random.Random(6502)
+    data = bytes(rng.randrange(256) for _ in range(size))
+    best = None
+    count = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        count = sum(1 for _ in Disassembler(cpu).decode(data, 0x0000 if size <= 0x10000 else 0x010000))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count, best, count / best
+
+def main():
+    parser = argparse.ArgumentParser(description='6502/65816 Disassembler')
+    parser.add_argument('file', nargs='?', help='PRG file (first two bytes are the load address) or raw binary')
+    parser.add_argument('--raw', type=lambda v: int(v.lstrip('$'), 16), help='Treat file as raw data loaded at this hex address')
+    parser.add_argument('--cpu', choices=['6502', '65816'], default='6502')
+    parser.add_argument('--native', action='store_true', help='65816: start in native mode')
+    parser.add_argument('--m16', action='store_true', help='65816: 16-bit accumulator at start')
+    parser.add_argument('--x16', action='store_true', help='65816: 16-bit index registers at start')
+    parser.add_argument('--fpga', type=str, metavar='START:LENGTH', help='Read memory from the FPGA (hex), e.g. C000:1000')
+    parser.add_argument('--symbols', type=str, help='64tass label file')
+    parser.add_argument('--annotate', action='store_true', help='Add hardware register comments')
+    parser.add_argument('--bench', action='store_true', help='Report decoding speed in instructions/second')
+    args = parser.parse_args()
+
+    if args.bench:
+        for cpu in ('6502', '65816'):
+            count, elapsed, rate = benchmark(cpu)
+            print(f"{cpu:>6}: {count} instructions in {elapsed * 1000:.1f} ms = {rate / 1e6:.2f} M instructions/s")
+        return
+
+    symbols = None
+    if args.symbols:
+        from symbol_manager import SymbolManager
+        symbols = SymbolManager(args.symbols)
+    flags = {'m16': args.m16, 'x16': args.x16, 'emulation': not args.native}
+
+    if args.fpga:
+        sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'linux', 'services'))
+        from fpga_interface import FpgaInterface
+        from config_manager import ConfigManager
+        start, length = (int(v.lstrip('$'), 16) for v in args.fpga.split(':'))
+        fpga = FpgaInterface()
+        reu_size = int(ConfigManager().get('reu', {}).get('size_mb', 0.5) * 1024 * 1024)
+        lines = disassemble_memory(fpga, start, length, args.cpu, symbols, reu_size, **flags)
+        fpga.close()
+    elif args.file:
+        with open(args.file, 'rb') as f:
+            data = f.read()
+        if args.raw is not None:
+            origin = args.raw
+        else:
+            origin, data = data[0] | (data[1] << 8), data[2:]
+        lines = Disassembler(args.cpu, symbols, **flags).disassemble(data, origin)
+    else:
+        parser.print_help()
+        return
+
+    if args.annotate:
+        sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ai_service'))
+        from context_builder import enrich_disassembly
+        lines = enrich_disassembly(lines, 'SCPU' if args.cpu == '65816' else 'C64')
+    print("\n".join(lines))
+
+if __name__ == "__main__":
+    main()
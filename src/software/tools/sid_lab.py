@@ -19,14 +19,15 @@ class SIDLab:
                 return f.read()
         return "Generate C64 SID Music."
 
-    def compose_sfx(self, description: str) -> str:
+    def compose_sfx(self, description: str, use_cache: bool = True) -> str:
         """
         Generates a sound effect routine in Assembly.
+        Pass use_cache=False to force a fresh composition.
         """
         system_prompt = self._load_system_prompt()
         full_prompt = f"{system_prompt}\n\nUSER REQUEST: Create a sound effect for: {description}"
         
-        response = self.ai.generate_completion(full_prompt)
+        response = self.ai.generate_completion(full_prompt, use_cache=use_cache, lane='interactive')
         return response
 
     def save_sfx(self, asm_code: str, filename: str):
@@ -10,7 +10,7 @@ except ImportError:
     # Mock for standalone testing
     class AIService:
         def __init__(self, config): pass
-        def generate_completion(self, prompt, provider=None, model=None): return "['00', 'FF', '00']"
+        def generate_completion(self, prompt, provider=None, model=None, use_cache=True, lane=None): return "['00', 'FF', '00']"
 
 class SpriteStudio:
     def __init__(self, config_path='../ai_service/config.json'):
@@ -23,15 +23,16 @@ class SpriteStudio:
                 return f.read()
         return "Generate C64 Sprite Data."
 
-    def generate_sprite(self, description: str) -> list:
+    def generate_sprite(self, description: str, use_cache: bool = True) -> list:
         """
         Asks the AI to generate a sprite based on the description.
         Returns a list of 63 integers (bytes).
+        Pass use_cache=False to force a fresh generation.
         """
         system_prompt = self._load_system_prompt()
         full_prompt = f"{system_prompt}\n\nUSER REQUEST: {description}"
         
-        response = self.ai.generate_completion(full_prompt)
+        response = self.ai.generate_completion(full_prompt, use_cache=use_cache, lane='interactive')
         
         # Parse the response (expecting a JSON-like list of hex strings)
         try: